@@ -56,6 +56,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'django_filters',
     'bcmr_main',
+    'cts'
 ]
 
 MIDDLEWARE = [
@@ -162,6 +163,36 @@ REDIS_HOST = config('REDIS_HOST', default='localhost')
 REDIS_USER = config('REDIS_USER', default='')
 REDIS_PASSWORD = config('REDIS_PASSWORD', default='')
 REDIS_PORT = config('REDIS_PORT', default=6379)
+# timeouts (in seconds) and pool size of the shared REDISKV client, see bcmr_main.cache
+REDIS_SOCKET_TIMEOUT = config('REDIS_SOCKET_TIMEOUT', default=1, cast=float)
+REDIS_SOCKET_CONNECT_TIMEOUT = config('REDIS_SOCKET_CONNECT_TIMEOUT', default=1, cast=float)
+REDIS_MAX_CONNECTIONS = config('REDIS_MAX_CONNECTIONS', default=50, cast=int)
+# in-process tier of the response cache: total size in bytes (0 disables it) and
+# the longest an entry is kept without hearing about invalidations
+CACHE_LOCAL_MAX_SIZE = config('CACHE_LOCAL_MAX_SIZE', default=64 * 1024 * 1024, cast=int)
+CACHE_LOCAL_TTL = config('CACHE_LOCAL_TTL', default=60, cast=int)
+# cached cts metadata is served stale and refreshed in the background after this many seconds
+CACHE_REFRESH_INTERVAL = config('CACHE_REFRESH_INTERVAL', default=60 * 5, cast=int)
+# cached responses live until invalidated or until the next identity snapshot of their
+# category activates, with this ceiling
+CACHE_TTL = config('CACHE_TTL', default=60 * 60 * 24 * 7, cast=int)
+# responses (all their variants together) larger than this many bytes are not admitted to
+# Redis, and the ones at least CACHE_SHARED_MIN_SIZE bytes are stored once by content hash
+# with per-category pointers, see ResponseCache
+CACHE_MAX_ENTRY_SIZE = config('CACHE_MAX_ENTRY_SIZE', default=8 * 1024 * 1024, cast=int)
+CACHE_SHARED_MIN_SIZE = config('CACHE_SHARED_MIN_SIZE', default=64 * 1024, cast=int)
+# Bloom filters of known categories (size in bits and number of hashes, about 0.1% false
+# positives at a million categories) and how long a failed lookup is remembered
+BLOOM_FILTER_SIZE = config('BLOOM_FILTER_SIZE', default=2 ** 24, cast=int)
+BLOOM_FILTER_HASHES = config('BLOOM_FILTER_HASHES', default=7, cast=int)
+NEGATIVE_CACHE_TTL = config('NEGATIVE_CACHE_TTL', default=60, cast=int)
+# most tokens looked up by one request to /api/tokens/batch/
+METADATA_BATCH_MAX_SIZE = config('METADATA_BATCH_MAX_SIZE', default=200, cast=int)
+# run the registry content queries as server-side prepared statements (bcmr_main.queries),
+# turn off behind a connection pooler that does not keep sessions
+DATABASE_PREPARED_STATEMENTS = config('DATABASE_PREPARED_STATEMENTS', default=True, cast=bool)
+# fraction of those queries whose planning and execution time is logged
+QUERY_PLANNING_SAMPLE_RATE = config('QUERY_PLANNING_SAMPLE_RATE', default=0.01, cast=float)
 
 CELERY_IMPORTS = ('bcmr_main.tasks', )
 
@@ -180,7 +211,11 @@ if DEPLOYMENT_INSTANCE in ['prod', 'staging']:
         username=REDIS_USER,
         password=REDIS_PASSWORD,
         port=6379,
-        db=DB_NUMS[3]
+        db=DB_NUMS[3],
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        health_check_interval=30
     )
 else:
     # dev / testing
@@ -192,7 +227,11 @@ else:
     REDISKV = redis.StrictRedis(
         host=REDIS_HOST,
         port=6379,
-        db=3
+        db=3,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        health_check_interval=30
     )
 
 CELERY_TASK_ACKS_LATE = True
@@ -207,6 +246,38 @@ CELERY_BEAT_SCHEDULE = {
 }
 
 
+# Watched registries are polled adaptively: changed registries every
+# WATCH_REGISTRY_MIN_INTERVAL seconds, quiet ones backing off up to
+# WATCH_REGISTRY_MAX_INTERVAL and failing hosts up to WATCH_REGISTRY_FAILURE_MAX_INTERVAL.
+WATCH_REGISTRY_MIN_INTERVAL = config('WATCH_REGISTRY_MIN_INTERVAL', default=20, cast=int)
+WATCH_REGISTRY_MAX_INTERVAL = config('WATCH_REGISTRY_MAX_INTERVAL', default=60 * 60, cast=int)
+WATCH_REGISTRY_FAILURE_MAX_INTERVAL = config('WATCH_REGISTRY_FAILURE_MAX_INTERVAL', default=60 * 60 * 6, cast=int)
+WATCH_REGISTRY_BACKOFF_FACTOR = 2
+WATCH_REGISTRY_BATCH_SIZE = config('WATCH_REGISTRY_BATCH_SIZE', default=50, cast=int)
+WATCH_REGISTRY_LEASE = 60 * 5
+
+
+# Token changes mark their category dirty; metadata is regenerated once the category has
+# been quiet for METADATA_REGENERATION_QUIET_WINDOW seconds, and at the latest
+# METADATA_REGENERATION_MAX_DELAY seconds after it was first marked.
+METADATA_REGENERATION_QUIET_WINDOW = config('METADATA_REGENERATION_QUIET_WINDOW', default=10, cast=int)
+METADATA_REGENERATION_MAX_DELAY = config('METADATA_REGENERATION_MAX_DELAY', default=60, cast=int)
+
+
+# Largest BCMR file that will be downloaded, in bytes
+BCMR_MAX_DOWNLOAD_SIZE = config('BCMR_MAX_DOWNLOAD_SIZE', default=25 * 1024 * 1024, cast=int)
+
+# Number of BCMR schema validation results memoized per process
+BCMR_VALIDATION_CACHE_SIZE = config('BCMR_VALIDATION_CACHE_SIZE', default=1024, cast=int)
+
+# Circuit breaker for BCMR publisher hosts
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = config('CIRCUIT_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+CIRCUIT_BREAKER_FAILURE_WINDOW = 60 * 10
+CIRCUIT_BREAKER_COOLDOWN = config('CIRCUIT_BREAKER_COOLDOWN', default=60, cast=int)
+CIRCUIT_BREAKER_MAX_COOLDOWN = 60 * 60 * 6
+CIRCUIT_BREAKER_PROBE_TIMEOUT = 60
+
+
 # Logging settings
 
 LOGGING = {
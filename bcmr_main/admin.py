@@ -1,7 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from bcmr_main.metadata import generate_token_metadata
 from bcmr_main.op_return import process_op_return
 from bcmr_main.models import *
+from bcmr_main.circuit_breaker import CircuitBreaker, get_circuit_breaker, get_statuses
+from redis.exceptions import RedisError
 
 
 admin.site.site_header = 'Paytaca BCMR Admin'
@@ -81,6 +83,14 @@ def _generate_token_metadata(modeladmin, request, queryset):
 
 _generate_token_metadata.short_description = "Generate token metadata"
 
+def _reset_circuit_breaker(modeladmin, request, queryset):
+    for registry in queryset:
+        breaker = get_circuit_breaker(registry.bcmr_url)
+        if breaker:
+            breaker.record_success()
+
+_reset_circuit_breaker.short_description = "Reset circuit breaker of BCMR host"
+
 
 class RegistryAdmin(admin.ModelAdmin):
 
@@ -95,16 +105,79 @@ class RegistryAdmin(admin.ModelAdmin):
         'valid',
         'allow_hash_mismatch',
         'watch_for_changes',
+        'watch_next_check',
+        'host_health',
         'date_created',
     ]
 
     raw_id_fields = [
-        'publisher'
+        'publisher',
+        'blob'
     ]
 
     actions = [
         _process_op_return,
-        _generate_token_metadata
+        _generate_token_metadata,
+        _reset_circuit_breaker
+    ]
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # the health of all the hosts on the page, in one round trip
+        breakers = {}
+        for registry in changelist.result_list:
+            breaker = get_circuit_breaker(registry.bcmr_url)
+            if breaker:
+                registry.host = breaker.host
+                breakers.setdefault(breaker.host, breaker)
+        try:
+            statuses = {health['host']: health for health in get_statuses(list(breakers.values()))}
+        except RedisError:
+            statuses = {}
+        for registry in changelist.result_list:
+            if hasattr(registry, 'host'):
+                registry.host_status = statuses.get(registry.host)
+        return changelist
+
+    def host_health(self, obj):
+        if not hasattr(obj, 'host_status'):
+            return None
+        health = obj.host_status
+        if not health:
+            return 'unknown'
+        if health['status'] == CircuitBreaker.CLOSED:
+            return health['status']
+        return f"{health['status']} ({health['failures']} failures, {health['trips']} trips)"
+
+
+def _verify_blob(modeladmin, request, queryset):
+    for blob in queryset:
+        if blob.verify():
+            modeladmin.message_user(request, f'{blob.sha256}: hash verified')
+        else:
+            modeladmin.message_user(request, f'{blob.sha256}: hash could not be verified', level=messages.WARNING)
+
+_verify_blob.short_description = "Verify content hash"
+
+
+class RegistryBlobAdmin(admin.ModelAdmin):
+
+    search_fields = [
+        'sha256'
+    ]
+
+    list_display = [
+        'sha256',
+        'size',
+        'date_created'
+    ]
+
+    exclude = [
+        'raw'
+    ]
+
+    actions = [
+        _verify_blob
     ]
 
 
@@ -161,5 +234,6 @@ class BlockScanAdmin(admin.ModelAdmin):
 admin.site.register(Token, TokenAdmin)
 admin.site.register(TokenMetadata, TokenMetadataAdmin)
 admin.site.register(Registry, RegistryAdmin)
+admin.site.register(RegistryBlob, RegistryBlobAdmin)
 admin.site.register(IdentityOutput, IdentityOutputAdmin)
 admin.site.register(BlockScan, BlockScanAdmin)
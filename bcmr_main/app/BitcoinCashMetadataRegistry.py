@@ -1,8 +1,64 @@
 
 import json
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Dict
-from jsonschema import validate
+from jsonschema.exceptions import ValidationError, best_match
+from jsonschema.validators import validator_for
 from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def get_schema_validator():
+  """
+  Loads and compiles the BCMR schema once per process
+  """
+  with open(f'{settings.BASE_DIR}/bcmr_main/app/bcmr-schema-v2.json', 'r') as bcmr_schema_file:
+    bcmr_schema = json.load(bcmr_schema_file)
+  validator_class = validator_for(bcmr_schema)
+  validator_class.check_schema(bcmr_schema)
+  return validator_class(bcmr_schema)
+
+
+class ValidationResults:
+  """
+  Size-bounded memo of schema validation results keyed by content sha256.
+  Each maps to a (valid, message) pair rather than the ValidationError itself,
+  which would keep the whole document and its schema path alive.
+  """
+
+  def __init__(self, max_size):
+    self.max_size = max_size
+    self._results = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, sha256):
+    """
+    Returns the (valid, message) pair of a document, or None if it was not validated yet
+    """
+    with self._lock:
+      if sha256 not in self._results:
+        return None
+      self._results.move_to_end(sha256)
+      return self._results[sha256]
+
+  def set(self, sha256, valid, message=None):
+    with self._lock:
+      self._results[sha256] = (valid, message)
+      self._results.move_to_end(sha256)
+      while len(self._results) > self.max_size:
+        self._results.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._results.clear()
+
+
+validation_results = ValidationResults(settings.BCMR_VALIDATION_CACHE_SIZE)
+
+
 class BitcoinCashMetadataRegistry:
   def __init__(self, contents:Dict) -> None:
     self.contents = contents
@@ -67,11 +123,28 @@ class BitcoinCashMetadataRegistry:
     BitcoinCashMetadataRegistry.validate_contents(self.contents)
 
   @staticmethod
-  def validate_contents(contents):
-    
-    with open(f'{settings.BASE_DIR}/bcmr_main/app/bcmr-schema-v2.json', 'r') as bcmr_schema_file:
-      bcmr_schema = json.load(bcmr_schema_file)
-      validate(instance=json.loads(contents) if type(contents) == str else contents, schema=bcmr_schema)
+  def validate_contents(contents, sha256=None):
+    """
+    Validates the contents against the BCMR schema, raises ValidationError if invalid.
+    Results are memoized by the sha256 of the document, computed if not given.
+    """
+    if type(contents) == str:
+      sha256 = sha256 or hashlib.sha256(contents.encode()).hexdigest()
+    elif not sha256:
+      canonical = json.dumps(contents, sort_keys=True, separators=(',', ':'))
+      sha256 = hashlib.sha256(canonical.encode()).hexdigest()
+
+    result = validation_results.get(sha256)
+    if result is None:
+      instance = json.loads(contents) if type(contents) == str else contents
+      error = best_match(get_schema_validator().iter_errors(instance))
+      result = (error is None, error.message if error is not None else None)
+      validation_results.set(sha256, *result)
+
+    valid, message = result
+    if not valid:
+      # a new error on every call, raising a shared one would chain the tracebacks
+      raise ValidationError(message)
 
   @staticmethod
   def get_token_categories(contents):
@@ -0,0 +1,168 @@
+from django.conf import settings
+from redis.exceptions import RedisError
+from bcmr_main.cache import get_client
+import hashlib
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# categories with at least one Token
+TOKEN_CATEGORIES = 'tokens'
+# authbases and token categories covered by a registry
+REGISTRY_CATEGORIES = 'registries'
+# a rebuild that made no progress for this long is considered dead, see BloomFilter.rebuild()
+REBUILD_TIMEOUT = 10 * 60
+
+
+class RebuildInterrupted(Exception):
+    pass
+
+
+class BloomFilter:
+    """
+    Redis bitmap Bloom filter of categories.
+
+    might_contain() answers False only for categories that were never added, so a False
+    lets lookups of unknown categories skip Postgres altogether. Until the filter has
+    been built with the rebuild_bloom_filters command it is not consulted.
+    """
+
+    def __init__(self, name, client=None):
+        self.name = name
+        self.client = client or get_client()
+        self.key = f'bloom:{name}'
+        self.ready_key = f'bloom:{name}:ready'
+        self.rebuild_key = f'bloom:{name}:rebuild'
+        self.size = settings.BLOOM_FILTER_SIZE
+        self.hashes = settings.BLOOM_FILTER_HASHES
+
+    def _offsets(self, item):
+        # double hashing, k offsets out of a single digest
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def _set_bits(self, pipe, key, items):
+        for item in items:
+            for offset in self._offsets(item):
+                pipe.setbit(key, offset, 1)
+
+    def add(self, items):
+        items = [item for item in items if item]
+        if not items:
+            return
+        def set_bits(pipe):
+            keys = [self.key]
+            # an add during a rebuild must also land in the filter being built
+            if pipe.exists(self.rebuild_key):
+                keys.append(f'{self.key}:building')
+            pipe.multi()
+            for key in keys:
+                self._set_bits(pipe, key, items)
+
+        try:
+            # retried if a rebuild starts or swaps its filter in between the check and the writes
+            self.client.transaction(set_bits, self.rebuild_key)
+        except RedisError:
+            LOGGER.error(f'Unable to add {len(items)} categories to the {self.name} Bloom filter')
+
+    def might_contain(self, item):
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.exists(self.ready_key)
+            for offset in self._offsets(item):
+                pipe.getbit(self.key, offset)
+            ready, *bits = pipe.execute()
+        except RedisError:
+            return True
+        return not ready or all(bits)
+
+    def rebuild(self, items, batch_size=1000):
+        """
+        Builds the filter from scratch out of an iterable of categories and swaps it in.
+
+        Categories added in the meantime are written to both filters. The rebuild flag
+        that tells add() to do so is kept alive by every batch, and expires REBUILD_TIMEOUT
+        seconds after the last one if the rebuild dies. Raises RebuildInterrupted instead
+        of swapping in a filter if the flag expired while it was being built.
+        """
+        building_key = f'{self.key}:building'
+        self.client.delete(building_key)
+        self.client.set(self.rebuild_key, 1, ex=REBUILD_TIMEOUT)
+
+        def write(batch):
+            pipe = self.client.pipeline(transaction=False)
+            self._set_bits(pipe, building_key, batch)
+            pipe.expire(self.rebuild_key, REBUILD_TIMEOUT)
+            pipe.execute()
+
+        count = 0
+        batch = []
+        for item in items:
+            if not item:
+                continue
+            batch.append(item)
+            if len(batch) >= batch_size:
+                write(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            write(batch)
+            count += len(batch)
+
+        def swap(pipe):
+            # adds stopped writing to the filter being built once the flag expired
+            if not pipe.exists(self.rebuild_key):
+                raise RebuildInterrupted(f'The rebuild of the {self.name} Bloom filter timed out')
+            pipe.multi()
+            # an empty filter has no bitmap to rename
+            pipe.setbit(building_key, self.size - 1, 0)
+            pipe.rename(building_key, self.key)
+            pipe.set(self.ready_key, 1)
+            pipe.delete(self.rebuild_key)
+
+        self.client.transaction(swap, self.rebuild_key)
+        return count
+
+
+def is_known_missing(name, category):
+    """
+    Returns True if the category is certainly missing: the Bloom filter never saw it or a
+    lookup found nothing less than NEGATIVE_CACHE_TTL seconds ago
+    """
+    if not category:
+        return True
+    bloom = BloomFilter(name)
+    try:
+        # filter and negative cache in one round trip
+        pipe = bloom.client.pipeline(transaction=False)
+        pipe.exists(f'missing:{name}:{category}')
+        pipe.exists(bloom.ready_key)
+        for offset in bloom._offsets(category):
+            pipe.getbit(bloom.key, offset)
+        negative, ready, *bits = pipe.execute()
+    except RedisError:
+        return False
+    return bool(negative) or bool(ready and not all(bits))
+
+
+def remember_missing(name, category):
+    try:
+        get_client().set(f'missing:{name}:{category}', 1, ex=settings.NEGATIVE_CACHE_TTL)
+    except RedisError:
+        pass
+
+
+def add_known(name, categories):
+    """
+    Records newly ingested categories, and drops their negative cache entries
+    """
+    categories = [category for category in categories if category]
+    if not categories:
+        return
+    BloomFilter(name).add(categories)
+    try:
+        get_client().delete(*[f'missing:{name}:{category}' for category in categories])
+    except RedisError:
+        pass
@@ -0,0 +1,595 @@
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+from bcmr_main.etags import get_etag
+from collections import OrderedDict
+import threading
+import re
+import hashlib
+import json
+import time
+import math
+import os
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+# bumping a version moves every cache key built from it to a fresh namespace,
+# the stale entries are never read again and expire on their own
+GLOBAL_VERSION_KEY = 'cacheversion'
+CATEGORY_VERSION_KEY = 'cacheversion:{category}'
+# invalidations are broadcast here so that every process can drop its local copies
+INVALIDATION_CHANNEL = 'cacheversion:invalidated'
+# unix timestamp at which the next identity snapshot of a category becomes active
+ACTIVATION_KEY = 'cacheactivation:{category}'
+
+# <prefix>:<category>:v<global>.<category>[:<parts>], see get_cache_key()
+VERSIONED_KEY_PATTERN = re.compile(r'^(.+?):[^:]+:v\d+\.\d+(?::(.*))?$')
+# keys that live next to a cached value, by their last part
+KEY_SUFFIXES = ('fresh', 'ref', 'etag', 'gzip', 'br')
+# large response bodies by content hash, shared by the cache keys of every category they
+# are the response of, see ResponseCache
+SHARED_BODY_KEY = 'sharedbody:{digest}:{encoding}'
+
+_pending = threading.local()
+
+
+def get_client():
+    """
+    Returns the shared, pooled Redis client (settings.REDISKV).
+    Its socket timeouts keep a slow or unreachable Redis from stalling requests.
+    """
+    return settings.REDISKV
+
+
+def get_cache_key(prefix, category, *parts, client=None):
+    """
+    Returns the versioned cache key of a category, e.g.
+    get_cache_key('metadata:token', category, type_key) -> 'metadata:token:<category>:v0.3:<type_key>'
+    or None if Redis is unavailable.
+    """
+    client = client or get_client()
+    try:
+        global_version, category_version = client.mget(
+            GLOBAL_VERSION_KEY,
+            CATEGORY_VERSION_KEY.format(category=category)
+        )
+    except RedisError:
+        LOGGER.warning(f'Unable to read cache version of {category}')
+        return None
+    version = f'v{int(global_version or 0)}.{int(category_version or 0)}'
+    return ':'.join([prefix, category, version, *parts])
+
+
+def get_cache_keys(prefix, items, client=None):
+    """
+    get_cache_key() of many (category, *parts) tuples, with a single MGET of their versions.
+    The keys are all None if Redis is unavailable.
+    """
+    client = client or get_client()
+    categories = sorted({category for category, *_ in items})
+    if not categories:
+        return []
+    try:
+        global_version, *category_versions = client.mget(
+            GLOBAL_VERSION_KEY,
+            *[CATEGORY_VERSION_KEY.format(category=category) for category in categories]
+        )
+    except RedisError:
+        LOGGER.warning(f'Unable to read cache version of {len(categories)} categories')
+        return [None] * len(items)
+    versions = {
+        category: f'v{int(global_version or 0)}.{int(category_version or 0)}'
+        for category, category_version in zip(categories, category_versions)
+    }
+    return [':'.join([prefix, category, versions[category], *parts]) for category, *parts in items]
+
+
+def get_key_family(key):
+    """
+    Returns the family of a cache key for memory reports, e.g.
+    'registry:token:<category>:v0.3:gzip' -> 'registry:token:*:gzip'
+    """
+    match = VERSIONED_KEY_PATTERN.match(key)
+    if not match:
+        return key.split(':')[0]
+    prefix, parts = match.groups()
+    suffix = parts.rsplit(':', 1)[-1] if parts else ''
+    if suffix in KEY_SUFFIXES:
+        return f'{prefix}:*:{suffix}'
+    return f'{prefix}:*'
+
+
+def get_body(key):
+    """
+    Returns the cached bytes of the key, or None on a miss or if Redis is unavailable
+    """
+    if not key:
+        return None
+    try:
+        return get_client().get(key)
+    except RedisError:
+        LOGGER.warning(f'Unable to read {key} from cache')
+        return None
+
+
+def get_json(key):
+    """
+    Returns the decoded cached value of the key, or None on a miss or if Redis is unavailable
+    """
+    value = get_body(key)
+    if value is None:
+        return None
+    return json.loads(value)
+
+
+def get_many_bodies(keys):
+    """
+    Returns the cached bytes of the keys in one round trip, with None for misses.
+    All values are None if Redis is unavailable.
+    """
+    keys = list(keys)
+    values = [None] * len(keys)
+    lookup = [key for key in keys if key]
+    if not lookup:
+        return values
+    try:
+        found = dict(zip(lookup, get_client().mget(lookup)))
+    except RedisError:
+        LOGGER.warning(f'Unable to read {len(lookup)} keys from cache')
+        return values
+    return [found.get(key) if key else None for key in keys]
+
+
+def get_many_json(keys):
+    """
+    Returns the decoded cached values of the keys in one round trip,
+    with None for misses. All values are None if Redis is unavailable.
+    """
+    return [json.loads(value) if value is not None else None for value in get_many_bodies(keys)]
+
+
+def set_body(key, body, ex, stale_after=None):
+    """
+    Caches the bytes for ex seconds. With stale_after, the value is considered stale
+    after that many seconds and the first claim_refresh() call then wins its refresh.
+    """
+    if not key:
+        return
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        pipe.set(key, body, ex=ex)
+        if stale_after:
+            pipe.set(f'{key}:fresh', 1, ex=stale_after)
+        pipe.execute()
+    except RedisError:
+        LOGGER.warning(f'Unable to write {key} to cache')
+
+
+def set_json(key, value, ex, stale_after=None):
+    set_body(key, json.dumps(value), ex, stale_after=stale_after)
+
+
+def claim_refresh(key, stale_after=None):
+    """
+    Returns True if the cached value of the key is stale and the caller is the one that
+    should refresh it. The freshness marker doubles as the lock, so at most one refresh
+    is triggered per key every stale_after (CACHE_REFRESH_INTERVAL) seconds while the
+    stale value keeps being served.
+    """
+    if not key:
+        return False
+    try:
+        return bool(get_client().set(
+            f'{key}:fresh',
+            1,
+            nx=True,
+            ex=stale_after or settings.CACHE_REFRESH_INTERVAL
+        ))
+    except RedisError:
+        return False
+
+
+def claim_many_refreshes(keys, stale_after=None):
+    """
+    claim_refresh() of many keys in one round trip, returns the keys the caller should refresh
+    """
+    keys = [key for key in keys if key]
+    if not keys:
+        return []
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        for key in keys:
+            pipe.set(f'{key}:fresh', 1, nx=True, ex=stale_after or settings.CACHE_REFRESH_INTERVAL)
+        claimed = pipe.execute()
+    except RedisError:
+        return []
+    return [key for key, won in zip(keys, claimed) if won]
+
+
+def set_many_bodies(items, ex, stale_after=None):
+    """
+    Writes a dict of key -> bytes with a single pipeline, for ex seconds or
+    a dict of key -> seconds. See set_body() for stale_after.
+    """
+    items = {key: body for key, body in items.items() if key}
+    if not items:
+        return
+    try:
+        pipe = get_client().pipeline(transaction=False)
+        for key, body in items.items():
+            pipe.set(key, body, ex=ex[key] if isinstance(ex, dict) else ex)
+            if stale_after:
+                pipe.set(f'{key}:fresh', 1, ex=stale_after)
+        pipe.execute()
+    except RedisError:
+        LOGGER.warning(f'Unable to write {len(items)} keys to cache')
+
+
+def set_many_json(items, ex, stale_after=None):
+    """
+    Writes a dict of key -> value with a single pipeline
+    """
+    set_many_bodies({key: json.dumps(value) for key, value in items.items()}, ex, stale_after=stale_after)
+
+
+def get_cache_ttl(category, ttl=None):
+    """
+    Returns for how many seconds a cached response of the category may live: at most ttl
+    (CACHE_TTL), and no longer than until the next identity snapshot of the category
+    becomes active, see set_next_activation()
+    """
+    ttl = ttl or settings.CACHE_TTL
+    try:
+        activation = get_client().get(ACTIVATION_KEY.format(category=category))
+    except RedisError:
+        return settings.CACHE_REFRESH_INTERVAL
+    if activation is None:
+        return ttl
+    return max(1, min(ttl, math.ceil(float(activation) - time.time())))
+
+
+def get_cache_ttls(categories, ttl=None):
+    """
+    get_cache_ttl() of many categories in one round trip, as a dict of category -> seconds
+    """
+    ttl = ttl or settings.CACHE_TTL
+    categories = list(categories)
+    if not categories:
+        return {}
+    try:
+        activations = get_client().mget(*[ACTIVATION_KEY.format(category=category) for category in categories])
+    except RedisError:
+        return {category: settings.CACHE_REFRESH_INTERVAL for category in categories}
+    now = time.time()
+    return {
+        category: ttl if activation is None else max(1, min(ttl, math.ceil(float(activation) - now)))
+        for category, activation in zip(categories, activations)
+    }
+
+
+def set_next_activation(category, timestamp, client=None):
+    """
+    Records when the next identity snapshot of the category becomes active,
+    the record itself expires at that moment
+    """
+    client = client or get_client()
+    remaining = math.ceil(timestamp - time.time())
+    if remaining > 0:
+        client.set(ACTIVATION_KEY.format(category=category), timestamp, ex=remaining)
+
+
+def invalidate_categories(categories, client=None):
+    categories = set(filter(None, categories))
+    if not categories:
+        return
+
+    client = client or get_client()
+    pipe = client.pipeline(transaction=False)
+    for category in categories:
+        pipe.incr(CATEGORY_VERSION_KEY.format(category=category))
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps(sorted(categories)))
+    pipe.execute()
+    LOGGER.info(f'Invalidated cache of {len(categories)} categories')
+
+
+def invalidate_all(client=None):
+    client = client or get_client()
+    pipe = client.pipeline(transaction=False)
+    pipe.incr(GLOBAL_VERSION_KEY)
+    pipe.publish(INVALIDATION_CHANNEL, json.dumps('*'))
+    pipe.execute()
+
+
+def _flush_pending_invalidations():
+    categories = getattr(_pending, 'categories', set())
+    _pending.categories = set()
+    try:
+        invalidate_categories(categories)
+    except RedisError:
+        LOGGER.error(f'Unable to invalidate cache of {len(categories)} categories')
+
+
+def invalidate_categories_on_commit(categories):
+    """
+    Collects the categories touched during the current transaction and
+    invalidates all of them at once after it commits.
+    Outside of a transaction the invalidation happens right away.
+    """
+    if not hasattr(_pending, 'categories'):
+        _pending.categories = set()
+    _pending.categories.update(filter(None, categories))
+    # callbacks of a rolled back transaction are dropped, so one is registered on every
+    # call; the first one to run flushes everything collected so far
+    transaction.on_commit(_flush_pending_invalidations)
+
+
+class LocalCache:
+    """
+    Size-bounded, in-process LRU of response bodies in front of Redis.
+
+    Entries are dropped when an invalidation is broadcast on INVALIDATION_CHANNEL, which
+    a daemon thread of each process listens to. While that subscription is down nothing
+    is served from or stored in the local tier, and CACHE_LOCAL_TTL bounds how long an
+    entry can live regardless.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        # bumped on every invalidation, see get_epoch()
+        self.epoch = 0
+        self.connected = False
+        self.listener = None
+        self.pid = None
+
+    @property
+    def enabled(self):
+        return (self.max_size or settings.CACHE_LOCAL_MAX_SIZE) > 0
+
+    def _ensure_listener(self):
+        # the listener thread does not survive a fork, e.g. of gunicorn workers
+        if self.pid == os.getpid() and self.listener and self.listener.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.listener and self.listener.is_alive():
+                return
+            self.pid = os.getpid()
+            self.connected = False
+            self._clear()
+            self.listener = threading.Thread(target=self._listen, name='cache-invalidation', daemon=True)
+            self.listener.start()
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.connected = True
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        categories = json.loads(message['data'])
+                        self.invalidate(None if categories == '*' else categories)
+            except (RedisError, ValueError) as exc:
+                LOGGER.warning(f'Cache invalidation listener disconnected: {exc}')
+            finally:
+                # invalidations may have been missed
+                self.connected = False
+                self.invalidate()
+                if pubsub:
+                    try:
+                        pubsub.close()
+                    except RedisError:
+                        pass
+            time.sleep(1)
+
+    def _clear(self):
+        self.entries.clear()
+        self.size = 0
+        self.epoch += 1
+
+    def _pop(self, key):
+        _, body, _ = self.entries.pop(key)
+        self.size -= len(body)
+
+    def get_epoch(self):
+        """
+        Returns a token to pass to set(); a value read from Redis before an
+        invalidation must not be stored locally after it.
+        """
+        return self.epoch
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        self._ensure_listener()
+        if not self.connected:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            _, body, expires = entry
+            if expires < time.monotonic():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return body
+
+    def set(self, key, category, body, epoch):
+        max_size = self.max_size or settings.CACHE_LOCAL_MAX_SIZE
+        # a single huge document would evict everything else
+        if not self.connected or len(body) > max_size // 4:
+            return
+        ttl = self.ttl or settings.CACHE_LOCAL_TTL
+        with self.lock:
+            if epoch != self.epoch:
+                return
+            if key in self.entries:
+                self._pop(key)
+            self.entries[key] = (category, body, time.monotonic() + ttl)
+            self.size += len(body)
+            while self.size > max_size:
+                self._pop(next(iter(self.entries)))
+
+    def invalidate(self, categories=None):
+        with self.lock:
+            if categories is None:
+                self._clear()
+                return
+            categories = set(categories)
+            stale = [key for key, entry in self.entries.items() if entry[0] in categories]
+            for key in stale:
+                self._pop(key)
+            self.epoch += 1
+
+
+local_cache = LocalCache()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of ready-to-send response bodies: the in-process LRU first,
+    then the versioned Redis key.
+
+    cached = ResponseCache('registry:token', category)
+    body = cached.get()
+    if body is None:
+        body = json.dumps(...).encode()
+        cached.set(body, ex=...)
+
+    Bodies can be stored with compressed variants (see bcmr_main.compression), kept under
+    '<key>:<coding>' next to the raw bytes. get_encoded() then returns the variant the client
+    accepts, and the raw bytes to the others, so that e.g. a client without br support
+    still hits the cache when the gzip variant was not worth storing.
+
+    The ETag of the body (see bcmr_main.etags) is kept under '<key>:etag' and read in the same
+    round trip, so every response of an entry has the ETag it was stored with, e.g. that of
+    its materialized document. It is set on the instance by get() and get_encoded().
+
+    Bodies of CACHE_SHARED_MIN_SIZE bytes or more, e.g. a collection registry that is the
+    response of each of its categories, are stored once under their content hash and the
+    versioned key only points to it with '<key>:ref'. Bodies over CACHE_MAX_ENTRY_SIZE
+    are not cached in Redis at all.
+    """
+
+    def __init__(self, prefix, category, *parts):
+        self.prefix = prefix
+        self.category = category
+        self.parts = parts
+        self.local_key = ':'.join([prefix, category, *parts])
+        self.key = None
+        self.epoch = None
+        self.etag = None
+
+    def _local_key(self, encoding):
+        return self.local_key if encoding == 'identity' else f'{self.local_key}:{encoding}'
+
+    def _set_etag(self, etag):
+        self.etag = etag.decode() if isinstance(etag, bytes) else etag
+
+    def _redis_key(self, encoding):
+        return self.key if encoding == 'identity' else f'{self.key}:{encoding}'
+
+    def get(self):
+        body, _ = self.get_encoded(['identity'])
+        return body
+
+    def get_encoded(self, encodings):
+        """
+        Returns (body, content coding) of the first of the encodings that is cached,
+        or (None, None) on a miss
+        """
+        self.etag = None
+        for encoding in encodings:
+            body = local_cache.get(self._local_key(encoding))
+            if body is not None:
+                etag = local_cache.get(f'{self.local_key}:etag')
+                # evicted apart from the body, read both from Redis again
+                if etag is None:
+                    break
+                self._set_etag(etag)
+                return body, encoding
+
+        self.epoch = local_cache.get_epoch()
+        self.key = get_cache_key(self.prefix, self.category, *self.parts)
+        if not self.key:
+            return None, None
+        try:
+            client = get_client()
+            *bodies, digest, etag = client.mget(
+                [self._redis_key(encoding) for encoding in encodings] + [f'{self.key}:ref', f'{self.key}:etag']
+            )
+            if digest is not None and not any(body is not None for body in bodies):
+                bodies = client.mget([
+                    SHARED_BODY_KEY.format(digest=digest.decode(), encoding=encoding) for encoding in encodings
+                ])
+        except RedisError:
+            LOGGER.warning(f'Unable to read {self.key} from cache')
+            return None, None
+        for encoding, body in zip(encodings, bodies):
+            if body is not None:
+                if etag is not None:
+                    local_cache.set(f'{self.local_key}:etag', self.category, etag, self.epoch)
+                local_cache.set(self._local_key(encoding), self.category, body, self.epoch)
+                self._set_etag(etag)
+                return body, encoding
+        return None, None
+
+    def set(self, body, ex, variants=None, etag=None):
+        """
+        Caches the body, along with its variants (a dict of content coding -> bytes) if it has any,
+        and its ETag, that of the body bytes unless given
+        """
+        if not self.key:
+            return
+        self.etag = etag or get_etag(body)
+        variants = {'identity': body, **(variants or {})}
+        size = sum(len(variant) for variant in variants.values())
+        if size > settings.CACHE_MAX_ENTRY_SIZE:
+            LOGGER.info(f'Not caching {self.key}, {size} bytes')
+            return
+        try:
+            client = get_client()
+            if size >= settings.CACHE_SHARED_MIN_SIZE:
+                self._set_shared(client, body, ex, variants)
+            else:
+                # a reader never gets the body of one write with the ETag of another
+                pipe = client.pipeline()
+                for encoding, variant in variants.items():
+                    pipe.set(self._redis_key(encoding), variant, ex=ex)
+                pipe.set(f'{self.key}:etag', self.etag, ex=ex)
+                pipe.execute()
+        except RedisError:
+            LOGGER.warning(f'Unable to write {self.key} to cache')
+            return
+        local_cache.set(f'{self.local_key}:etag', self.category, self.etag.encode(), self.epoch)
+        for encoding, variant in variants.items():
+            local_cache.set(self._local_key(encoding), self.category, variant, self.epoch)
+
+    def _set_shared(self, client, body, ex, variants):
+        digest = hashlib.sha256(body).hexdigest()
+        shared_keys = {
+            encoding: SHARED_BODY_KEY.format(digest=digest, encoding=encoding) for encoding in variants
+        }
+        # a body already stored for another category is not sent again
+        pipe = client.pipeline(transaction=False)
+        for shared_key in shared_keys.values():
+            pipe.exists(shared_key)
+        stored = pipe.execute()
+
+        # the shared body outlives the pointers to it, whatever their TTL
+        pipe = client.pipeline()
+        for (encoding, shared_key), exists in zip(shared_keys.items(), stored):
+            if exists:
+                pipe.expire(shared_key, settings.CACHE_TTL)
+            else:
+                pipe.set(shared_key, variants[encoding], ex=settings.CACHE_TTL)
+        pipe.set(f'{self.key}:ref', digest, ex=min(ex, settings.CACHE_TTL))
+        pipe.set(f'{self.key}:etag', self.etag, ex=min(ex, settings.CACHE_TTL))
+        pipe.execute()
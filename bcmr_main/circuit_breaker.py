@@ -0,0 +1,145 @@
+from django.conf import settings
+from redis.exceptions import RedisError
+from bcmr_main.cache import get_client
+from urllib.parse import urlparse
+import time
+import uuid
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker shared by all workers through Redis.
+
+    The circuit opens after CIRCUIT_BREAKER_FAILURE_THRESHOLD failures within
+    CIRCUIT_BREAKER_FAILURE_WINDOW seconds. While open, requests to the host fail fast.
+    Once the cooldown passes the circuit is half-open and a single probe request is let
+    through: a success closes the circuit, a failure opens it again with a longer cooldown.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host, client=None):
+        self.host = host
+        self.client = client or get_client()
+        self.key = f'circuitbreaker:{host}'
+        self.probe_key = f'circuitbreaker:{host}:probe'
+        # sorted set of failure timestamps, only the ones within the window count
+        self.failures_key = f'circuitbreaker:{host}:failures'
+
+    def _count_failures(self, pipe, now):
+        pipe.zremrangebyscore(self.failures_key, '-inf', now - settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+        pipe.zcard(self.failures_key)
+
+    def _queue_status(self, pipe, now):
+        pipe.hgetall(self.key)
+        self._count_failures(pipe, now)
+
+    def _read_status(self, data, failures, now):
+        state = {key.decode(): float(value) for key, value in data.items()}
+        open_until = state.get('open_until')
+        if not open_until:
+            status = self.CLOSED
+        elif now < open_until:
+            status = self.OPEN
+        else:
+            status = self.HALF_OPEN
+        return {
+            'host': self.host,
+            'status': status,
+            'failures': failures,
+            'trips': int(state.get('trips', 0)),
+            'open_until': open_until
+        }
+
+    def status(self):
+        return get_statuses([self])[0]
+
+    def allow_request(self):
+        try:
+            status = self.status()['status']
+            if status == self.CLOSED:
+                return True
+            if status == self.OPEN:
+                return False
+            # half-open: only one worker gets to probe the host
+            return bool(self.client.set(
+                self.probe_key,
+                1,
+                nx=True,
+                ex=settings.CIRCUIT_BREAKER_PROBE_TIMEOUT
+            ))
+        except RedisError:
+            # never block downloads because the breaker state is unavailable
+            return True
+
+    def record_success(self):
+        try:
+            self.client.delete(self.key, self.probe_key, self.failures_key)
+        except RedisError:
+            pass
+
+    def record_failure(self):
+        try:
+            now = time.time()
+            pipe = self.client.pipeline()
+            pipe.zadd(self.failures_key, {f'{now}:{uuid.uuid4().hex}': now})
+            self._count_failures(pipe, now)
+            pipe.expire(self.failures_key, settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+            pipe.hget(self.key, 'open_until')
+            _, _, failures, _, open_until = pipe.execute()
+
+            # a failed probe re-opens the circuit right away
+            if failures >= settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD or open_until:
+                self._trip()
+        except RedisError:
+            pass
+
+    def _trip(self):
+        trips = self.client.hincrby(self.key, 'trips', 1)
+        cooldown = min(
+            settings.CIRCUIT_BREAKER_COOLDOWN * (2 ** (trips - 1)),
+            settings.CIRCUIT_BREAKER_MAX_COOLDOWN
+        )
+        pipe = self.client.pipeline()
+        pipe.hset(self.key, 'open_until', time.time() + cooldown)
+        # keep the trip count around long enough for the next cooldown to grow
+        pipe.expire(self.key, int(cooldown) + settings.CIRCUIT_BREAKER_MAX_COOLDOWN)
+        # a new window starts once the circuit closes again
+        pipe.delete(self.probe_key, self.failures_key)
+        pipe.execute()
+        LOGGER.warning(f'Circuit opened for {self.host} for {cooldown}s (trip #{trips})')
+
+
+def get_statuses(breakers):
+    """
+    Returns the status of each of the circuit breakers, read in a single Redis round trip
+    """
+    if not breakers:
+        return []
+    now = time.time()
+    pipe = breakers[0].client.pipeline()
+    for breaker in breakers:
+        breaker._queue_status(pipe, now)
+    results = pipe.execute()
+    return [
+        breaker._read_status(results[index * 3], results[index * 3 + 2], now)
+        for index, breaker in enumerate(breakers)
+    ]
+
+
+def get_circuit_breaker(url):
+    """
+    Returns the circuit breaker of the URL's host, or None for non-HTTP(S) URLs
+    """
+    try:
+        parsed_url = urlparse(url)
+    except ValueError:
+        return None
+    if parsed_url.scheme not in ['http', 'https'] or not parsed_url.hostname:
+        return None
+    return CircuitBreaker(parsed_url.hostname)
@@ -0,0 +1,93 @@
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    # optional, only the gzip variant is stored without it
+    brotli = None
+
+# bodies smaller than this are not worth a compressed variant
+MIN_SIZE = 1024
+GZIP_LEVEL = 9
+# 11 takes seconds on a multi-megabyte registry, 9 compresses about as well in a fraction of it
+BROTLI_QUALITY = 9
+
+
+def get_encodings():
+    """
+    Returns the content codings of the stored variants, by preference
+    """
+    if brotli:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def compress_variants(body):
+    """
+    Returns the compressed variants of a response body as a dict of content coding -> bytes,
+    empty if the body is too small to be worth compressing
+    """
+    if body is None or len(body) < MIN_SIZE:
+        return {}
+    variants = {'gzip': gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=BROTLI_QUALITY)
+    return {encoding: variant for encoding, variant in variants.items() if len(variant) < len(body)}
+
+
+def get_accepted_encodings(request):
+    """
+    Returns the content codings of the stored variants that the client accepts, by preference,
+    and 'identity' last
+    """
+    accepted = set()
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    pass
+        if name and quality > 0:
+            accepted.add(name.lower())
+    encodings = [encoding for encoding in get_encodings() if encoding in accepted or '*' in accepted]
+    return encodings + ['identity']
+
+
+def encoded_response(body, encoding, content_type='application/json', etag=None):
+    """
+    Returns the response of a body in the content coding it was stored in, with the ETag
+    of that coding if the ETag of the body is known
+    """
+    response = HttpResponse(body, content_type=content_type)
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    if etag:
+        response['ETag'] = etag if encoding == 'identity' else f'{etag[:-1]}-{encoding}"'
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
+
+
+def get_cached_response(request, cached):
+    """
+    Returns the response of the variant of a ResponseCache entry that fits the
+    Accept-Encoding of the request, or None on a miss
+    """
+    body, encoding = cached.get_encoded(get_accepted_encodings(request))
+    if body is None:
+        return None
+    return encoded_response(body, encoding, etag=cached.etag)
+
+
+def negotiate(request, body, variants, etag=None):
+    """
+    Returns the response of the variant of a body that fits the Accept-Encoding of the request
+    """
+    for encoding in get_accepted_encodings(request):
+        if encoding in variants:
+            return encoded_response(variants[encoding], encoding, etag=etag)
+    return encoded_response(body, 'identity', etag=etag)
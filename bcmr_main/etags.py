@@ -0,0 +1,71 @@
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+from functools import wraps
+import hashlib
+
+# headers of a 200 response that its 304 Not Modified has to repeat
+NOT_MODIFIED_HEADERS = ('Cache-Control', 'Vary')
+
+
+def get_etag(body):
+    """
+    Returns the strong ETag of a response body
+    """
+    if isinstance(body, str):
+        body = body.encode()
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def get_document_etag(blob_id, kind, category, key, rendered_at):
+    """
+    Returns the ETag of a materialized response document, from the sha256 of the registry blob
+    it was rendered from and the document key, without hashing the body.
+    The render time is part of it because the tokens of the category and the activation
+    of its snapshots change the documents of the same blob.
+    """
+    return get_etag(f'{blob_id}:{kind}:{category}:{key}:{rendered_at}')
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match or not etag:
+        return False
+    etags = parse_etags(if_none_match)
+    # If-None-Match uses the weak comparison
+    return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+
+def not_modified(etag, response=None):
+    not_modified_response = HttpResponseNotModified()
+    not_modified_response['ETag'] = etag
+    if response is not None:
+        for header in NOT_MODIFIED_HEADERS:
+            if response.has_header(header):
+                not_modified_response[header] = response[header]
+    return not_modified_response
+
+
+def conditional(view):
+    """
+    Adds an ETag to the responses of a view, and answers If-None-Match requests
+    with 304 Not Modified instead of the body.
+
+    The ETag is the one the view got along with the body, from a ResponseCache entry or
+    a materialized document (see bcmr_main.materialize), so that it always matches the bytes
+    being sent and nothing is looked up for it. The other bodies are hashed.
+
+    Decorates view functions, and APIView methods through method_decorator().
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        # DRF Responses are rendered later on, in APIView.finalize_response()
+        if response.status_code != 200 or response.streaming or not getattr(response, 'is_rendered', True):
+            return response
+
+        etag = response.get('ETag') or get_etag(response.content)
+        if etag_matches(request, etag):
+            return not_modified(etag, response)
+        response['ETag'] = etag
+        return response
+    return wrapper
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db.models import ExpressionWrapper, CharField, F, Q
+from bcmr_main.models import IdentitySnapshot, Registry
+from bcmr_main.views.bcmr_view import get_latest_registry
+import time
+
+
+def legacy_lookup(category):
+    # the text scan of every registry document the /api/bcmr/ endpoints used to run
+    cond1 = f'"category":"{category}"'
+    cond2 = f'"category": "{category}"'
+    return Registry.objects.select_related('blob').annotate(
+            contents_string=ExpressionWrapper(
+                F('blob__contents'),
+                output_field=CharField()
+            )
+        ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+
+
+def registry_id(lookup, category):
+    try:
+        return lookup(category).id
+    except Registry.DoesNotExist:
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark the /api/bcmr/ registry lookup by category against the text scan it replaced"
+
+    def add_arguments(self, parser):
+        parser.add_argument("category", nargs="*", type=str)
+        parser.add_argument("--sample", type=int, default=20)
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def _time(self, lookup, category, rounds):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            registry_id(lookup, category)
+        return (time.perf_counter() - started) / rounds * 1000
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        categories = options['category']
+        if not categories:
+            categories = list(
+                IdentitySnapshot.objects.filter(category__isnull=False)
+                .order_by('category')
+                .values_list('category', flat=True)
+                .distinct()[:options['sample']]
+            )
+
+        legacy_total = 0
+        indexed_total = 0
+        for category in categories:
+            legacy = self._time(legacy_lookup, category, rounds)
+            indexed = self._time(get_latest_registry, category, rounds)
+            legacy_total += legacy
+            indexed_total += indexed
+
+            legacy_id = registry_id(legacy_lookup, category)
+            indexed_id = registry_id(get_latest_registry, category)
+            mismatch = '' if legacy_id == indexed_id else f' | MISMATCH registry #{legacy_id} vs #{indexed_id}'
+            self.stdout.write(
+                f'{category}: '
+                f'text scan {legacy:.2f} ms | '
+                f'indexed {indexed:.3f} ms'
+                f'{mismatch}'
+            )
+
+        if categories:
+            self.stdout.write(
+                f'{len(categories)} categories, average: '
+                f'text scan {legacy_total / len(categories):.2f} ms | '
+                f'indexed {indexed_total / len(categories):.3f} ms'
+            )
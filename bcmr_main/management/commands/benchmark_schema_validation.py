@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from jsonschema import validate
+from bcmr_main.app.BitcoinCashMetadataRegistry import (
+    BitcoinCashMetadataRegistry,
+    get_schema_validator,
+    validation_results
+)
+import hashlib
+import json
+import time
+import copy
+
+
+def build_registry(nft_types):
+    with open(f'{settings.BASE_DIR}/bcmr_main/app/sample.json', 'r') as sample_file:
+        registry = json.load(sample_file)
+
+    authbase = registry['registryIdentity']
+    timestamp = list(registry['identities'][authbase].keys())[0]
+    snapshot = registry['identities'][authbase][timestamp]
+    snapshot['token']['nfts'] = {
+        'description': 'Benchmark collection',
+        'parse': {
+            'types': {
+                f'{i:08x}': {
+                    'name': f'NFT #{i}',
+                    'description': f'Benchmark NFT #{i}',
+                    'uris': {
+                        'icon': f'ipfs://bafkreih4tk23dj3ckpmgvafsw3hqmc5sjorsi466n2szqwab2cpawocqfm/{i}.png',
+                        'image': f'ipfs://bafkreih4tk23dj3ckpmgvafsw3hqmc5sjorsi466n2szqwab2cpawocqfm/{i}.png'
+                    },
+                    'extensions': {
+                        'attributes': {
+                            'rarity': str(i % 7),
+                            'background': str(i % 13)
+                        }
+                    }
+                }
+                for i in range(nft_types)
+            }
+        }
+    }
+    return registry
+
+
+def legacy_validate(contents):
+    with open(f'{settings.BASE_DIR}/bcmr_main/app/bcmr-schema-v2.json', 'r') as bcmr_schema_file:
+        bcmr_schema = json.load(bcmr_schema_file)
+        validate(instance=json.loads(contents) if type(contents) == str else contents, schema=bcmr_schema)
+
+
+class Command(BaseCommand):
+    help = "Benchmark BCMR schema validation on large registries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--types", nargs="+", type=int, default=[100, 1000, 10000])
+        parser.add_argument("--rounds", type=int, default=5)
+
+    def _time(self, func, rounds):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        return (time.perf_counter() - started) / rounds * 1000
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        get_schema_validator()
+
+        for nft_types in options['types']:
+            registry = build_registry(nft_types)
+            raw = json.dumps(registry).encode()
+            sha256 = hashlib.sha256(raw).hexdigest()
+
+            legacy = self._time(lambda: legacy_validate(copy.deepcopy(registry)), rounds)
+
+            def compiled():
+                validation_results.clear()
+                BitcoinCashMetadataRegistry.validate_contents(registry, sha256=sha256)
+
+            cold = self._time(compiled, rounds)
+            memoized = self._time(
+                lambda: BitcoinCashMetadataRegistry.validate_contents(registry, sha256=sha256),
+                rounds
+            )
+            unhashed = self._time(
+                lambda: BitcoinCashMetadataRegistry.validate_contents(registry),
+                rounds
+            )
+
+            self.stdout.write(
+                f'{nft_types} NFT types ({len(raw) / 1024:.0f} KiB): '
+                f'legacy {legacy:.2f} ms | '
+                f'compiled {cold:.2f} ms | '
+                f'memoized {memoized:.3f} ms | '
+                f'memoized without hash {unhashed:.2f} ms'
+            )
@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.conf import settings
 from django.utils import timezone
 from bcmr_main.bchn import BCHN
-from bcmr_main.tasks import process_tx
+from bcmr_main.tasks import process_tx, regenerate_dirty_metadata
 from bcmr_main.models import *
 import logging
 import time
@@ -57,6 +57,9 @@ class Command(BaseCommand):
                 block_scan.scanned = True
                 block_scan.save()
 
+                # regenerate metadata of the categories touched by this block in one go
+                regenerate_dirty_metadata.delay(force=True)
+
                 # clear the queued transactions table
                 QueuedTransaction.objects.all().delete()
 
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from collections import defaultdict
+from bcmr_main.cache import get_client, get_key_family
+
+
+class Command(BaseCommand):
+    help = "Report the Redis memory used per cache key family"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--match", type=str, default='*', help="only the keys matching this pattern")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        client = get_client()
+        counts = defaultdict(int)
+        sizes = defaultdict(int)
+
+        batch = []
+        for key in client.scan_iter(match=options['match'], count=options['batch_size']):
+            batch.append(key.decode() if isinstance(key, bytes) else key)
+            if len(batch) >= options['batch_size']:
+                self.measure(client, batch, counts, sizes)
+                batch = []
+        if batch:
+            self.measure(client, batch, counts, sizes)
+
+        width = max([len(family) for family in counts] + [len('family')])
+        self.stdout.write(f'{"family":<{width}}  {"keys":>10}  {"bytes":>14}  {"avg":>10}')
+        for family in sorted(sizes, key=sizes.get, reverse=True):
+            self.stdout.write(
+                f'{family:<{width}}  {counts[family]:>10}  {sizes[family]:>14}  {sizes[family] // counts[family]:>10}'
+            )
+        self.stdout.write(f'{"total":<{width}}  {sum(counts.values()):>10}  {sum(sizes.values()):>14}')
+
+    def measure(self, client, keys, counts, sizes):
+        pipe = client.pipeline(transaction=False)
+        for key in keys:
+            pipe.memory_usage(key)
+        for key, size in zip(keys, pipe.execute()):
+            # None if the key expired in the meantime
+            if size is None:
+                continue
+            family = get_key_family(key)
+            counts[family] += 1
+            sizes[family] += size
@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
-from decouple import config
-import redis
+from bcmr_main.cache import invalidate_all, invalidate_categories
 
 class Command(BaseCommand):
     help = "Clear registries and token metadata cache"
@@ -9,24 +8,10 @@ class Command(BaseCommand):
         parser.add_argument("category", nargs="+", type=str)
 
     def handle(self, *args, **options):
-        client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-        keys_to_delete = []
-        if options.get('category'):
-            category = options.get('category')[0]
-            if category == 'all':
-                registries_keys = 'registry:token:*'
-                keys_to_delete += client.keys(registries_keys)
-                token_metadata_keys = 'metadata:token:*'
-                keys_to_delete += client.keys(token_metadata_keys)
-            else:
-                registries_keys = f'registry:token:{category}:*'
-                keys_to_delete += client.keys(registries_keys)
-                token_metadata_keys = f'metadata:token:{category}:*'
-                keys_to_delete += client.keys(token_metadata_keys)      
-
-        for key in keys_to_delete:
-            client.delete(key)
-        if options.get('category') == 'all':
+        categories = options.get('category')
+        if 'all' in categories:
+            invalidate_all()
             print('Cache cleared!')
         else:
-            print(f'Cache cleared for category: {category}!')
+            invalidate_categories(categories)
+            print(f'Cache cleared for category: {", ".join(categories)}!')
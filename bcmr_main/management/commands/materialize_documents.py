@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from bcmr_main.models import Registry
+from bcmr_main.materialize import materialize_registry
+
+
+class Command(BaseCommand):
+    help = "Render the response documents of registries that were ingested before they existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("registry_id", nargs="*", type=int)
+
+    def handle(self, *args, **options):
+        registries = Registry.objects.select_related('blob').filter(blob__isnull=False)
+        if options.get('registry_id'):
+            registries = registries.filter(id__in=options['registry_id'])
+
+        # newest first, categories republished in newer registries are then skipped right away
+        total = 0
+        for registry in registries.order_by('-id').iterator():
+            total += len(materialize_registry(registry))
+        print(f'Materialized response documents of {total} categories')
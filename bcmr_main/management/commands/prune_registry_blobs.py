@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from bcmr_main.models import RegistryBlob
+
+
+class Command(BaseCommand):
+    help = "Delete registry blobs that are no longer referenced by any registry"
+
+    def handle(self, *args, **options):
+        orphans = RegistryBlob.objects.filter(registries__isnull=True)
+        deleted, _ = orphans.delete()
+        print(f'Deleted {deleted} unreferenced registry blobs')
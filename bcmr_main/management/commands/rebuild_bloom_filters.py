@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from bcmr_main.models import Registry, RegistryBlob, Token
+from bcmr_main.bloom import BloomFilter, REGISTRY_CATEGORIES, TOKEN_CATEGORIES
+
+
+def registry_categories():
+    blobs = RegistryBlob.objects.filter(registries__isnull=False).distinct()
+    for blob in blobs.iterator(chunk_size=100):
+        yield from Registry(blob=blob).get_categories()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the Bloom filters of known token and registry categories"
+
+    def handle(self, *args, **options):
+        categories = Token.objects.values_list('category', flat=True).distinct()
+        count = BloomFilter(TOKEN_CATEGORIES).rebuild(categories.iterator())
+        print(f'Added {count} token categories')
+
+        count = BloomFilter(REGISTRY_CATEGORIES).rebuild(registry_categories())
+        print(f'Added {count} registry categories')
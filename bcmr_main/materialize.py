@@ -0,0 +1,318 @@
+from django.db import transaction
+from redis.exceptions import RedisError
+from django.utils import timezone
+from bcmr_main.compression import compress_variants
+from bcmr_main.etags import get_document_etag
+from bcmr_main.cache import get_client, invalidate_categories_on_commit, set_next_activation
+from bcmr_main.models import Registry, ResponseDocument, Token
+from bcmr_main.models.IdentitySnapshot import iter_snapshots
+from collections import OrderedDict
+from operator import itemgetter
+from dateutil.parser import parse as parse_datetime
+import dateutil.parser
+import logging
+import time
+import json
+import copy
+
+LOGGER = logging.getLogger(__name__)
+
+# kind -> renderer(registry, category), see register_renderer()
+RENDERERS = OrderedDict()
+# sorted set of registry IDs to re-materialize, scored by when their next snapshot activates
+PENDING_ACTIVATIONS_KEY = 'materialize:activations'
+
+
+def register_renderer(kind):
+    """
+    Registers the renderer of the response documents of an endpoint.
+
+    A renderer is called with an ingested registry and one of its categories and returns
+    a dict of key -> response data (e.g. one per NFT type), or None if the registry
+    is not the source of that endpoint for the category, leaving its documents as they are.
+    """
+    def decorator(renderer):
+        RENDERERS[kind] = renderer
+        return renderer
+    return decorator
+
+
+def get_response_document(kind, category, key=''):
+    """
+    Returns the materialized response body and its ETag as a tuple of (body, etag),
+    or (None, None) if it has not been rendered
+    """
+    document = ResponseDocument.objects.filter(
+        kind=kind,
+        category=category,
+        key=key
+    ).values_list('body', 'etag').first()
+    if document is None:
+        return None, None
+    body, etag = document
+    return bytes(body), etag or None
+
+
+def get_response_variants(kind, category, key=''):
+    """
+    Returns the materialized response body, its compressed variants and its ETag as a tuple of
+    (body, dict of content coding -> bytes, etag), or (None, {}, None) if it has not been rendered
+    """
+    document = ResponseDocument.objects.filter(
+        kind=kind,
+        category=category,
+        key=key
+    ).only('body', 'gzip_body', 'brotli_body', 'etag').first()
+    if document is None:
+        return None, {}, None
+    return bytes(document.body), document.get_variants(), document.etag or None
+
+
+def transform_to_paytaca_expected_format(identity_snapshot, nft_type_key, is_nft):
+    nft_type_key_exists = False
+    if nft_type_key:
+        if identity_snapshot.get('token') and identity_snapshot['token'].get('nfts'):
+            nfts = identity_snapshot['token'].pop('nfts')
+            if nft_type_key == 'empty' or nft_type_key == 'none':
+                nft_type_key = ''
+            nft_type_details = (nfts.get('parse') or {}).get('types' or {}).get(nft_type_key)
+            if nft_type_details:
+                nft_type_key_exists = True
+                identity_snapshot['type_metadata'] = nfts['parse']['types'][nft_type_key]
+
+                # NOTE: This is a temporary fix for NFTs that do not have `image` field under `uris`
+                # The `image` field is needed by Paytaca to display NFTs propery in the wallet
+                type_uris = identity_snapshot['type_metadata']['uris']
+                if 'asset' in type_uris.keys()  and 'image' not in type_uris.keys():
+                    asset_uri = identity_snapshot['type_metadata']['uris']['asset']
+                    asset_uri_ext = asset_uri.split('.')[-1].lower()
+                    if asset_uri_ext in ['jpg', 'png', 'gif', 'svg']:
+                        identity_snapshot['type_metadata']['uris']['image'] = asset_uri
+
+                # For some collections that only specified an icon but not an image
+                if 'icon' in type_uris.keys()  and 'image' not in type_uris.keys():
+                    identity_snapshot['type_metadata']['uris']['image'] = identity_snapshot['type_metadata']['uris']['icon']
+
+    if identity_snapshot.get('token') and identity_snapshot['token'].get('nfts'):
+        identity_snapshot['token'].pop('nfts')
+
+    if identity_snapshot.get('_meta'):
+        identity_snapshot.pop('_meta')
+
+    if identity_snapshot:
+        identity_snapshot['is_nft'] = is_nft
+
+    return (identity_snapshot, nft_type_key_exists)
+
+
+def get_latest_identity_snapshot(identity_snapshots):
+    snapshots = []
+    for snapshot_key in (identity_snapshots or {}).keys():
+        try:
+            snapshots.append([snapshot_key, parse_datetime(snapshot_key)])
+        except dateutil.parser._parser.ParserError:
+            pass
+    if not snapshots:
+        return None
+    snapshots.sort(key=itemgetter(1))
+    latest_key, _ = snapshots[-1]
+    return identity_snapshots[latest_key]
+
+
+def is_latest_publisher(registry, category):
+    """
+    Whether the endpoints keyed by authbase read the category from the registry,
+    i.e. no newer registry has identities under it
+    """
+    identities = registry.contents.get('identities') or {}
+    if category not in identities:
+        return False
+    return not Registry.objects.filter(
+        id__gt=registry.id,
+        blob__contents__identities__has_key=category
+    ).exists()
+
+
+@register_renderer('registry')
+def render_registry(registry, category):
+    """
+    RegistryView: the registry contents, keyed by authbase
+    """
+    if not is_latest_publisher(registry, category):
+        return None
+    return {'': registry.contents}
+
+
+@register_renderer('token')
+def render_token(registry, category):
+    """
+    TokenView: the latest identity snapshot under '' and one document per NFT type,
+    with the type keyed '' in the registry stored under 'empty'
+    """
+    if not is_latest_publisher(registry, category):
+        return None
+
+    identities = registry.contents.get('identities') or {}
+    # the latest token of the category, as in TokenView
+    token = Token.objects.filter(category=category).order_by('-id').first()
+    identity_snapshot = get_latest_identity_snapshot(identities[category])
+    if not token or not identity_snapshot:
+        return {}
+
+    nfts = (identity_snapshot.get('token') or {}).get('nfts') or {}
+    nft_types = (nfts.get('parse') or {}).get('types') or {}
+
+    base_snapshot = copy.deepcopy(identity_snapshot)
+    documents = {
+        '': transform_to_paytaca_expected_format(copy.deepcopy(base_snapshot), '', token.is_nft)[0]
+    }
+    if base_snapshot.get('token'):
+        base_snapshot['token'].pop('nfts', None)
+
+    for nft_type_key, nft_type in nft_types.items():
+        if nft_type_key in ['empty', 'none']:
+            # unreachable, these are aliases of the type keyed ''
+            continue
+        type_snapshot = copy.deepcopy(base_snapshot)
+        type_snapshot['token']['nfts'] = {'parse': {'types': {nft_type_key: nft_type}}}
+        response, nft_type_key_exists = transform_to_paytaca_expected_format(
+            type_snapshot,
+            nft_type_key or 'empty',
+            token.is_nft
+        )
+        if nft_type_key_exists:
+            documents[nft_type_key or 'empty'] = response
+    return documents
+
+
+def token_documents_outdated(token, created):
+    """
+    Whether a saved token changes what render_token() renders for its category,
+    i.e. the category got its first token or the is_nft of its latest token changed
+    """
+    if not created and not token.is_nft_changed:
+        return False
+    latest = list(Token.objects.filter(category=token.category).order_by('-id').values_list('id', 'is_nft')[:2])
+    if not latest or latest[0][0] != token.id:
+        return False
+    if created and len(latest) > 1:
+        return latest[1][1] != token.is_nft
+    return True
+
+
+def get_next_activations(registry):
+    """
+    Returns token category -> unix timestamp of its earliest identity snapshot in the registry
+    that is not active yet. The cts helpers only pick snapshots whose timestamp has passed,
+    so their responses change when that moment passes.
+    """
+    now = timezone.now()
+    activations = {}
+    for snapshot in iter_snapshots(registry.contents):
+        # same timestamps as the IdentitySnapshot rows the helpers filter on
+        activation = snapshot['timestamp']
+        if not snapshot['category'] or activation is None or activation <= now:
+            continue
+        timestamp = activation.timestamp()
+        category = snapshot['category']
+        activations[category] = min(activations.get(category, timestamp), timestamp)
+    return activations
+
+
+def schedule_activations(registry):
+    """
+    Bounds the cache TTLs of the registry's categories by their next snapshot activation
+    and queues the registry to be re-materialized at the earliest one
+    """
+    activations = get_next_activations(registry)
+    if not activations:
+        return None
+    try:
+        client = get_client()
+        for category, timestamp in activations.items():
+            set_next_activation(category, timestamp, client=client)
+        next_activation = min(activations.values())
+        client.zadd(PENDING_ACTIVATIONS_KEY, {registry.id: next_activation})
+    except RedisError:
+        LOGGER.error(f'Unable to schedule snapshot activations of registry ID #{registry.id}')
+        return None
+    return next_activation
+
+
+def pop_activated_registries():
+    """
+    Returns the IDs of the registries with a snapshot that has become active,
+    each one handed out to only one caller
+    """
+    client = get_client()
+    due = client.zrangebyscore(PENDING_ACTIVATIONS_KEY, '-inf', time.time())
+    return [int(registry_id) for registry_id in due if client.zrem(PENDING_ACTIVATIONS_KEY, registry_id)]
+
+
+def materialize_registry(registry, categories=None, kinds=None):
+    """
+    Renders and stores the response documents of every category of the registry, or only
+    those of the given categories and kinds of endpoint.
+    The renderers skip the categories that other registries are the source of, and the
+    documents of categories the registry no longer publishes are dropped.
+    Returns the categories that were rendered.
+    """
+    if not registry.blob_id:
+        return []
+
+    partial = categories is not None or kinds is not None
+    if categories is None:
+        categories = registry.get_categories()
+    renderers = [(kind, RENDERERS[kind]) for kind in kinds or RENDERERS]
+    rendered_at = time.time_ns()
+    materialized = []
+    for category in categories:
+        rendered_kinds = []
+        documents = []
+        for kind, renderer in renderers:
+            rendered = renderer(registry, category)
+            if rendered is None:
+                continue
+            rendered_kinds.append(kind)
+            for key, data in rendered.items():
+                if not data:
+                    continue
+                body = json.dumps(data).encode()
+                # compressed once here instead of on every response
+                variants = compress_variants(body)
+                documents.append(ResponseDocument(
+                    kind=kind,
+                    category=category,
+                    key=key,
+                    registry=registry,
+                    body=body,
+                    gzip_body=variants.get('gzip'),
+                    brotli_body=variants.get('br'),
+                    etag=get_document_etag(registry.blob_id, kind, category, key, rendered_at)
+                ))
+
+        if not rendered_kinds:
+            continue
+
+        with transaction.atomic():
+            ResponseDocument.objects.filter(category=category, kind__in=rendered_kinds).delete()
+            ResponseDocument.objects.bulk_create(documents, batch_size=1000)
+            # responses cached between the ingest and now were built from the old documents
+            invalidate_categories_on_commit([category])
+        materialized.append(category)
+
+    if partial:
+        LOGGER.info(f'Materialized {len(materialized)} categories of registry ID #{registry.id}')
+        return materialized
+
+    # the endpoints fall back to the registries themselves until the new source is materialized
+    dropped = ResponseDocument.objects.filter(registry=registry).exclude(category__in=categories)
+    dropped_categories = set(dropped.values_list('category', flat=True))
+    if dropped_categories:
+        with transaction.atomic():
+            dropped.delete()
+            invalidate_categories_on_commit(dropped_categories)
+
+    schedule_activations(registry)
+    LOGGER.info(f'Materialized response documents of {len(materialized)} categories of registry ID #{registry.id}')
+    return materialized
@@ -1,12 +1,93 @@
 from operator import itemgetter
+from django.conf import settings
 from django.utils import timezone
+from redis.exceptions import RedisError
 import dateutil.parser
 from dateutil.parser import parse as parse_datetime
 from bcmr_main.models import *
+from bcmr_main.cache import get_client
+import logging
+import time
 import copy
 
+LOGGER = logging.getLogger(__name__)
 
-def generate_token_metadata(registry_obj, commitment=None):
+# sorted set of categories waiting for metadata regeneration, scored by last touch
+DIRTY_CATEGORIES_KEY = 'metadata:dirty'
+# hash of category -> first time it was marked dirty since the last regeneration
+DIRTY_CATEGORIES_SINCE_KEY = 'metadata:dirty:since'
+# set of the NFT commitments of a dirty category to regenerate, ALL_COMMITMENTS for all of them
+DIRTY_COMMITMENTS_KEY = 'metadata:dirty:commitments:{category}'
+ALL_COMMITMENTS = '*'
+
+
+def mark_metadata_dirty(category, commitment=None):
+    """
+    Queues the metadata of an NFT commitment of a category for regeneration,
+    or that of the whole category without one. Repeated marks within the quiet
+    window coalesce into a single regeneration.
+    """
+    now = time.time()
+    try:
+        pipe = get_client().pipeline()
+        pipe.zadd(DIRTY_CATEGORIES_KEY, {category: now})
+        pipe.hsetnx(DIRTY_CATEGORIES_SINCE_KEY, category, now)
+        pipe.sadd(DIRTY_COMMITMENTS_KEY.format(category=category), ALL_COMMITMENTS if commitment is None else commitment)
+        pipe.execute()
+    except RedisError:
+        LOGGER.error(f'Unable to mark metadata of {category} for regeneration')
+
+
+def pop_dirty_categories(force=False):
+    """
+    Returns the dirty categories that have been quiet for METADATA_REGENERATION_QUIET_WINDOW
+    seconds, or dirty for longer than METADATA_REGENERATION_MAX_DELAY, or all of them if forced,
+    as a dict of category -> the NFT commitments to regenerate, or None for all of them.
+    Each category is handed out to only one caller. Returns what it got so far if Redis
+    is unavailable, the other categories stay dirty until the next call.
+    """
+    client = get_client()
+    now = time.time()
+    categories = {}
+
+    try:
+        if force:
+            candidates = client.zrange(DIRTY_CATEGORIES_KEY, 0, -1)
+        else:
+            candidates = client.zrangebyscore(
+                DIRTY_CATEGORIES_KEY,
+                '-inf',
+                now - settings.METADATA_REGENERATION_QUIET_WINDOW
+            )
+            overdue = now - settings.METADATA_REGENERATION_MAX_DELAY
+            candidates += [
+                category
+                for category, since in client.hgetall(DIRTY_CATEGORIES_SINCE_KEY).items()
+                if float(since) <= overdue
+            ]
+
+        for category in set(candidates):
+            if not client.zrem(DIRTY_CATEGORIES_KEY, category):
+                continue
+            category = category.decode()
+            commitments_key = DIRTY_COMMITMENTS_KEY.format(category=category)
+            # marks from now on go to the next regeneration
+            pipe = client.pipeline()
+            pipe.hdel(DIRTY_CATEGORIES_SINCE_KEY, category)
+            pipe.smembers(commitments_key)
+            pipe.delete(commitments_key)
+            _, commitments, _ = pipe.execute()
+            commitments = {commitment.decode() for commitment in commitments}
+            if not commitments:
+                # already regenerated along with a mark that came in after the last pop
+                continue
+            categories[category] = None if ALL_COMMITMENTS in commitments else sorted(commitments)
+    except RedisError:
+        LOGGER.error('Unable to read the categories of metadata to regenerate')
+    return categories
+
+
+def generate_token_metadata(registry_obj, commitment=None, commitments=None):
     # Parse the BCMR to get the associated identities and tokens
     if not registry_obj.contents:
         return
@@ -22,7 +103,7 @@ def generate_token_metadata(registry_obj, commitment=None):
         validity_checks = registry_obj.validity_checks
         validity_checks['identities_match'] = True
         registry_obj.validity_checks = validity_checks
-        registry_obj.save()
+        registry_obj.save(update_fields=['validity_checks'])
 
     # Parse and save metadata regardless if identities are valid or not
     for identity in list(matched_identities):
@@ -57,6 +138,8 @@ def generate_token_metadata(registry_obj, commitment=None):
                                 nft_types = token_data['nfts']['parse']['types']
                                 if commitment and commitment in nft_types.keys():
                                     nft_types = { commitment: nft_types[commitment] }
+                                elif commitments is not None:
+                                    nft_types = { key: nft_types[key] for key in commitments if key in nft_types }
                                 
                                 for nft_type_key in nft_types:
                                     nft_token_check = Token.objects.filter(
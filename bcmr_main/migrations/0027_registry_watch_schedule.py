@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-19 01:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0026_registry_contents__identities_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registry',
+            name='watch_failures',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='registry',
+            name='watch_interval',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='registry',
+            name='watch_last_changed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='registry',
+            name='watch_last_checked',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='registry',
+            name='watch_next_check',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-19 01:44
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0027_registry_watch_schedule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistryBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('contents', models.JSONField(blank=True, null=True)),
+                ('raw', models.BinaryField(blank=True, null=True)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Registry blobs',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='registryblob',
+            index=django.contrib.postgres.indexes.GinIndex(django.db.models.expressions.F('contents'), name='registryblob_contents_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registryblob',
+            index=models.Index(django.db.models.expressions.F('contents__identities'), name='registryblob_identities_idx'),
+        ),
+        migrations.AddField(
+            model_name='registry',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='registries', to='bcmr_main.registryblob'),
+        ),
+    ]
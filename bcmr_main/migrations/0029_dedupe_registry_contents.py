@@ -0,0 +1,73 @@
+import hashlib
+import json
+import re
+from django.db import migrations
+
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def decode_str(encoded_string):
+    try:
+        return bytearray.fromhex(encoded_string).decode()
+    except ValueError:
+        return ''
+
+
+def get_published_hash(registry):
+    """
+    Returns the sha256 of the downloaded bytes of a registry that passed the hash check:
+    the hash published in its OP_RETURN, either hex-encoded or as the raw 32 bytes.
+    """
+    if not (registry.validity_checks or {}).get('bcmr_hash_match'):
+        return None
+    op_return_split = registry.op_return.split(' ')
+    if len(op_return_split) < 3:
+        return None
+    for published_hash in [decode_str(op_return_split[2]), op_return_split[2]]:
+        if SHA256.match(published_hash):
+            return published_hash
+    return None
+
+
+def move_contents_to_blobs(apps, schema_editor):
+    """
+    Blobs are keyed like the downloads keep them, by the sha256 of the raw bytes, which for
+    registries that passed the hash check is the one published in their OP_RETURN.
+    The others (hash mismatches allowed) only have the parsed document, so their blobs are
+    keyed by the sha256 of its canonical JSON, and their next download is stored as a new
+    blob once.
+    """
+    Registry = apps.get_model('bcmr_main', 'Registry')
+    RegistryBlob = apps.get_model('bcmr_main', 'RegistryBlob')
+
+    registries = Registry.objects.filter(contents__isnull=False).only(
+        'id', 'contents', 'op_return', 'validity_checks'
+    ).order_by('id')
+    for registry in registries.iterator(chunk_size=100):
+        canonical = json.dumps(registry.contents, sort_keys=True, separators=(',', ':'))
+        sha256 = get_published_hash(registry) or hashlib.sha256(canonical.encode()).hexdigest()
+        if not RegistryBlob.objects.filter(sha256=sha256).exists():
+            RegistryBlob.objects.create(
+                sha256=sha256,
+                contents=registry.contents,
+                size=len(canonical)
+            )
+        Registry.objects.filter(id=registry.id).update(blob_id=sha256)
+
+
+def move_blobs_to_contents(apps, schema_editor):
+    Registry = apps.get_model('bcmr_main', 'Registry')
+    registries = Registry.objects.filter(blob__isnull=False).select_related('blob').order_by('id')
+    for registry in registries.iterator(chunk_size=100):
+        Registry.objects.filter(id=registry.id).update(contents=registry.blob.contents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0028_registryblob'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_contents_to_blobs, move_blobs_to_contents),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-19 01:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0029_dedupe_registry_contents'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='registry',
+            name='contents_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='registry',
+            name='contents__identities_idx',
+        ),
+        migrations.RemoveField(
+            model_name='registry',
+            name='contents',
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2 on 2026-10-19 01:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0030_remove_registry_contents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResponseDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('category', models.CharField(max_length=100)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('body', models.BinaryField()),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('registry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='response_documents', to='bcmr_main.registry')),
+            ],
+            options={
+                'verbose_name_plural': 'Response documents',
+                'unique_together': {('kind', 'category', 'key')},
+            },
+        ),
+    ]
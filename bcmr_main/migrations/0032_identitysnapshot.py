@@ -0,0 +1,33 @@
+# Generated by Django 3.2 on 2026-10-19 01:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0031_responsedocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdentitySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('authbase', models.CharField(max_length=100)),
+                ('identity_history', models.CharField(max_length=100)),
+                ('timestamp', models.DateTimeField(blank=True, null=True)),
+                ('category', models.CharField(blank=True, max_length=100, null=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identity_snapshots', to='bcmr_main.registryblob')),
+                ('registry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='identity_snapshots', to='bcmr_main.registry')),
+            ],
+            options={
+                'verbose_name_plural': 'Identity snapshots',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='identitysnapshot',
+            index=models.Index(fields=['category', 'timestamp'], name='identitysnapshot_category_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+from bcmr_main.models.IdentitySnapshot import iter_snapshots
+
+
+def index_identity_snapshots(apps, schema_editor):
+    Registry = apps.get_model('bcmr_main', 'Registry')
+    IdentitySnapshot = apps.get_model('bcmr_main', 'IdentitySnapshot')
+
+    registries = Registry.objects.filter(blob__isnull=False).select_related('blob').order_by('id')
+    for registry in registries.iterator(chunk_size=100):
+        snapshots = [
+            IdentitySnapshot(registry_id=registry.id, blob_id=registry.blob_id, **fields)
+            for fields in iter_snapshots(registry.blob.contents)
+        ]
+        IdentitySnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+
+def clear_identity_snapshots(apps, schema_editor):
+    apps.get_model('bcmr_main', 'IdentitySnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0032_identitysnapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_identity_snapshots, clear_identity_snapshots),
+    ]
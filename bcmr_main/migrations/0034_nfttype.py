@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-19 02:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0033_index_identity_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NftType',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=100)),
+                ('type_key', models.CharField(blank=True, max_length=255)),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nft_types', to='bcmr_main.identitysnapshot')),
+            ],
+            options={
+                'verbose_name_plural': 'NFT types',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='nfttype',
+            index=models.Index(fields=['category', 'type_key'], name='nfttype_category_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='nfttype',
+            unique_together={('snapshot', 'type_key')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+from bcmr_main.models.IdentitySnapshot import get_nft_type_keys
+
+
+def index_nft_types(apps, schema_editor):
+    Registry = apps.get_model('bcmr_main', 'Registry')
+    IdentitySnapshot = apps.get_model('bcmr_main', 'IdentitySnapshot')
+    NftType = apps.get_model('bcmr_main', 'NftType')
+
+    registries = Registry.objects.filter(blob__isnull=False).select_related('blob').order_by('id')
+    for registry in registries.iterator(chunk_size=100):
+        snapshots = IdentitySnapshot.objects.filter(registry_id=registry.id, category__isnull=False)
+        nft_types = [
+            NftType(snapshot_id=snapshot.id, category=snapshot.category, type_key=type_key)
+            for snapshot in snapshots
+            for type_key in get_nft_type_keys(registry.blob.contents, snapshot.authbase, snapshot.identity_history)
+        ]
+        NftType.objects.bulk_create(nft_types, batch_size=1000)
+
+
+def clear_nft_types(apps, schema_editor):
+    apps.get_model('bcmr_main', 'NftType').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0034_nfttype'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_nft_types, clear_nft_types),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-19 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0035_index_nft_types'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='identitysnapshot',
+            index=models.Index(fields=['category', '-registry'], name='identitysnapshot_registry_idx'),
+        ),
+    ]
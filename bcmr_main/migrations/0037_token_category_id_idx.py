@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0036_identitysnapshot_registry_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['category', '-id'], name='token_category_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-19 02:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0037_token_category_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='responsedocument',
+            name='brotli_body',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='responsedocument',
+            name='gzip_body',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-19 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bcmr_main', '0038_responsedocument_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='responsedocument',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,134 @@
+import datetime
+import dateutil.parser
+from django.db import models, transaction
+from django.utils import timezone
+
+
+def parse_snapshot_timestamp(identity_history):
+    """
+    Returns the aware datetime of an identity snapshot key, or None if it is not a timestamp
+    """
+    try:
+        timestamp = dateutil.parser.isoparse(identity_history)
+    except (ValueError, OverflowError):
+        return None
+    if timezone.is_naive(timestamp):
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
+
+
+def iter_snapshots(contents):
+    """
+    Yields the fields of an IdentitySnapshot row for every snapshot in a registry document
+    """
+    identities = (contents or {}).get('identities') or {}
+    for authbase, history in identities.items():
+        if not isinstance(history, dict):
+            continue
+        for identity_history, snapshot in history.items():
+            if len(authbase) > 100 or len(identity_history) > 100:
+                continue
+            category = ((snapshot or {}).get('token') or {}).get('category')
+            if not isinstance(category, str) or len(category) > 100:
+                category = None
+            yield {
+                'authbase': authbase,
+                'identity_history': identity_history,
+                'timestamp': parse_snapshot_timestamp(identity_history),
+                'category': category
+            }
+
+
+def get_nft_type_keys(contents, authbase, identity_history):
+    """
+    Returns the keys of token.nfts.parse.types of a snapshot that fit an NftType row
+    """
+    snapshot = (((contents or {}).get('identities') or {}).get(authbase) or {}).get(identity_history)
+    try:
+        types = snapshot['token']['nfts']['parse']['types']
+    except (KeyError, TypeError):
+        return []
+    if not isinstance(types, dict):
+        return []
+    return [type_key for type_key in types.keys() if len(type_key) <= 255]
+
+
+class IdentitySnapshot(models.Model):
+    """
+    One row per identity snapshot of a registry, pointing at its JSON in the registry blob
+    at identities -> authbase -> identity_history, so that the snapshot of a token category
+    is an index lookup instead of an expansion of every registry document
+    """
+    registry = models.ForeignKey(
+        'Registry',
+        related_name='identity_snapshots',
+        on_delete=models.CASCADE
+    )
+    blob = models.ForeignKey(
+        'RegistryBlob',
+        related_name='identity_snapshots',
+        on_delete=models.CASCADE
+    )
+    authbase = models.CharField(max_length=100)
+    identity_history = models.CharField(max_length=100)
+    # null for snapshot keys that are not timestamps, these never become active
+    timestamp = models.DateTimeField(null=True, blank=True)
+    category = models.CharField(max_length=100, null=True, blank=True)
+
+    @staticmethod
+    def index(registry):
+        """
+        Replaces the snapshot rows of the registry with those of its current document
+        """
+        snapshots = [
+            IdentitySnapshot(registry_id=registry.id, blob_id=registry.blob_id, **fields)
+            for fields in iter_snapshots(registry.contents)
+        ]
+
+        with transaction.atomic():
+            IdentitySnapshot.objects.filter(registry_id=registry.id).delete()
+            IdentitySnapshot.objects.bulk_create(snapshots, batch_size=1000)
+            NftType.index(registry, snapshots)
+        return len(snapshots)
+
+    class Meta:
+        verbose_name_plural = 'Identity snapshots'
+        indexes = [
+            models.Index(fields=['category', 'timestamp'], name='identitysnapshot_category_idx'),
+            models.Index(fields=['category', '-registry'], name='identitysnapshot_registry_idx'),
+        ]
+
+
+class NftType(models.Model):
+    """
+    One row per key of token.nfts.parse.types of an identity snapshot, pointing at the NFT
+    type's JSON through its snapshot, so that a type is found by (category, type_key)
+    and a collection is listed in type_key order without expanding the document
+    """
+    snapshot = models.ForeignKey(
+        'IdentitySnapshot',
+        related_name='nft_types',
+        on_delete=models.CASCADE
+    )
+    category = models.CharField(max_length=100)
+    type_key = models.CharField(max_length=255, blank=True)
+
+    @staticmethod
+    def index(registry, snapshots):
+        """
+        Creates the NFT type rows of the registry's newly created snapshot rows
+        """
+        nft_types = [
+            NftType(snapshot_id=snapshot.id, category=snapshot.category, type_key=type_key)
+            for snapshot in snapshots if snapshot.category
+            for type_key in get_nft_type_keys(registry.contents, snapshot.authbase, snapshot.identity_history)
+        ]
+        NftType.objects.bulk_create(nft_types, batch_size=1000)
+        return len(nft_types)
+
+    class Meta:
+        verbose_name_plural = 'NFT types'
+        unique_together = ('snapshot', 'type_key')
+        indexes = [
+            models.Index(fields=['category', 'type_key'], name='nfttype_category_idx'),
+        ]
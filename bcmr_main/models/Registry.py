@@ -1,7 +1,70 @@
 import json
-import datetime
+import hashlib
+from urllib.parse import quote
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres.indexes import GinIndex
+from bcmr_main.queries import (
+    FIND_REGISTRY,
+    FIND_REGISTRY_ID,
+    FIND_REGISTRY_WITH_IDENTITIES,
+    IDENTITY_SNAPSHOT,
+    IDENTITY_SNAPSHOT_BASIC,
+    IDENTITY_SNAPSHOT_NFT_TYPE,
+    NFT_TYPE,
+    NFT_TYPES,
+    NFT_TYPES_AFTER,
+    NFT_TYPES_BEFORE,
+    NFT_TYPES_COUNT,
+    NFTS,
+    REGISTRY_IDENTITIES,
+    REGISTRY_IDENTITY_HISTORY,
+    REGISTRY_PARSE_BYTECODE,
+    TOKEN_CATEGORY_BASIC
+)
+
+
+class RegistryBlob(models.Model):
+    """
+    Content-addressed registry document, shared by all registries publishing the same file
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    contents = models.JSONField(null=True, blank=True)
+    # the downloaded bytes, null for documents carried over from before blobs existed
+    raw = models.BinaryField(null=True, blank=True)
+    size = models.PositiveIntegerField(default=0)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    @staticmethod
+    def store(sha256, contents, raw=None):
+        blob, created = RegistryBlob.objects.get_or_create(
+            sha256=sha256,
+            defaults={
+                'contents': contents,
+                'raw': raw,
+                'size': len(raw) if raw is not None else 0
+            }
+        )
+        if not created and blob.raw is None and raw is not None:
+            blob.raw = raw
+            blob.size = len(raw)
+            blob.save(update_fields=['raw', 'size'])
+        return blob
+
+    def verify(self):
+        """
+        Re-checks the stored bytes against the hash they are keyed by
+        """
+        if self.raw is None:
+            return False
+        return hashlib.sha256(bytes(self.raw)).hexdigest() == self.sha256
+
+    class Meta:
+        verbose_name_plural = 'Registry blobs'
+        indexes = [
+            GinIndex('contents', name='registryblob_contents_idx'),
+            models.Index(models.F("contents__identities"), name="registryblob_identities_idx"),
+        ]
 
 
 class Registry(models.Model):
@@ -13,7 +76,13 @@ class Registry(models.Model):
         on_delete=models.CASCADE,
         null=True
     )
-    contents = models.JSONField(null=True, blank=True)
+    blob = models.ForeignKey(
+        'RegistryBlob',
+        related_name='registries',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
     valid = models.BooleanField(default=False, db_index=True)
     op_return = models.TextField(default='')
     bcmr_url = models.TextField(default='')
@@ -21,49 +90,83 @@ class Registry(models.Model):
     validity_checks = models.JSONField(null=True, blank=True)
     allow_hash_mismatch = models.BooleanField(default=False)
     watch_for_changes = models.BooleanField(default=False)
+    watch_interval = models.PositiveIntegerField(null=True, blank=True)
+    watch_failures = models.PositiveIntegerField(default=0)
+    watch_next_check = models.DateTimeField(null=True, blank=True, db_index=True)
+    watch_last_checked = models.DateTimeField(null=True, blank=True)
+    watch_last_changed = models.DateTimeField(null=True, blank=True)
     date_created = models.DateTimeField(null=True, blank=True, db_index=True)
     generated_metadata = models.DateTimeField(null=True, blank=True, db_index=True)
 
-    def get_identities(self):
+    # the blob as loaded from the DB, to tell the saves that replace the document
+    _loaded_blob_id = None
+    blob_changed = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_blob_id = instance.__dict__.get('blob_id')
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_blob_id = self.__dict__.get('blob_id')
+
+    @property
+    def contents(self):
+        if self.blob_id:
+            return self.blob.contents
+
+    def save(self, *args, **kwargs):
+        # derived from the validity checks in the same write
+        if self.validity_checks:
+            self.valid = list(self.validity_checks.values()).count(True) == len(self.validity_checks.keys())
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'validity_checks' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'valid'}
+        # read by the post_save receivers
+        self.blob_changed = self.blob_id != self._loaded_blob_id
+        super().save(*args, **kwargs)
+        self._loaded_blob_id = self.blob_id
+
+    def get_categories(self):
+        """
+        Returns the authbases of the registry and the token categories of their snapshots
+        """
+        categories = set()
+        identities = (self.contents or {}).get('identities') or {}
+        for authbase, snapshots in identities.items():
+            categories.add(authbase)
+            for snapshot in (snapshots or {}).values():
+                category = ((snapshot or {}).get('token') or {}).get('category')
+                if category:
+                    categories.add(category)
+        return categories
 
-        query = f"""
-            SELECT id, 
-            jsonb_object_keys(contents->'identities') AS authbase 
-            FROM bcmr_main_registry WHERE id=%s;""" % self.id
-        
-        return [i.authbase for i in Registry.objects.raw(query)]
+    def get_identities(self):
+        return [i.authbase for i in REGISTRY_IDENTITIES.raw(Registry, [self.id])]
 
     def get_identity_history(self, authbase:str = None):
         """
         Returns history of specific authbase, or all identities if authbase (authbase) isn't provided.
         """
-        query = """
-            SELECT 
-                id, 
-                jsonb_object_keys(contents->'identities'->'%s') AS timestamp from bcmr_main_registry WHERE id=%s;
-        """ % (authbase, self.id)
-
         if authbase: 
             return {
-                authbase: [i.timestamp for i in Registry.objects.raw(query)]
+                authbase: [i.timestamp for i in REGISTRY_IDENTITY_HISTORY.raw(Registry, [authbase, self.id])]
             }
         
         histories = {}
     
         for authbase in self.get_identities():
-            histories[authbase] = [i.timestamp for i in Registry.objects.raw(query)]
+            histories[authbase] = [i.timestamp for i in REGISTRY_IDENTITY_HISTORY.raw(Registry, [authbase, self.id])]
     
         return histories
     
     def get_parse_bytecode(self, authbase:str, identity_history_timestamp: str):
-        query = f"""
-                    SELECT id, 
-                    jsonb_extract_path(contents, 'identities', '{authbase}', '{identity_history_timestamp}', 'token','category') AS category,
-                    jsonb_extract_path(contents, 'identities', '{authbase}', '{identity_history_timestamp}', 'token', 'nfts', 'parse', 'bytecode') AS bytecode 
-                    FROM bcmr_main_registry WHERE id = {self.id};
-                """
-        
-        r = Registry.objects.raw(query)
+        r = REGISTRY_PARSE_BYTECODE.raw(
+            Registry,
+            [authbase, identity_history_timestamp, authbase, identity_history_timestamp, self.id]
+        )
         if len(r) > 0:
             bytecode = r[0].bytecode
             if bytecode and type(bytecode) == str:
@@ -82,46 +185,7 @@ class Registry(models.Model):
         """
         Return the basic TokenCategory details
         """
-        query = """
-            SELECT 
-                id, 
-                authbase, 
-                identity_history, 
-                symbol,
-                decimals,
-                category
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS symbol,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimal') AS decimals,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history
-                ORDER BY identity_history DESC 
-            ) AS subquery
-            
-            WHERE category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC
-            LIMIT 1;
-        """ % (category, datetime.datetime.utcnow().isoformat())
-        r = Registry.objects.raw(query)
+        r = TOKEN_CATEGORY_BASIC.raw(Registry, [category, timezone.now()])
         if r:
             return {
                 'token': {
@@ -141,45 +205,7 @@ class Registry(models.Model):
         Return To
         """
 
-        query = """
-            SELECT 
-                id, 
-                authbase, 
-                identity_history, 
-                identity_snapshot,
-                category
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history) AS identity_snapshot,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history
-                ORDER BY identity_history DESC 
-            ) AS subquery
-            
-            WHERE category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC
-            LIMIT 1;
-        """ % (category, datetime.datetime.utcnow().isoformat())
-
-        r = Registry.objects.raw(query)
+        r = IDENTITY_SNAPSHOT.raw(Registry, [category, timezone.now()])
         if r:
             identity_snapshot = r[0].identity_snapshot
             if identity_snapshot:
@@ -199,61 +225,7 @@ class Registry(models.Model):
         Return To IdentitySnapshot of the particular NftType;s key. Where key is a commitment or bottomAltStackHex
         """
 
-        query = """
-            SELECT DISTINCT ON(nft_type_key) *
-            FROM (
-                SELECT 
-                    id,
-                    authbase,
-                    identity_history,
-                    nft_type_key,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'name') AS name,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'description') AS description,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'uris') AS uris,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'tags') AS tags,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'migrated') AS migrated,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'status') AS status,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'split_id') AS split_id,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'extensions') AS extensions,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS token_symbol,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS token_category,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimals') AS token_decimals,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'bytecode') AS nft_parse_bytecode,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'types', nft_type_key) AS nft_type
-
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                            THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS nft_type_key
-                    WHERE nft_type_key = '%s'
-            ) AS subquery
-            
-            WHERE category = '"%s"' and identity_history <= '%s' 
-            ORDER BY nft_type_key, identity_history DESC 
-        """ % (nft_type_key, category, datetime.datetime.utcnow().isoformat())
-
-
-        r = Registry.objects.raw(query)
+        r = IDENTITY_SNAPSHOT_NFT_TYPE.raw(Registry, [category, timezone.now(), nft_type_key])
         if r and r[0]:
             identity_snapshot_fields = [
                 'name',
@@ -280,7 +252,7 @@ class Registry(models.Model):
                     'parse': {
                         'bytecode': getattr(r[0], 'nft_parse_bytecode', None),
                         'types': {
-                            r[0].nft_type_key: json.loads(getattr(r[0], 'nft_type', None))
+                            nft_type_key: json.loads(getattr(r[0], 'nft_type', None))
                         }
                     }
                 }
@@ -294,7 +266,7 @@ class Registry(models.Model):
                     'category': category,
                     'authbase': r[0].authbase.replace('"',''),
                     'identity_history': r[0].identity_history.replace('"',''),
-                    'nft_type_key': r[0].nft_type_key,
+                    'nft_type_key': nft_type_key,
 
                 }
             }
@@ -306,64 +278,7 @@ class Registry(models.Model):
         The token field contains nfts.
         Omit <IdentitySnapshot, 'token'>
         """
-        query = """
-            SELECT 
-                id, 
-                authbase, 
-                identity_history, 
-                name,
-                description,
-                tags,
-                migrated,
-                status,
-                split_id,
-                uris,
-                extensions,
-                token_category,
-                token_symbol,
-                token_decimals,
-                token_nfts_parse_bytecode
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'name') AS name,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'description') AS description,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'tags') AS tags,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'migrated') AS migrated,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'status') AS status,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'splitId') AS split_id,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'uris') AS uris,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'extensions') AS extensions,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS token_category,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS token_symbol,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimals') AS token_decimals,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'bytecode') AS token_nfts_parse_bytecode
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history
-                ORDER BY identity_history DESC
-            ) AS subquery
-            
-            WHERE token_category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC
-            LIMIT 1;
-        """ % (category, datetime.datetime.utcnow().isoformat())
-        r = Registry.objects.raw(query)
+        r = IDENTITY_SNAPSHOT_BASIC.raw(Registry, [category, timezone.now()])
         if r:
             identity_snapshot = {
                 'name': json.loads(r[0].name or '""')
@@ -411,44 +326,7 @@ class Registry(models.Model):
         Returns the NftCategory
         """
         
-        query = """
-            SELECT 
-                id, 
-                category,
-                authbase, 
-                identity_history, 
-                nft_category
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history
-                ORDER BY identity_history DESC
-            ) AS subquery
-            
-            WHERE category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC
-            LIMIT 1;
-        """ % (category, datetime.datetime.utcnow().isoformat())
-        r = Registry.objects.raw(query)
+        r = NFTS.raw(Registry, [category, timezone.now()])
         if r:
             nft_category = r[0].nft_category
             if nft_category and type(nft_category) == str:
@@ -463,199 +341,51 @@ class Registry(models.Model):
                 }
             }
         
-    def _paginator(self, count, limit, offset, url):
-        if count == 0:
-            return {
-            'count': 0,
-            'limit': limit,
-            'offset': offset,
-            'previous': None,
-            'next': None
-            }
-        
-        previous_offset = None
-        next_offset = None
-        if offset > 0: 
-            previous_offset = offset - limit
-            previous_offset = 0 if offset < 0 or previous_offset < limit else previous_offset
-        if count > limit:
-            next_offset = offset + limit
-            next_offset = None if next_offset > count - 1 else next_offset
-        previous = None
-        if offset == 0 or offset > count:
-            previous = None
+    
+    def _get_nft_types_paginated(self, category, limit=10, offset=0, request_url='', cursor=None, before=None):
+        # one more type than asked for tells whether there is a page beyond this one
+        nft_types = self._get_nft_types(category, limit + 1, offset, cursor=cursor, before=before)
+        if before is not None:
+            has_previous = len(nft_types) > limit
+            nft_types = nft_types[len(nft_types) - limit:] if has_previous else nft_types
+            has_next = True
         else:
-            previous  = f'{url}?paginated=true&limit={limit}' if previous_offset == 0 or previous_offset == None else f'{url}?paginated=true&limit={limit}&offset={previous_offset}'
-        _next = f'{url}?paginated=true&limit={limit}&offset={next_offset}' if next_offset else None
-        return {
-            'count': count,
-            'limit': limit,
-            'offset': offset,
-            'previous': previous,
-            'next': _next
-        }
+            has_previous = cursor is not None or offset > 0
+            has_next = len(nft_types) > limit
+            nft_types = nft_types[:limit]
+
+        count = NFT_TYPES_COUNT.scalar([category, timezone.now()])
 
-    
-    def _get_nft_types_paginated(self, category, limit=10, offset=0, request_url=''):
-        query = """
-            SELECT
-                id, 
-                category,
-                authbase, 
-                identity_history, 
-                nft_category,
-                commitment,
-                nft,
-                results_count
-            FROM (
-                SELECT 
-                id, 
-                category,
-                authbase, 
-                identity_history, 
-                nft_category,
-                commitment,
-                nft,
-                COUNT(*) OVER() as results_count
-                FROM (
-                    SELECT DISTINCT ON(commitment)
-                        id, 
-                        category,
-                        authbase, 
-                        identity_history, 
-                        nft_category,
-                        commitment,
-                        nft
-                    FROM (
-                        SELECT
-                            id,
-                            authbase,
-                            identity_history,
-                            commitment,
-                            jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                            jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                            jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                        FROM
-                            bcmr_main_registry,
-                            jsonb_object_keys(
-                                CASE 
-                                    WHEN jsonb_typeof(contents->'identities') = 'object' 
-                                    THEN contents->'identities' 
-                                    ELSE '{}'::jsonb 
-                                END
-                            ) AS authbase,
-                            LATERAL jsonb_object_keys(
-                                CASE 
-                                    WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                                    THEN contents->'identities'->authbase 
-                                    ELSE '{}'::jsonb 
-                                END
-                            ) AS identity_history,                    
-                            LATERAL jsonb_object_keys(
-                                CASE 
-                                    WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                                    THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                                    ELSE '{}'::jsonb 
-                                END
-                            ) AS commitment                
-                        WHERE identity_history <= '%s'
-                        ORDER BY identity_history DESC
-                    ) AS subquery
-                    
-                    WHERE category = '"%s"'
-                    ORDER BY commitment DESC   
-                )AS unique_commitments
-                LIMIT %s OFFSET %s
-            ) AS result;
-
-            """ % (datetime.datetime.utcnow().isoformat(), category, limit, offset)
-        r = Registry.objects.raw(query)
         paginated = {
+            'count': count,
             'limit': limit,
             'offset': offset,
             'previous': None,
             'next': None,
-            'results': []
+            'results': nft_types
         }
-        
-        if r and r[0]:
-            paginated['count'] = r[0].results_count
-            paginated = { **paginated, **self._paginator(paginated['count'], limit, offset, request_url)}
-            
-        
-        for item in r:
-            nft_type = item.nft
-            commitment = item.commitment.replace('"','')
-            if nft_type and type(nft_type) == str:
-                nft_type = json.loads(nft_type)
-            paginated['results'].append({
-                commitment: nft_type,
-                '_meta': {
-                    'registry_id': item.id,
-                    'commitment': commitment,
-                    'category': item.category.replace('"',''),
-                    'authbase': item.authbase.replace('"',''),
-                    'identity_history': item.identity_history.replace('"','')
-                }
-            })
+        if nft_types:
+            # the pages on either side start from the type keys at the ends of this one,
+            # the same cost as the first page
+            url = f'{request_url}?paginated=true&limit={limit}'
+            if has_previous:
+                paginated['previous'] = f"{url}&before={quote(nft_types[0]['_meta']['commitment'], safe='')}"
+            if has_next:
+                paginated['next'] = f"{url}&cursor={quote(nft_types[-1]['_meta']['commitment'], safe='')}"
         return paginated
-    
-    def _get_nft_types(self, category, limit=10, offset=0):
+
+    def _get_nft_types(self, category, limit=10, offset=0, cursor=None, before=None):
         """
-        Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection
+        Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection,
+        by descending type key, starting after the cursor type key or ending before
+        the `before` type key if either is given
         """
-        # TODO: handle if registry does not contain NftCategory or NftType(s)
-        query = """
-            SELECT DISTINCT ON(commitment)
-                id, 
-                category,
-                authbase, 
-                identity_history, 
-                nft_category,
-                commitment,
-                nft
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    commitment,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history,                    
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                            THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS commitment                
-                WHERE identity_history <= '%s'
-                ORDER BY identity_history DESC
-            ) AS subquery
-            
-            WHERE category = '"%s"'
-            ORDER BY commitment DESC 
-            LIMIT %s OFFSET %s;
-        """ % (datetime.datetime.utcnow().isoformat(), category, limit, offset)
-
-        r = Registry.objects.raw(query)
+        if cursor is not None:
+            r = NFT_TYPES_AFTER.raw(Registry, [category, timezone.now(), cursor, limit])
+        elif before is not None:
+            r = NFT_TYPES_BEFORE.raw(Registry, [category, timezone.now(), before, limit])
+        else:
+            r = NFT_TYPES.raw(Registry, [category, timezone.now(), limit, offset])
         nft_types = []
         for item in r:
             nft_type = item.nft
@@ -673,71 +403,22 @@ class Registry(models.Model):
                 }
             })
         return nft_types
-    
-    def get_nft_types(self, category, limit=10, offset=0, paginated=False, request_url=''):
+
+    def get_nft_types(self, category, limit=10, offset=0, paginated=False, request_url='', cursor=None, before=None):
         if paginated:
-            return self._get_nft_types_paginated(category, limit, offset, request_url)
-        return self._get_nft_types(category, limit, offset)
+            return self._get_nft_types_paginated(category, limit, offset, request_url, cursor=cursor, before=before)
+        return self._get_nft_types(category, limit, offset, cursor=cursor, before=before)
 
-        
     
+
     def get_nft_type(self, category, commitment):
         """
         Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection
         """
-        # TODO: handle if registry does not contain NftCategory or NftType(s)
-        query = """
-            SELECT
-                id, 
-                category,
-                authbase, 
-                identity_history, 
-                commitment,
-                nft
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    commitment,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history,                    
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                            THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS commitment                
-                WHERE commitment = '%s'
-                ORDER BY identity_history DESC     
-            ) AS subquery
-            WHERE category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC
-            LIMIT 1;
-        """ % (commitment, category, datetime.datetime.utcnow().isoformat())
-
-        r = Registry.objects.raw(query)
+        r = NFT_TYPE.raw(Registry, [category, timezone.now(), commitment])
         if r:
             item = r[0]
             nft_type = item.nft
-            commitment = item.commitment.replace('"','')
             if nft_type and type(nft_type) == str:
                 nft_type = json.loads(nft_type)
             return {
@@ -753,41 +434,7 @@ class Registry(models.Model):
     
     @staticmethod
     def find_registry_id(category):
-        query = """
-            SELECT 
-                id, 
-                authbase, 
-                identity_history, 
-                category
-            FROM (
-                SELECT
-                    id,
-                    authbase,
-                    identity_history,
-                    jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                FROM
-                    bcmr_main_registry,
-                    jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities') = 'object' 
-                            THEN contents->'identities' 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS authbase,
-                    LATERAL jsonb_object_keys(
-                        CASE 
-                            WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                            THEN contents->'identities'->authbase 
-                            ELSE '{}'::jsonb 
-                        END
-                    ) AS identity_history              
-            ) AS subquery
-            WHERE category = '"%s"' and identity_history <= '%s'
-            ORDER BY id DESC 
-            LIMIT 1;
-        """ % (category, datetime.datetime.utcnow().isoformat())
-
-        r = Registry.objects.raw(query)
+        r = FIND_REGISTRY_ID.raw(Registry, [category, timezone.now()])
         if r:
             return {
                 'registry_id': r[0].id,
@@ -801,70 +448,8 @@ class Registry(models.Model):
     @staticmethod
     def find_registry(category, include_identities=False):
 
-        select_identities = "identities," if include_identities else ''
-
-        extract_identities = """
-        jsonb_extract_path(contents, 'identities') AS identities, 
-        """ if include_identities else ''
-
-        query = """
-        SELECT 
-            id, 
-            identity_history,
-            authbase,
-            schema,
-            version,
-            latest_revision,
-            registry_identity,
-            tags,
-            default_chain,
-            chains,
-            license,
-            locales,
-            extensions,
-            %s
-            category
-        FROM (
-            SELECT
-                id,
-                jsonb_extract_path(contents, '$schema') AS schema,
-                jsonb_extract_path(contents, 'version') AS version,
-                jsonb_extract_path(contents, 'latestRevision') AS latest_revision,
-                jsonb_extract_path(contents, 'registryIdentity') AS registry_identity,
-                jsonb_extract_path(contents, 'tags') AS tags,
-                jsonb_extract_path(contents, 'defaultChain') AS default_chain,
-                jsonb_extract_path(contents, 'chains') AS chains,
-                jsonb_extract_path(contents, 'license') AS license,
-                jsonb_extract_path(contents, 'locales') AS locales,
-                jsonb_extract_path(contents, 'extensions') AS extensions,
-                %s
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history              
-        ) AS subquery
-
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC 
-        LIMIT 1;
-        """ % (select_identities, extract_identities, category, datetime.datetime.utcnow().isoformat())
-
-        registry = Registry.objects.raw(query)
+        statement = FIND_REGISTRY_WITH_IDENTITIES if include_identities else FIND_REGISTRY
+        registry = statement.raw(Registry, [category, timezone.now()])
         if registry:
             bcmr = {key: value for key,value in registry[0].__dict__.items() if key in ['schema', 'version', 'latest_revision', 'registry_identity','tags','default_chain', 'chains', 'license', 'locales', 'extensions', 'identities']}
             bcmr = {key: json.loads(value) for key, value in bcmr.items() if value}
@@ -887,10 +472,6 @@ class Registry(models.Model):
     class Meta:
         verbose_name_plural = 'Registries'
         ordering = ('-date_created', )
-        indexes = [
-            GinIndex('contents', name='contents_idx'),
-            models.Index(models.F("contents__identities"), name="contents__identities_idx"),
-        ]
         unique_together = [
             'txid',
             'index',
@@ -0,0 +1,34 @@
+from django.db import models
+
+
+class ResponseDocument(models.Model):
+    """
+    Response body of an endpoint for a category, rendered when its registry is ingested
+    so that it can be sent out as is, see bcmr_main.materialize
+    """
+    kind = models.CharField(max_length=50)
+    category = models.CharField(max_length=100)
+    key = models.CharField(max_length=255, blank=True, default='')
+    registry = models.ForeignKey(
+        'Registry',
+        related_name='response_documents',
+        on_delete=models.CASCADE
+    )
+    body = models.BinaryField()
+    # precompressed variants of the body, see bcmr_main.compression
+    gzip_body = models.BinaryField(null=True, blank=True)
+    brotli_body = models.BinaryField(null=True, blank=True)
+    # ETag of the body, see bcmr_main.etags.get_document_etag()
+    etag = models.CharField(max_length=100, blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'Response documents'
+        unique_together = ('kind', 'category', 'key')
+
+    def get_variants(self):
+        """
+        Returns the stored compressed variants as a dict of content coding -> bytes
+        """
+        variants = {'gzip': self.gzip_body, 'br': self.brotli_body}
+        return {encoding: bytes(variant) for encoding, variant in variants.items() if variant is not None}
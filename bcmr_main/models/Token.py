@@ -26,6 +26,22 @@ class Token(models.Model):
     )
     date_created = models.DateTimeField(null=True, blank=True)
 
+    # is_nft as loaded from the DB, to tell the saves that change it
+    _loaded_is_nft = None
+    is_nft_changed = False
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_is_nft = instance.__dict__.get('is_nft')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # read by the post_save receivers
+        self.is_nft_changed = self.is_nft != self._loaded_is_nft
+        super().save(*args, **kwargs)
+        self._loaded_is_nft = self.is_nft
+
     class Meta:
         ordering = ('-id', )
         unique_together = (
@@ -33,6 +49,10 @@ class Token(models.Model):
             'commitment',
             'capability',
         )
+        indexes = [
+            # keyset pagination of the tokens of a category, see cts.pagination
+            models.Index(fields=['category', '-id'], name='token_category_id_idx'),
+        ]
 
     def __str__(self):
         fields = [self.category, self.commitment, self.capability]
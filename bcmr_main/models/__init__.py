@@ -3,4 +3,6 @@ from bcmr_main.models.Registry import *
 from bcmr_main.models.IdentityOutput import *
 from bcmr_main.models.Ownership import *
 from bcmr_main.models.BlockScan import *
-from bcmr_main.models.Queue import *
\ No newline at end of file
+from bcmr_main.models.Queue import *
+from bcmr_main.models.ResponseDocument import *
+from bcmr_main.models.IdentitySnapshot import *
@@ -1,14 +1,13 @@
 from bcmr_main.utils import *
-from django.db import transaction
 from bcmr_main.models import (
-    Registry
+    Registry,
+    RegistryBlob
 )
 from bcmr_main.app.BitcoinCashMetadataRegistry import BitcoinCashMetadataRegistry
 from jsonschema import ValidationError
-from json.decoder import JSONDecodeError
 from urllib.parse import urlparse
 import logging
-import copy
+import requests
 import json
 
 LOGGER = logging.getLogger(__name__)
@@ -21,103 +20,154 @@ def log_invalid_op_return(txid, encoded_bcmr_json_hash, hash_standards):
     LOGGER.error(f'COMPARED AGAINST: {str(hash_standards)}')
 
 
-def process_op_return(
-    txid,
-    index,
-    op_return,
-    publisher,
-    date
-):
-    with transaction.atomic():
-        op_return_split = op_return.split(' ')
-        encoded_bcmr_json_hash = op_return_split[2]
-        encoded_bcmr_url = op_return_split[3]
-
-        decoded_bcmr_json_hash = decode_str(encoded_bcmr_json_hash)
-        decoded_bcmr_url = decode_url(encoded_bcmr_url)
-
-        # Double checking of <BCMR> OP_RETURN code
-        if op_return.split(' ')[1] != '1380795202':
-            return False, decoded_bcmr_url 
-
-        registry_obj, _ = Registry.objects.update_or_create(
-            txid=txid,
-            index=index,
-            publisher=publisher
-        )
-
-        validity_checks = {
-            'bcmr_file_accessible': None,
-            'bcmr_hash_match': None,
-            'identities_match': None
-        }
-
-        parsed_url = urlparse(decoded_bcmr_url)
-        if parsed_url.scheme == 'https' and parsed_url.path == '':
-            if 'ipfs.nftstorage.link' not in decoded_bcmr_url:
-                decoded_bcmr_url = decoded_bcmr_url.rstrip('/') + '/.well-known/bitcoin-cash-metadata-registry.json'
-
-        registry_obj.date_created = date
-        registry_obj.op_return = op_return
-        registry_obj.bcmr_url = decoded_bcmr_url
-        registry_obj.validity_checks = validity_checks
-        registry_obj.save()
-        registry_obj.refresh_from_db()
-
-        print('--URL:', decoded_bcmr_url)
-
-        response = download_url(decoded_bcmr_url)
-        if not response:
+def _download_registry(url, allow_hash_mismatch, hashes, txid, blob_id=None):
+    """
+    Downloads and checks the BCMR published in an OP_RETURN.
+    Returns the validity checks and the registry fields to be saved, without touching the DB.
+    The blob is only among the fields if the document differs from `blob_id`, the stored one.
+    """
+    validity_checks = {
+        'bcmr_file_accessible': None,
+        'bcmr_hash_match': None,
+        'identities_match': None
+    }
+    fields = {}
+
+    response = download_url(url)
+    if not response:
+        if response is not None:
+            response.close()
+        validity_checks['bcmr_file_accessible'] = False
+        return validity_checks, fields
+
+    status_code = response.status_code
+    fields['bcmr_request_status'] = status_code
+
+    validity_checks['bcmr_file_accessible'] = status_code == 200
+    proceed = False
+    if status_code == 200:
+        try:
+            content, encoded_response_json_hash = read_response(response)
+        except (ResponseTooLarge, requests.exceptions.RequestException) as exc:
+            LOGGER.info(f'Unable to read BCMR --- {url} - {exc}')
+            content = None
             validity_checks['bcmr_file_accessible'] = False
-            registry_obj.validity_checks = validity_checks
-            registry_obj.save()
-            registry_obj.refresh_from_db()
-
-            return False, decoded_bcmr_url
 
-        status_code = response.status_code
-        
-        registry_obj.bcmr_request_status = status_code
+        # parse once, the same object is used for validation and storage
         contents = None
-
-        validity_checks['bcmr_file_accessible'] = status_code == 200
-        proceed = False
-        if status_code == 200:
-            if registry_obj.allow_hash_mismatch:
+        if content is not None:
+            try:
+                contents = json.loads(content)
+            except ValueError:
+                pass
+
+        if content is None:
+            proceed = False
+        elif allow_hash_mismatch:
+            proceed = True
+        else:
+            # if (
+            #     decoded_bcmr_json_hash == encoded_response_json_hash or  # bitcats (encoded before being hashed)
+            #     encoded_bcmr_json_hash == encoded_response_json_hash     # matthieu wallet (simple hash of BCMR json, no prior encoding)
+            # ):
+            if encoded_response_json_hash in hashes:
+                validity_checks['bcmr_hash_match'] = True
                 proceed = True
             else:
-                encoded_response_json_hash = encode_str(response.text)
-                # if (
-                #     decoded_bcmr_json_hash == encoded_response_json_hash or  # bitcats (encoded before being hashed)
-                #     encoded_bcmr_json_hash == encoded_response_json_hash     # matthieu wallet (simple hash of BCMR json, no prior encoding)
-                # ):
-                if encoded_response_json_hash in [decoded_bcmr_json_hash, encoded_bcmr_json_hash]:
-                    validity_checks['bcmr_hash_match'] = True
-                    proceed = True
-                else:
-                    validity_checks['bcmr_hash_match'] = False
-                    proceed = False
-                    log_invalid_op_return(txid, encoded_response_json_hash, [decoded_bcmr_json_hash, encoded_bcmr_json_hash])
-                
+                validity_checks['bcmr_hash_match'] = False
+                proceed = False
+                log_invalid_op_return(txid, encoded_response_json_hash, hashes)
+            
+            if contents is None:
+                validity_checks['bcmr_format_valid'] = False
+                proceed = False
+            else:
                 try:
-                    BitcoinCashMetadataRegistry.validate_contents(response.text)
+                    BitcoinCashMetadataRegistry.validate_contents(contents, sha256=encoded_response_json_hash)
                     validity_checks['bcmr_format_valid'] = True
                     proceed = True
-                except (JSONDecodeError, ValidationError):
+                except ValidationError:
                     validity_checks['bcmr_format_valid'] = False
                     proceed = False
 
-            if proceed:
-                try:
-                    LOGGER.info(f'Saving content for registry ID # {registry_obj.id}')
-                    contents = copy.deepcopy(response.text)
-                    registry_obj.contents = json.loads(contents)
-                except json.decoder.JSONDecodeError:
-                    pass
-        else:
-            LOGGER.info(f'Something\'s wrong in fetching BCMR --- {decoded_bcmr_url} - {status_code}')
+        if proceed and contents is not None and encoded_response_json_hash == blob_id:
+            LOGGER.info(f'Content unchanged at {url}')
+        elif proceed and contents is not None:
+            LOGGER.info(f'Saving content from {url}')
+            fields['blob'] = RegistryBlob.store(encoded_response_json_hash, contents, raw=content)
+    else:
+        response.close()
+        LOGGER.info(f'Something\'s wrong in fetching BCMR --- {url} - {status_code}')
+
+    return validity_checks, fields
+
+
+def process_op_return(
+    txid,
+    index,
+    op_return,
+    publisher,
+    date
+):
+    op_return_split = op_return.split(' ')
+    encoded_bcmr_json_hash = op_return_split[2]
+    encoded_bcmr_url = op_return_split[3]
+
+    decoded_bcmr_json_hash = decode_str(encoded_bcmr_json_hash)
+    decoded_bcmr_url = decode_url(encoded_bcmr_url)
+
+    # Double checking of <BCMR> OP_RETURN code
+    if op_return.split(' ')[1] != '1380795202':
+        return False, decoded_bcmr_url 
+
+    parsed_url = urlparse(decoded_bcmr_url)
+    if parsed_url.scheme == 'https' and parsed_url.path == '':
+        if 'ipfs.nftstorage.link' not in decoded_bcmr_url:
+            decoded_bcmr_url = decoded_bcmr_url.rstrip('/') + '/.well-known/bitcoin-cash-metadata-registry.json'
+
+    print('--URL:', decoded_bcmr_url)
+
+    lookup = {
+        'txid': txid,
+        'index': index,
+        'publisher': publisher
+    }
+    registry = Registry.objects.filter(**lookup).first()
+
+    # the download happens outside of any transaction, everything is then saved in one write
+    validity_checks, fields = _download_registry(
+        decoded_bcmr_url,
+        registry.allow_hash_mismatch if registry else None,
+        [decoded_bcmr_json_hash, encoded_bcmr_json_hash],
+        txid,
+        blob_id=registry.blob_id if registry else None
+    )
+
+    if registry and 'blob' not in fields:
+        # same document as the stored one, or none at all: the blob is left as it is
+        registry.date_created = date
+        registry.op_return = op_return
+        registry.bcmr_url = decoded_bcmr_url
+        registry.validity_checks = validity_checks
+        update_fields = ['date_created', 'op_return', 'bcmr_url', 'validity_checks']
+        if 'bcmr_request_status' in fields:
+            registry.bcmr_request_status = fields['bcmr_request_status']
+            update_fields.append('bcmr_request_status')
+        registry.save(update_fields=update_fields)
+    else:
+        Registry.objects.update_or_create(
+            **lookup,
+            defaults={
+                **fields,
+                'date_created': date,
+                'op_return': op_return,
+                'bcmr_url': decoded_bcmr_url,
+                'validity_checks': validity_checks
+            }
+        )
 
-        registry_obj.validity_checks = validity_checks
-        registry_obj.save(force_update=True)
+    # no response at all
+    if 'bcmr_request_status' not in fields:
+        return False, decoded_bcmr_url
 
     return validity_checks, decoded_bcmr_url
@@ -0,0 +1,416 @@
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+import logging
+import random
+import time
+import re
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Query:
+    """
+    Raw SQL with %s placeholders, defined once and run as a server-side prepared statement.
+
+    The statement is prepared with PREPARE the first time it runs on a database connection
+    and then executed with EXECUTE, so Postgres parses it once per connection and can reuse
+    its plan. If it cannot be prepared (DATABASE_PREPARED_STATEMENTS off, or a connection
+    pooler that does not keep sessions) the SQL is run as is with bound parameters.
+
+    A QUERY_PLANNING_SAMPLE_RATE fraction of the executions also runs EXPLAIN (SUMMARY) and
+    logs the planning and execution time.
+    """
+
+    def __init__(self, name, sql, types):
+        self.name = f'bcmr_{name}'
+        self.sql = sql
+        # postgres types of the parameters, in order
+        self.types = types
+
+    def _prepared_statements(self):
+        # the statements live as long as the underlying connection,
+        # which persists across requests with CONN_MAX_AGE
+        connection.ensure_connection()
+        prepared = getattr(connection, 'prepared_statements', None)
+        if prepared is None or prepared[0] is not connection.connection:
+            prepared = (connection.connection, {})
+            connection.prepared_statements = prepared
+        return prepared[1]
+
+    def get_prepare_sql(self):
+        # %s placeholders become $1, $2, ...
+        placeholders = iter(range(1, len(self.types) + 1))
+        sql = re.sub(r'%s', lambda match: f'${next(placeholders)}', self.sql)
+        return f'PREPARE {self.name} ({", ".join(self.types)}) AS {sql}'
+
+    def prepare(self):
+        """
+        Returns True if the statement is prepared on the current connection
+        """
+        if not settings.DATABASE_PREPARED_STATEMENTS:
+            return False
+
+        prepared = self._prepared_statements()
+        if self.name not in prepared:
+            try:
+                # a failed PREPARE must not abort the surrounding transaction
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(self.get_prepare_sql())
+                prepared[self.name] = True
+            except DatabaseError as exc:
+                LOGGER.warning(f'Unable to prepare {self.name}, running it unprepared: {exc}')
+                prepared[self.name] = False
+        return prepared[self.name]
+
+    def get_sql(self):
+        if self.prepare():
+            return f'EXECUTE {self.name}({", ".join(["%s"] * len(self.types))})'
+        return self.sql
+
+    def _explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (SUMMARY) {sql}', params)
+            plan = [row[0] for row in cursor.fetchall()]
+        return next((line.strip() for line in plan if line.strip().startswith('Planning Time')), None)
+
+    def _execute(self, sql, params, execute):
+        if random.random() >= settings.QUERY_PLANNING_SAMPLE_RATE:
+            return execute()
+
+        planning = self._explain(sql, params)
+        started = time.perf_counter()
+        result = execute()
+        elapsed = (time.perf_counter() - started) * 1000
+        LOGGER.info(f'{self.name}: {planning}, execution {elapsed:.2f} ms, prepared: {sql != self.sql}')
+        return result
+
+    def raw(self, model, params):
+        """
+        Returns the rows as a list of model instances, see Manager.raw()
+        """
+        sql = self.get_sql()
+        return self._execute(sql, params, lambda: list(model.objects.raw(sql, params)))
+
+    def scalar(self, params):
+        """
+        Returns the first column of the first row
+        """
+        sql = self.get_sql()
+
+        def execute():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        return self._execute(sql, params, execute)
+
+
+# the identity snapshots with their JSON out of the registry document, see IdentitySnapshot
+SNAPSHOT_CONTENTS = """
+    bcmr_main_identitysnapshot AS snapshot
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = snapshot.blob_id,
+        LATERAL jsonb_extract_path(contents, 'identities', snapshot.authbase, snapshot.identity_history) AS identity_snapshot
+"""
+# the snapshots of a token category that have become active, through the (category, timestamp) index
+IS_ACTIVE_SNAPSHOT = "snapshot.category = %s AND snapshot.timestamp <= %s"
+# the latest active snapshot, out of the latest registry
+LATEST_SNAPSHOT = "ORDER BY snapshot.registry_id DESC, snapshot.timestamp DESC LIMIT 1"
+SNAPSHOT_TYPES = ['varchar', 'timestamptz']
+
+# the NftType rows with their snapshot, selected without touching the registry document
+NFT_TYPE_ROWS = """
+    bcmr_main_nfttype AS nft_type
+        JOIN bcmr_main_identitysnapshot AS snapshot ON snapshot.id = nft_type.snapshot_id
+"""
+NFT_TYPE_COLUMNS = """
+    snapshot.registry_id,
+    snapshot.blob_id,
+    snapshot.authbase,
+    snapshot.identity_history,
+    nft_type.category,
+    nft_type.type_key
+"""
+# the types of a token category in snapshots that have become active, through the (category, type_key) index
+IS_ACTIVE_NFT_TYPE = "nft_type.category = %s AND snapshot.timestamp <= %s"
+# the JSON of the types selected into a nft_types subquery of NFT_TYPE_COLUMNS, joined with
+# the registry blob afterwards so that only the rows that made it into the result read it
+NFT_TYPE_CONTENTS = """
+    SELECT
+        nft_types.registry_id AS id,
+        nft_types.authbase,
+        nft_types.identity_history,
+        nft_types.category,
+        nft_types.type_key AS commitment,
+        jsonb_extract_path(
+            contents, 'identities', nft_types.authbase, nft_types.identity_history,
+            'token', 'nfts', 'parse', 'types', nft_types.type_key
+        ) AS nft
+"""
+
+
+TOKEN_CATEGORY_BASIC = Query('token_category_basic', f"""
+    SELECT
+        snapshot.registry_id AS id,
+        snapshot.authbase,
+        snapshot.identity_history,
+        identity_snapshot->'token'->'symbol' AS symbol,
+        identity_snapshot->'token'->'decimal' AS decimals,
+        identity_snapshot->'token'->'category' AS category
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+# TOKEN_CATEGORY_BASIC of an array of categories, one row per category that has an active snapshot
+TOKEN_CATEGORY_BASIC_MANY = Query('token_category_basic_many', f"""
+    SELECT
+        snapshots.registry_id AS id,
+        snapshots.category AS snapshot_category,
+        snapshots.authbase,
+        snapshots.identity_history,
+        identity_snapshot->'token'->'symbol' AS symbol,
+        identity_snapshot->'token'->'decimal' AS decimals,
+        identity_snapshot->'token'->'category' AS category
+    FROM (
+        SELECT DISTINCT ON(snapshot.category)
+            snapshot.registry_id,
+            snapshot.blob_id,
+            snapshot.category,
+            snapshot.authbase,
+            snapshot.identity_history
+        FROM bcmr_main_identitysnapshot AS snapshot
+        WHERE snapshot.category = ANY(%s) AND snapshot.timestamp <= %s
+        ORDER BY snapshot.category, snapshot.registry_id DESC, snapshot.timestamp DESC
+    ) AS snapshots
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = snapshots.blob_id,
+        LATERAL jsonb_extract_path(contents, 'identities', snapshots.authbase, snapshots.identity_history) AS identity_snapshot
+""", ['varchar[]', 'timestamptz'])
+
+IDENTITY_SNAPSHOT = Query('identity_snapshot', f"""
+    SELECT
+        snapshot.registry_id AS id,
+        snapshot.authbase,
+        snapshot.identity_history,
+        identity_snapshot,
+        identity_snapshot->'token'->'category' AS category
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+IDENTITY_SNAPSHOT_NFT_TYPE = Query('identity_snapshot_nft_type', f"""
+    SELECT
+        nft_types.registry_id AS id,
+        nft_types.authbase,
+        nft_types.identity_history,
+        identity_snapshot->'name' AS name,
+        identity_snapshot->'description' AS description,
+        identity_snapshot->'uris' AS uris,
+        identity_snapshot->'tags' AS tags,
+        identity_snapshot->'migrated' AS migrated,
+        identity_snapshot->'status' AS status,
+        identity_snapshot->'split_id' AS split_id,
+        identity_snapshot->'extensions' AS extensions,
+        identity_snapshot->'token'->'symbol' AS token_symbol,
+        identity_snapshot->'token'->'category' AS token_category,
+        identity_snapshot->'token'->'decimals' AS token_decimals,
+        identity_snapshot->'token'->'category' AS category,
+        identity_snapshot->'token'->'nfts'->'parse'->'bytecode' AS nft_parse_bytecode,
+        identity_snapshot->'token'->'nfts'->'parse'->'types'->nft_types.type_key AS nft_type
+    FROM (
+        SELECT
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+        WHERE {IS_ACTIVE_NFT_TYPE} AND nft_type.type_key = %s
+        ORDER BY snapshot.registry_id DESC, snapshot.timestamp DESC
+        LIMIT 1
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id,
+        LATERAL jsonb_extract_path(contents, 'identities', nft_types.authbase, nft_types.identity_history) AS identity_snapshot
+""", SNAPSHOT_TYPES + ['varchar'])
+
+IDENTITY_SNAPSHOT_BASIC = Query('identity_snapshot_basic', f"""
+    SELECT
+        snapshot.registry_id AS id,
+        snapshot.authbase,
+        snapshot.identity_history,
+        identity_snapshot->'name' AS name,
+        identity_snapshot->'description' AS description,
+        identity_snapshot->'tags' AS tags,
+        identity_snapshot->'migrated' AS migrated,
+        identity_snapshot->'status' AS status,
+        identity_snapshot->'splitId' AS split_id,
+        identity_snapshot->'uris' AS uris,
+        identity_snapshot->'extensions' AS extensions,
+        identity_snapshot->'token'->'category' AS token_category,
+        identity_snapshot->'token'->'symbol' AS token_symbol,
+        identity_snapshot->'token'->'decimals' AS token_decimals,
+        identity_snapshot->'token'->'nfts'->'parse'->'bytecode' AS token_nfts_parse_bytecode
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+NFTS = Query('nfts', f"""
+    SELECT
+        snapshot.registry_id AS id,
+        snapshot.authbase,
+        snapshot.identity_history,
+        identity_snapshot->'token'->'category' AS category,
+        identity_snapshot->'token'->'nfts' AS nft_category
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+NFT_TYPES = Query('nft_types', f"""
+    {NFT_TYPE_CONTENTS}
+    FROM (
+        SELECT DISTINCT ON(nft_type.type_key)
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+        WHERE {IS_ACTIVE_NFT_TYPE}
+        ORDER BY nft_type.type_key DESC, snapshot.registry_id DESC, snapshot.timestamp DESC
+        LIMIT %s OFFSET %s
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id
+    ORDER BY nft_types.type_key DESC
+""", SNAPSHOT_TYPES + ['bigint', 'bigint'])
+
+# keyset pagination, the types after the cursor type key
+NFT_TYPES_AFTER = Query('nft_types_after', f"""
+    {NFT_TYPE_CONTENTS}
+    FROM (
+        SELECT DISTINCT ON(nft_type.type_key)
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+        WHERE {IS_ACTIVE_NFT_TYPE} AND nft_type.type_key < %s
+        ORDER BY nft_type.type_key DESC, snapshot.registry_id DESC, snapshot.timestamp DESC
+        LIMIT %s
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id
+    ORDER BY nft_types.type_key DESC
+""", SNAPSHOT_TYPES + ['varchar', 'bigint'])
+
+# keyset pagination backwards, the types before the cursor type key
+NFT_TYPES_BEFORE = Query('nft_types_before', f"""
+    {NFT_TYPE_CONTENTS}
+    FROM (
+        SELECT DISTINCT ON(nft_type.type_key)
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+        WHERE {IS_ACTIVE_NFT_TYPE} AND nft_type.type_key > %s
+        ORDER BY nft_type.type_key ASC, snapshot.registry_id DESC, snapshot.timestamp DESC
+        LIMIT %s
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id
+    ORDER BY nft_types.type_key DESC
+""", SNAPSHOT_TYPES + ['varchar', 'bigint'])
+
+NFT_TYPES_COUNT = Query('nft_types_count', f"""
+    SELECT COUNT(DISTINCT nft_type.type_key)
+    FROM {NFT_TYPE_ROWS}
+    WHERE {IS_ACTIVE_NFT_TYPE}
+""", SNAPSHOT_TYPES)
+
+NFT_TYPE = Query('nft_type', f"""
+    {NFT_TYPE_CONTENTS}
+    FROM (
+        SELECT
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+        WHERE {IS_ACTIVE_NFT_TYPE} AND nft_type.type_key = %s
+        ORDER BY snapshot.registry_id DESC, snapshot.timestamp DESC
+        LIMIT 1
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id
+""", SNAPSHOT_TYPES + ['varchar'])
+
+# NFT_TYPE of two parallel arrays of categories and type keys, one row per pair that has an active type
+NFT_TYPE_MANY = Query('nft_type_many', f"""
+    {NFT_TYPE_CONTENTS}
+    FROM (
+        SELECT DISTINCT ON(nft_type.category, nft_type.type_key)
+            {NFT_TYPE_COLUMNS}
+        FROM {NFT_TYPE_ROWS}
+            JOIN unnest(%s, %s) AS wanted(category, type_key)
+                ON wanted.category = nft_type.category AND wanted.type_key = nft_type.type_key
+        WHERE snapshot.timestamp <= %s
+        ORDER BY nft_type.category, nft_type.type_key, snapshot.registry_id DESC, snapshot.timestamp DESC
+    ) AS nft_types
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = nft_types.blob_id
+""", ['varchar[]', 'varchar[]', 'timestamptz'])
+
+FIND_REGISTRY_ID = Query('find_registry_id', f"""
+    SELECT
+        snapshot.registry_id AS id,
+        snapshot.authbase,
+        snapshot.identity_history,
+        identity_snapshot->'token'->'category' AS category
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+REGISTRY_COLUMNS = """
+    snapshot.registry_id AS id,
+    snapshot.identity_history,
+    snapshot.authbase,
+    contents->'$schema' AS schema,
+    contents->'version' AS version,
+    contents->'latestRevision' AS latest_revision,
+    contents->'registryIdentity' AS registry_identity,
+    contents->'tags' AS tags,
+    contents->'defaultChain' AS default_chain,
+    contents->'chains' AS chains,
+    contents->'license' AS license,
+    contents->'locales' AS locales,
+    contents->'extensions' AS extensions,
+    identity_snapshot->'token'->'category' AS category
+"""
+
+FIND_REGISTRY = Query('find_registry', f"""
+    SELECT {REGISTRY_COLUMNS}
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+FIND_REGISTRY_WITH_IDENTITIES = Query('find_registry_with_identities', f"""
+    SELECT
+        {REGISTRY_COLUMNS},
+        contents->'identities' AS identities
+    FROM {SNAPSHOT_CONTENTS}
+    WHERE {IS_ACTIVE_SNAPSHOT}
+    {LATEST_SNAPSHOT}
+""", SNAPSHOT_TYPES)
+
+REGISTRY_IDENTITIES = Query('registry_identities', """
+    SELECT
+        id,
+        jsonb_object_keys(contents->'identities') AS authbase
+    FROM bcmr_main_registry
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = bcmr_main_registry.blob_id
+    WHERE id = %s
+""", ['bigint'])
+
+REGISTRY_IDENTITY_HISTORY = Query('registry_identity_history', """
+    SELECT
+        id,
+        jsonb_object_keys(contents->'identities'->%s) AS timestamp
+    FROM bcmr_main_registry
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = bcmr_main_registry.blob_id
+    WHERE id = %s
+""", ['text', 'bigint'])
+
+REGISTRY_PARSE_BYTECODE = Query('registry_parse_bytecode', """
+    SELECT
+        id,
+        jsonb_extract_path(contents, 'identities', %s, %s, 'token', 'category') AS category,
+        jsonb_extract_path(contents, 'identities', %s, %s, 'token', 'nfts', 'parse', 'bytecode') AS bytecode
+    FROM bcmr_main_registry
+        JOIN bcmr_main_registryblob ON bcmr_main_registryblob.sha256 = bcmr_main_registry.blob_id
+    WHERE id = %s
+""", ['text', 'text', 'text', 'text', 'bigint'])
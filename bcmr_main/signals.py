@@ -1,51 +1,66 @@
-import redis 
-from decouple import config
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from bcmr_main.tasks import resolve_metadata
-from bcmr_main.op_return import process_op_return
-from bcmr_main.models import Registry, Token, TokenMetadata
-
-@receiver(post_save, sender=Registry)
-def validate_registry(sender, instance=None, created=False, **kwargs):
-    if instance.validity_checks:
-        validity_checks = instance.validity_checks
-        is_valid = list(validity_checks.values()).count(True) == len(validity_checks.keys())
-        Registry.objects.filter(id=instance.id).update(valid=is_valid)
-
+from django.db import transaction
+from bcmr_main.bloom import REGISTRY_CATEGORIES, TOKEN_CATEGORIES, add_known
+from bcmr_main.cache import invalidate_categories_on_commit
+from bcmr_main.metadata import mark_metadata_dirty
+from bcmr_main.materialize import token_documents_outdated
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents
+from bcmr_main.models import IdentitySnapshot, Registry, Token
 
 @receiver(post_save, sender=Token)
 def generate_metadata(sender, instance=None, created=False, **kwargs):
-    try:
-        metadata = TokenMetadata.objects.filter(token__category=instance.category).latest('id')
-        registry = metadata.registry
-        if registry.watch_for_changes:
-            process_op_return(
-                registry.txid,
-                registry.index,
-                registry.op_return,
-                registry.publisher,
-                registry.date_created
-            )
-        resolve_metadata.delay(registry.id, instance.commitment)
-    except TokenMetadata.DoesNotExist:
-            pass
+    # regenerated by regenerate_dirty_metadata once the category has been quiet for a while
+    category = instance.category
+    # only the type metadata of a new or changed NFT is regenerated
+    commitment = instance.commitment if instance.is_nft else None
+    transaction.on_commit(lambda: mark_metadata_dirty(category, commitment))
+    if created:
+        transaction.on_commit(lambda: add_known(TOKEN_CATEGORIES, [category]))
+        # the responses cached while the category had no tokens, or fewer of them
+        invalidate_categories_on_commit([category])
+    # the token documents carry whether the category has tokens and the is_nft of the latest one
+    if token_documents_outdated(instance, created):
+        transaction.on_commit(lambda: materialize_token_documents.delay(category))
     
 @receiver(post_save, sender=Registry, dispatch_uid='clear_cache')
-def clear_cache(sender, instance=None, created=False, **kwargs):
-    
-    categories = set()
-    if created and instance.contents:
-        authbases = list((instance.contents.get('identities') or {}).keys())
-        for a in authbases:
-            timestamps = list((instance.contents.get('identities').get(a) or {}).keys())
-            for t in timestamps:
-                category = (instance.contents.get('identities').get(a).get(t).get('token') or {}).get('category')
-                if category:
-                    categories.add(category)
-    
-    client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-    for c in categories:
-        keys = client.keys(f'registry:token:{c}:*')
-        keys += client.keys(f'metadata:token:{c}:*')
-        client.delete(*keys)
+def clear_cache(sender, instance=None, created=False, update_fields=None, **kwargs):
+    # only a new or replaced registry document changes what is cached
+    if update_fields and 'blob' not in update_fields:
+        return
+    if not instance.blob_changed:
+        return
+    if not instance.blob_id:
+        return
+
+    # the registry endpoints are keyed by authbase, the others by token category
+    categories = instance.get_categories()
+    invalidate_categories_on_commit(categories)
+    transaction.on_commit(lambda: add_known(REGISTRY_CATEGORIES, categories))
+
+
+@receiver(post_save, sender=Registry, dispatch_uid='index_identity_snapshots')
+def index_identity_snapshots(sender, instance=None, created=False, update_fields=None, **kwargs):
+    if update_fields and 'blob' not in update_fields:
+        return
+    # the rows of an unchanged document are kept as they are
+    if not instance.blob_changed:
+        return
+    if not instance.blob_id:
+        return
+
+    # in the same transaction as the registry, the cts endpoints read from these rows
+    IdentitySnapshot.index(instance)
+
+
+@receiver(post_save, sender=Registry, dispatch_uid='materialize_documents')
+def materialize_documents(sender, instance=None, created=False, update_fields=None, **kwargs):
+    if update_fields and 'blob' not in update_fields:
+        return
+    if not instance.blob_changed:
+        return
+    if not instance.blob_id:
+        return
+
+    registry_id = instance.id
+    transaction.on_commit(lambda: materialize_registry_documents.delay(registry_id))
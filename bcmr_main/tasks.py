@@ -4,12 +4,14 @@ import requests
 import simplejson as json
 from django.db.models import Q
 from django.conf import settings
-from bcmr_main.metadata import generate_token_metadata
+from bcmr_main.metadata import generate_token_metadata, pop_dirty_categories
 from celery import shared_task
 from bcmr_main.op_return import *
 from bcmr_main.bchn import BCHN
 from bcmr_main.models import *
 from bcmr_main.utils import timestamp_to_date
+from bcmr_main.watcher import claim_due_registries, schedule_next_watch
+from bcmr_main.materialize import materialize_registry, pop_activated_registries
 
 
 LOGGER = logging.getLogger(__name__)
@@ -321,16 +323,67 @@ def recheck_unconfirmed_txn_details():
 
 
 @shared_task(queue='resolve_metadata')
-def resolve_metadata(registry_id=None, commitment=None):
+def resolve_metadata(registry_id=None, commitment=None, commitments=None):
     if registry_id:
         registries = Registry.objects.filter(id=registry_id)
     else:
         registries = Registry.objects.filter(generated_metadata__isnull=True).order_by('date_created')
     for registry in registries:
         LOGGER.info(f'GENERATING METADATA FOR REGISRTY ID #{registry.id}')
-        generate_token_metadata(registry, commitment)
+        generate_token_metadata(registry, commitment, commitments=commitments)
         registry.generated_metadata = timezone.now()
-        registry.save()
+        registry.save(update_fields=['generated_metadata'])
+
+
+@shared_task(queue='resolve_metadata')
+def regenerate_dirty_metadata(force=False):
+    categories = pop_dirty_categories(force=force)
+    # registry ID -> the NFT commitments to regenerate, None for all of them
+    registries = {}
+    for category, commitments in categories.items():
+        try:
+            metadata = TokenMetadata.objects.filter(token__category=category).latest('id')
+        except TokenMetadata.DoesNotExist:
+            continue
+        if commitments is None or registries.get(metadata.registry_id, []) is None:
+            registries[metadata.registry_id] = None
+        else:
+            registries[metadata.registry_id] = sorted(set(registries.get(metadata.registry_id, [])) | set(commitments))
+
+    # the registries are not downloaded again, the watcher polls those that can change
+    if categories:
+        LOGGER.info(f'REGENERATING METADATA OF {len(registries)} REGISTRIES FOR {len(categories)} CATEGORIES')
+    for registry_id, commitments in registries.items():
+        if commitments is None:
+            resolve_metadata.delay(registry_id)
+        else:
+            resolve_metadata.delay(registry_id, commitments=commitments)
+
+
+@shared_task(queue='resolve_metadata')
+def materialize_registry_documents(registry_id):
+    try:
+        registry = Registry.objects.select_related('blob').get(id=registry_id)
+    except Registry.DoesNotExist:
+        return
+    materialize_registry(registry)
+
+
+@shared_task(queue='resolve_metadata')
+def materialize_token_documents(category):
+    # TokenView reads the category from the latest registry with identities under it
+    registry = Registry.objects.select_related('blob').filter(
+        blob__contents__identities__has_key=category
+    ).order_by('-id').first()
+    if registry:
+        materialize_registry(registry, categories=[category], kinds=['token'])
+
+
+@shared_task(queue='resolve_metadata')
+def materialize_activated_snapshots():
+    for registry_id in pop_activated_registries():
+        LOGGER.info(f'IDENTITY SNAPSHOT ACTIVATED IN REGISTRY ID #{registry_id}')
+        materialize_registry_documents.delay(registry_id)
 
 
 def _get_spender_tx(txid, index):
@@ -373,12 +426,32 @@ def retrace_authchain(token_id):
 
 @shared_task(queue='watch_registry_changes')
 def watch_registry_changes():
-    registries = Registry.objects.filter(watch_for_changes=True)
-    for registry in registries:
-        process_op_return(
-            registry.txid,
-            registry.index,
-            registry.op_return,
-            registry.publisher,
-            registry.date_created
-        )
+    registry_ids = claim_due_registries()
+    if registry_ids:
+        LOGGER.info(f'DISPATCHING {len(registry_ids)} WATCHED REGISTRIES')
+    for registry_id in registry_ids:
+        watch_registry.delay(registry_id)
+
+
+@shared_task(queue='watch_registry_changes')
+def watch_registry(registry_id):
+    try:
+        registry = Registry.objects.get(id=registry_id, watch_for_changes=True)
+    except Registry.DoesNotExist:
+        return
+
+    previous_blob = registry.blob_id
+    validity_checks, _ = process_op_return(
+        registry.txid,
+        registry.index,
+        registry.op_return,
+        registry.publisher,
+        registry.date_created
+    )
+    registry.refresh_from_db()
+
+    failed = not validity_checks or not validity_checks.get('bcmr_file_accessible')
+    changed = not failed and registry.blob_id != previous_blob
+    schedule_next_watch(registry, changed=changed, failed=failed)
+    if changed:
+        resolve_metadata.delay(registry.id)
@@ -0,0 +1,65 @@
+import fakeredis
+import pytest
+
+
+class StreamedResponse:
+    """
+    The parts of a streamed requests.Response that downloads are read through
+    """
+
+    def __init__(self, body, headers=None, status_code=200, url='https://example.com/registry.json'):
+        self.body = body
+        self.headers = headers or {}
+        self.status_code = status_code
+        self.url = url
+        self.read = 0
+        self.closed = False
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        # like requests.Response, falsy for 4xx and 5xx statuses
+        return self.ok
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start:start + chunk_size]
+            self.read += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def memory_redis(settings):
+    """
+    An in-memory Redis in place of the REDISKV client
+    """
+    settings.REDISKV = fakeredis.FakeRedis()
+    # the invalidation listener of the local tier is not started in tests
+    settings.CACHE_LOCAL_MAX_SIZE = 0
+    return settings.REDISKV
+
+
+@pytest.fixture
+def streamed_response():
+    return StreamedResponse
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """
+    Serves registry downloads from a dict of url -> body, 404 for the other urls
+    """
+    bodies = {}
+
+    def download_url(url):
+        if url not in bodies:
+            return StreamedResponse(b'', status_code=404, url=url)
+        return StreamedResponse(bodies[url], url=url)
+
+    monkeypatch.setattr('bcmr_main.op_return.download_url', download_url)
+    return bodies
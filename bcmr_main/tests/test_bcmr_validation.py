@@ -0,0 +1,43 @@
+import hashlib
+import json
+import pytest
+from django.conf import settings
+from jsonschema import ValidationError
+from bcmr_main.app.BitcoinCashMetadataRegistry import BitcoinCashMetadataRegistry, validation_results
+
+
+def load_sample():
+    with open(f'{settings.BASE_DIR}/bcmr_main/app/sample.json', 'r') as sample_file:
+        return json.load(sample_file)
+
+
+class TestSchemaValidation:
+
+    def setup_method(self):
+        validation_results.clear()
+
+    def test_valid_contents_are_memoized(self):
+        contents = load_sample()
+        BitcoinCashMetadataRegistry.validate_contents(contents, sha256='sample')
+        assert validation_results.get('sample') == (True, None)
+        assert validation_results.get('other') is None
+
+        # a memoized result is not revalidated
+        BitcoinCashMetadataRegistry.validate_contents({}, sha256='sample')
+
+    def test_invalid_contents_raise_on_every_call(self):
+        contents = load_sample()
+        contents['version'] = 'invalid'
+        raw = json.dumps(contents)
+
+        errors = []
+        for _ in range(2):
+            with pytest.raises(ValidationError) as excinfo:
+                BitcoinCashMetadataRegistry.validate_contents(raw)
+            errors.append(excinfo.value)
+
+        assert errors[0] is not errors[1]
+        assert errors[0].message == errors[1].message
+        valid, message = validation_results.get(hashlib.sha256(raw.encode()).hexdigest())
+        assert not valid
+        assert message == errors[0].message
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import pytest
+import time
+from django.urls import reverse
+from redis.exceptions import ConnectionError
+from bcmr_main import cache
+from bcmr_main.bloom import BloomFilter, RebuildInterrupted, TOKEN_CATEGORIES, is_known_missing
+from bcmr_main.models import Registry, RegistryBlob, Token
+
+
+class UnavailableRedis:
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            raise ConnectionError('Redis is down')
+        return command
+
+
+class TestCacheDegradation:
+
+    def test_unavailable_redis_is_a_cache_miss(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        cache_key = cache.get_cache_key('registry:token', 'category')
+        assert cache_key is None
+        assert cache.get_json(cache_key) is None
+        assert cache.get_json('registry:token:category:v0.0') is None
+        assert cache.get_many_json(['a', None, 'b']) == [None, None, None]
+        assert cache.get_cache_keys('metadata:token', [('a',), ('b', 'type')]) == [None, None]
+
+    def test_unavailable_redis_skips_writes(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        cache.set_json('registry:token:category:v0.0', {}, ex=60)
+        cache.set_many_json({'a': 1, 'b': 2}, ex=60)
+
+    def test_unavailable_redis_triggers_no_refresh(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        assert not cache.claim_refresh('tokencategorymetadata:category:v0.0')
+        assert cache.claim_many_refreshes(['tokencategorymetadata:category:v0.0']) == []
+
+    def test_unavailable_redis_shortens_ttls(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        assert cache.get_cache_ttls(['a', 'b']) == {
+            'a': settings.CACHE_REFRESH_INTERVAL,
+            'b': settings.CACHE_REFRESH_INTERVAL
+        }
+
+
+class TestLocalCache:
+
+    def setup_method(self):
+        self.local_cache = cache.LocalCache(max_size=40, ttl=60)
+        # pretend the invalidation listener is subscribed
+        self.local_cache.pid = cache.os.getpid()
+        self.local_cache.listener = type('Listener', (), {'is_alive': lambda self: True})()
+        self.local_cache.connected = True
+
+    def test_least_recently_used_entries_are_evicted(self):
+        epoch = self.local_cache.get_epoch()
+        self.local_cache.set('a', 'category-a', b'x' * 10, epoch)
+        self.local_cache.set('b', 'category-b', b'x' * 10, epoch)
+        self.local_cache.get('a')
+        self.local_cache.set('c', 'category-c', b'x' * 10, epoch)
+        self.local_cache.set('d', 'category-d', b'x' * 10, epoch)
+        self.local_cache.set('e', 'category-e', b'x' * 10, epoch)
+
+        assert self.local_cache.get('b') is None
+        assert self.local_cache.get('a') == b'x' * 10
+        assert self.local_cache.size <= 40
+
+    def test_invalidation_drops_category_and_stale_writes(self):
+        epoch = self.local_cache.get_epoch()
+        self.local_cache.set('a', 'category-a', b'{}', epoch)
+        self.local_cache.invalidate(['category-a'])
+        assert self.local_cache.get('a') is None
+
+        # read from Redis before the invalidation
+        self.local_cache.set('a', 'category-a', b'{}', epoch)
+        assert self.local_cache.get('a') is None
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+class TestInvalidationListener:
+
+    def test_broadcast_invalidations_drop_local_entries(self, memory_redis):
+        local_cache = cache.LocalCache(max_size=1024, ttl=60)
+        # starts the listener
+        assert local_cache.get('a') is None
+        wait_for(lambda: local_cache.connected)
+
+        epoch = local_cache.get_epoch()
+        local_cache.set('a', 'category-a', b'{}', epoch)
+        local_cache.set('b', 'category-b', b'{}', epoch)
+        assert local_cache.get('a') == b'{}'
+
+        # by another process
+        cache.invalidate_categories(['category-a'], client=memory_redis)
+        wait_for(lambda: local_cache.get('a') is None)
+        assert local_cache.get('b') == b'{}'
+
+        cache.invalidate_all(client=memory_redis)
+        wait_for(lambda: local_cache.get('b') is None)
+
+
+class TestBloomFilter:
+
+    def test_unavailable_redis_never_reports_missing(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        assert not is_known_missing(TOKEN_CATEGORIES, 'category')
+        assert BloomFilter(TOKEN_CATEGORIES).might_contain('category')
+
+    def test_offsets_are_stable_and_in_range(self, settings):
+        settings.REDISKV = UnavailableRedis()
+        bloom = BloomFilter(TOKEN_CATEGORIES)
+
+        offsets = bloom._offsets('category')
+        assert offsets == bloom._offsets('category')
+        assert len(offsets) == settings.BLOOM_FILTER_HASHES
+        assert all(0 <= offset < settings.BLOOM_FILTER_SIZE for offset in offsets)
+
+    def test_adds_during_a_rebuild_are_kept(self, memory_redis):
+        bloom = BloomFilter(TOKEN_CATEGORIES)
+        bloom.rebuild(['a'])
+
+        def categories():
+            yield 'b'
+            # ingested while the rebuild is running
+            bloom.add(['c'])
+            yield 'd'
+
+        assert bloom.rebuild(categories(), batch_size=1) == 2
+        assert [bloom.might_contain(item) for item in 'abcd'] == [False, True, True, True]
+        assert not memory_redis.exists(bloom.rebuild_key)
+
+    def test_expired_rebuild_is_not_swapped_in(self, memory_redis):
+        bloom = BloomFilter(TOKEN_CATEGORIES)
+        bloom.rebuild(['a'])
+
+        def categories():
+            yield 'b'
+            # the rebuild stalled for longer than REBUILD_TIMEOUT
+            memory_redis.delete(bloom.rebuild_key)
+            bloom.add(['c'])
+
+        with pytest.raises(RebuildInterrupted):
+            bloom.rebuild(categories())
+        assert [bloom.might_contain(item) for item in 'abc'] == [True, False, True]
+
+
+class TestSharedBodies:
+
+    def test_large_bodies_are_stored_once(self, memory_redis, settings):
+        settings.CACHE_SHARED_MIN_SIZE = 100
+        body = b'{"identities": "%s"}' % (b'x' * 200)
+
+        for category in ['a', 'b']:
+            cached = cache.ResponseCache('registry:token', category)
+            assert cached.get() is None
+            cached.set(body, ex=60)
+
+        assert len(memory_redis.keys('sharedbody:*')) == 1
+        assert cache.ResponseCache('registry:token', 'a').get() == body
+        assert cache.ResponseCache('registry:token', 'b').get() == body
+
+    def test_oversized_bodies_are_not_admitted(self, memory_redis, settings):
+        settings.CACHE_MAX_ENTRY_SIZE = 100
+
+        cached = cache.ResponseCache('registry:token', 'a')
+        cached.get()
+        cached.set(b'x' * 101, ex=60)
+        assert memory_redis.dbsize() == 0
+
+    def test_key_families(self):
+        assert cache.get_key_family('registry:token:abc:v0.3') == 'registry:token:*'
+        assert cache.get_key_family('registry:token:abc:v0.3:gzip') == 'registry:token:*:gzip'
+        assert cache.get_key_family('metadata:token:abc:v1.0:00ff') == 'metadata:token:*'
+        assert cache.get_key_family('sharedbody:0123:br') == 'sharedbody'
+        assert cache.get_key_family('cacheversion:abc') == 'cacheversion'
+
+
+@pytest.mark.django_db
+class TestTokenViewCache:
+
+    def test_category_response_is_cached(self, memory_redis, client, monkeypatch):
+        Token.objects.create(category='category')
+        contents = {
+            'identities': {
+                'category': {
+                    '2023-07-21T01:33:01.724Z': {'name': 'Token', 'token': {'category': 'category', 'symbol': 'TKN'}}
+                }
+            }
+        }
+        raw = json.dumps(contents).encode()
+        blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+        Registry.objects.create(txid='txid', index=0, blob=blob)
+
+        url = reverse('token-info', kwargs={'category': 'category'})
+        response = client.get(url)
+        assert response.json()['name'] == 'Token'
+
+        def get_response_document(*args):
+            raise AssertionError('a cached response is rendered again')
+        monkeypatch.setattr('bcmr_main.views.token_view.get_response_document', get_response_document)
+        assert client.get(url).json() == response.json()
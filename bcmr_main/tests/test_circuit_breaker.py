@@ -0,0 +1,114 @@
+from django.urls import reverse
+from bcmr_main.circuit_breaker import CircuitBreaker, get_circuit_breaker, get_statuses
+from bcmr_main.models import Registry
+import pytest
+import time
+
+
+class TestCircuitBreaker:
+
+    def setup_method(self):
+        self.now = 1_000_000.0
+
+    def get_breaker(self, memory_redis, monkeypatch):
+        monkeypatch.setattr('bcmr_main.circuit_breaker.time.time', lambda: self.now)
+        return CircuitBreaker('example.com', client=memory_redis)
+
+    def fail(self, breaker, times):
+        for _ in range(times):
+            breaker.record_failure()
+
+    def test_opens_at_the_threshold(self, memory_redis, monkeypatch, settings):
+        breaker = self.get_breaker(memory_redis, monkeypatch)
+
+        self.fail(breaker, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD - 1)
+        assert breaker.status()['status'] == CircuitBreaker.CLOSED
+        assert breaker.allow_request()
+
+        breaker.record_failure()
+        assert breaker.status()['status'] == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+
+    def test_failures_age_out_of_the_window(self, memory_redis, monkeypatch, settings):
+        breaker = self.get_breaker(memory_redis, monkeypatch)
+
+        # never more than threshold - 1 failures within any window
+        for _ in range(3):
+            self.fail(breaker, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD - 1)
+            self.now += settings.CIRCUIT_BREAKER_FAILURE_WINDOW + 1
+
+        assert breaker.status()['status'] == CircuitBreaker.CLOSED
+        assert breaker.status()['failures'] == 0
+
+    def test_half_open_lets_one_probe_through(self, memory_redis, monkeypatch, settings):
+        breaker = self.get_breaker(memory_redis, monkeypatch)
+        self.fail(breaker, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+
+        self.now += settings.CIRCUIT_BREAKER_COOLDOWN + 1
+        assert breaker.status()['status'] == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request()
+        assert not breaker.allow_request()
+
+        breaker.record_success()
+        assert breaker.status()['status'] == CircuitBreaker.CLOSED
+        assert breaker.allow_request()
+
+    def test_failed_probe_reopens_with_longer_cooldown(self, memory_redis, monkeypatch, settings):
+        breaker = self.get_breaker(memory_redis, monkeypatch)
+        self.fail(breaker, settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+        first_cooldown = breaker.status()['open_until'] - self.now
+
+        self.now += settings.CIRCUIT_BREAKER_COOLDOWN + 1
+        assert breaker.allow_request()
+        breaker.record_failure()
+
+        status = breaker.status()
+        assert status['status'] == CircuitBreaker.OPEN
+        assert status['trips'] == 2
+        assert status['open_until'] - self.now == first_cooldown * 2
+
+    def test_only_http_urls_have_a_breaker(self):
+        assert get_circuit_breaker('ipfs://bafy/registry.json') is None
+        assert get_circuit_breaker('https://example.com/registry.json').host == 'example.com'
+
+    def test_statuses_are_read_in_one_round_trip(self, memory_redis, monkeypatch, settings):
+        breakers = [self.get_breaker(memory_redis, monkeypatch), CircuitBreaker('example.org', client=memory_redis)]
+        self.fail(breakers[0], settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD)
+        self.fail(breakers[1], 1)
+
+        executed = []
+        pipeline = memory_redis.pipeline
+
+        def counting_pipeline(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            execute = pipe.execute
+            pipe.execute = lambda *args, **kwargs: executed.append(1) or execute(*args, **kwargs)
+            return pipe
+        monkeypatch.setattr(memory_redis, 'pipeline', counting_pipeline)
+
+        statuses = get_statuses(breakers)
+        assert len(executed) == 1
+        assert [status['status'] for status in statuses] == [CircuitBreaker.OPEN, CircuitBreaker.CLOSED]
+        assert statuses[1]['failures'] == 1
+        assert statuses == [breaker.status() for breaker in breakers]
+
+
+@pytest.mark.django_db
+def test_admin_shows_the_host_health(admin_client, memory_redis, settings):
+    # the static files of the admin are not collected in tests
+    settings.STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+    Registry.objects.create(txid='a', index=0, bcmr_url='https://down.example.com/registry.json')
+    Registry.objects.create(txid='b', index=0, bcmr_url='https://up.example.com/registry.json')
+    Registry.objects.create(txid='c', index=0, bcmr_url='ipfs://bafy/registry.json')
+    for _ in range(settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD):
+        CircuitBreaker('down.example.com').record_failure()
+
+    response = admin_client.get(reverse('admin:bcmr_main_registry_changelist'))
+    assert response.status_code == 200
+    health = {
+        registry.txid: registry.host_status and registry.host_status['status']
+        for registry in response.context['cl'].result_list
+        if hasattr(registry, 'host_status')
+    }
+    assert health == {'a': CircuitBreaker.OPEN, 'b': CircuitBreaker.CLOSED}
+    assert f'{CircuitBreaker.OPEN} (0 failures, 1 trips)' in response.content.decode()
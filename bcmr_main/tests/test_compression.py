@@ -0,0 +1,55 @@
+from django.test import RequestFactory
+from bcmr_main import cache, compression
+import gzip
+
+
+class TestCompressedVariants:
+
+    def setup_method(self):
+        self.factory = RequestFactory()
+        self.body = b'{"name": "token", "description": "%s"}' % (b'x' * 4096)
+
+    def test_small_bodies_have_no_variants(self):
+        assert compression.compress_variants(b'{}') == {}
+
+    def test_gzip_variant(self):
+        variants = compression.compress_variants(self.body)
+        assert gzip.decompress(variants['gzip']) == self.body
+        assert set(variants) == set(compression.get_encodings())
+
+    def test_accepted_encodings(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0.5, deflate, br;q=0')
+        assert compression.get_accepted_encodings(request) == ['gzip', 'identity']
+        assert compression.get_accepted_encodings(self.factory.get('/')) == ['identity']
+
+    def test_negotiation(self):
+        variants = compression.compress_variants(self.body)
+
+        response = compression.negotiate(self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip'), self.body, variants)
+        assert response['Content-Encoding'] == 'gzip'
+        assert response.content == variants['gzip']
+        assert response['Vary'] == 'Accept-Encoding'
+
+        response = compression.negotiate(self.factory.get('/'), self.body, variants)
+        assert not response.has_header('Content-Encoding')
+        assert response.content == self.body
+
+    def test_cached_bodies_fit_every_client(self, memory_redis):
+        encoding = compression.get_encodings()[0]
+        cached = cache.ResponseCache('registry:token', 'abc')
+        assert cached.get() is None
+        # e.g. only the br variant was smaller than the body
+        cached.set(self.body, ex=60, variants={encoding: b'compressed'})
+
+        for accept_encoding in [encoding, 'deflate', '']:
+            cached = cache.ResponseCache('registry:token', 'abc')
+            response = compression.get_cached_response(
+                self.factory.get('/', HTTP_ACCEPT_ENCODING=accept_encoding),
+                cached
+            )
+            assert response is not None
+            if accept_encoding == encoding:
+                assert response['Content-Encoding'] == encoding
+            else:
+                assert not response.has_header('Content-Encoding')
+                assert response.content == self.body
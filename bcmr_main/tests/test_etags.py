@@ -0,0 +1,129 @@
+import hashlib
+import json
+import pytest
+from django.http import JsonResponse
+from django.test import RequestFactory
+from django.urls import reverse
+from bcmr_main import etags
+from bcmr_main.cache import ResponseCache, get_cache_key
+from bcmr_main.compression import compress_variants, get_cached_response
+from bcmr_main.etags import conditional, get_etag
+from bcmr_main.materialize import materialize_registry
+from bcmr_main.models import Registry, RegistryBlob, ResponseDocument, Token
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents
+
+
+class TestConditionalRequests:
+
+    def setup_method(self):
+
+        @conditional
+        def view(request, category):
+            response = JsonResponse({'category': category})
+            response['Cache-Control'] = 'max-age=60'
+            response['Vary'] = 'Accept-Encoding'
+            return response
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def test_matching_etag_is_not_modified(self):
+
+        response = self.view(self.factory.get('/api/bcmr/abc/'), category='abc')
+        etag = response['ETag']
+        assert etag == get_etag(response.content)
+
+        response = self.view(self.factory.get('/api/bcmr/abc/', HTTP_IF_NONE_MATCH=etag), category='abc')
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+        assert response['Vary'] == 'Accept-Encoding'
+        assert response['Cache-Control'] == 'max-age=60'
+
+    def test_other_etags_get_the_body(self):
+
+        response = self.view(self.factory.get('/api/bcmr/abc/', HTTP_IF_NONE_MATCH='"other"'), category='abc')
+        assert response.status_code == 200
+
+    def test_etags_of_the_view_are_not_hashed(self, monkeypatch):
+
+        @conditional
+        def view(request, category):
+            response = JsonResponse({})
+            response['ETag'] = '"document"'
+            return response
+
+        def get_etag(body):
+            raise AssertionError('a body with an ETag is hashed')
+        monkeypatch.setattr(etags, 'get_etag', get_etag)
+
+        response = view(self.factory.get('/api/bcmr/abc/', HTTP_IF_NONE_MATCH='"document"'), category='abc')
+        assert response.status_code == 304
+
+
+class TestCachedETags:
+
+    def setup_method(self):
+        self.factory = RequestFactory()
+        self.body = b'{"name": "token", "description": "%s"}' % (b'x' * 4096)
+
+    def test_etag_is_stored_with_the_body(self, memory_redis):
+        cached = ResponseCache('registry:token', 'abc')
+        assert cached.get() is None
+        cached.set(self.body, ex=60, variants=compress_variants(self.body), etag='"document"')
+
+        cached = ResponseCache('registry:token', 'abc')
+        assert cached.get() == self.body
+        assert cached.etag == '"document"'
+
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = get_cached_response(request, ResponseCache('registry:token', 'abc'))
+        assert response['ETag'] == '"document-gzip"'
+
+    def test_etag_follows_the_body(self, memory_redis):
+        cached = ResponseCache('registry:token', 'abc')
+        cached.get()
+        cached.set(b'{"old": true}', ex=60)
+        cached.set(b'{"new": true}', ex=60)
+
+        cached = ResponseCache('registry:token', 'abc')
+        assert cached.get() == b'{"new": true}'
+        assert cached.etag == get_etag(b'{"new": true}')
+
+
+@pytest.mark.django_db
+class TestTokenViewETags:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        monkeypatch.setattr(materialize_token_documents, 'delay', lambda *args: None)
+
+    def test_document_and_cache_hit_have_the_same_etag(self, client):
+        Token.objects.create(category='category')
+        contents = {
+            'identities': {
+                'category': {
+                    '2023-07-21T01:33:01.724Z': {'name': 'Token', 'token': {'category': 'category', 'symbol': 'TKN'}}
+                }
+            }
+        }
+        raw = json.dumps(contents).encode()
+        blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+        materialize_registry(Registry.objects.create(txid='txid', index=0, blob=blob))
+        url = reverse('token-info', kwargs={'category': 'category'})
+
+        etag = client.get(url)['ETag']
+        assert etag == ResponseDocument.objects.get(kind='token', key='').etag
+        # served from the cache
+        assert client.get(url)['ETag'] == etag
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+
+@pytest.mark.django_db
+def test_new_tokens_invalidate_the_category(memory_redis, monkeypatch, django_capture_on_commit_callbacks):
+    monkeypatch.setattr(materialize_token_documents, 'delay', lambda *args: None)
+    key = get_cache_key('metadata:token', 'category')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Token.objects.create(category='category')
+    assert get_cache_key('metadata:token', 'category') != key
@@ -0,0 +1,237 @@
+import datetime
+import hashlib
+import json
+import pytest
+from bcmr_main.cache import get_cache_key
+from bcmr_main.materialize import (
+    get_next_activations,
+    materialize_registry,
+    render_registry,
+    render_token,
+    token_documents_outdated
+)
+from bcmr_main.models import Registry, RegistryBlob, ResponseDocument, Token
+from bcmr_main.models.IdentitySnapshot import get_nft_type_keys, iter_snapshots
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents
+
+
+class StubRegistry:
+
+    def __init__(self, contents):
+        self.contents = contents
+
+
+def snapshot(category):
+    return {'name': 'Token', 'token': {'category': category, 'symbol': 'TKN', 'decimals': 0}}
+
+
+class TestNextActivations:
+
+    def test_earliest_pending_snapshot_per_category(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        soon = now + datetime.timedelta(hours=1)
+        later = now + datetime.timedelta(days=1)
+        registry = StubRegistry({
+            'identities': {
+                'authbase': {
+                    '2023-07-21T01:33:01.724Z': snapshot('category'),
+                    later.strftime('%Y-%m-%dT%H:%M:%S.000Z'): snapshot('category'),
+                    soon.strftime('%Y-%m-%dT%H:%M:%S.000Z'): snapshot('category'),
+                },
+                'other': {
+                    '2023-07-21T01:33:01.724Z': snapshot('other'),
+                }
+            }
+        })
+
+        activations = get_next_activations(registry)
+        assert list(activations.keys()) == ['category']
+        assert int(activations['category']) == int(soon.replace(microsecond=0).timestamp())
+
+
+class TestIdentitySnapshotRows:
+
+    def test_snapshot_keys_are_parsed(self):
+        rows = list(iter_snapshots({
+            'identities': {
+                'authbase': {
+                    '2023-07-21T01:33:01.724Z': snapshot('category'),
+                    '2023-07-22': {'name': 'Not a token'},
+                    'latest': snapshot('category'),
+                },
+                'invalid': 'not an identity history'
+            }
+        }))
+
+        assert [row['identity_history'] for row in rows] == ['2023-07-21T01:33:01.724Z', '2023-07-22', 'latest']
+        assert [row['category'] for row in rows] == ['category', None, 'category']
+        assert rows[0]['timestamp'] == datetime.datetime(2023, 7, 21, 1, 33, 1, 724000, tzinfo=datetime.timezone.utc)
+        assert rows[1]['timestamp'] == datetime.datetime(2023, 7, 22, tzinfo=datetime.timezone.utc)
+        # never becomes active
+        assert rows[2]['timestamp'] is None
+
+    def test_nft_type_keys(self):
+        collection = snapshot('category')
+        collection['token']['nfts'] = {'parse': {'types': {'': {'name': 'Empty'}, '01': {'name': 'One'}}}}
+        contents = {'identities': {'authbase': {'2023-07-21T01:33:01.724Z': collection, '2023-07-22': snapshot('category')}}}
+
+        assert get_nft_type_keys(contents, 'authbase', '2023-07-21T01:33:01.724Z') == ['', '01']
+        assert get_nft_type_keys(contents, 'authbase', '2023-07-22') == []
+        assert get_nft_type_keys(contents, 'other', '2023-07-22') == []
+
+
+def create_registry(identities):
+    contents = {'identities': identities}
+    raw = json.dumps(contents).encode()
+    blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+    return Registry.objects.create(txid=blob.sha256, index=0, blob=blob)
+
+
+def collection(category, name='Collection'):
+    identity = snapshot(category)
+    identity['name'] = name
+    identity['token']['nfts'] = {'parse': {'types': {'01': {'name': 'One', 'uris': {'icon': 'ipfs://icon'}}}}}
+    return {'2023-07-21T01:33:01.724Z': identity}
+
+
+def get_documents(category):
+    return {
+        (document.kind, document.key): (document.registry_id, json.loads(bytes(document.body)))
+        for document in ResponseDocument.objects.filter(category=category)
+    }
+
+
+@pytest.mark.django_db
+class TestMaterializeRegistry:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        # materialized explicitly in the tests
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+
+    def test_documents_of_every_endpoint_are_rendered(self):
+        Token.objects.create(category='category', is_nft=True, commitment='01', capability='none')
+        registry = create_registry({'category': collection('category')})
+
+        assert materialize_registry(registry) == ['category']
+        documents = get_documents('category')
+        assert set(documents) == {
+            ('registry', ''),
+            ('token', ''),
+            ('token', '01'),
+            ('identity-snapshot', ''),
+            ('identity-snapshot-nfts', ''),
+            ('token-category', ''),
+        }
+        assert all(registry_id == registry.id for registry_id, _ in documents.values())
+
+        _, token = documents[('token', '01')]
+        assert token['is_nft']
+        assert token['type_metadata']['uris']['image'] == 'ipfs://icon'
+        _, token_category = documents[('token-category', '')]
+        assert token_category['token']['symbol'] == 'TKN'
+
+    def test_renderers_skip_registries_that_are_not_the_source(self):
+        Token.objects.create(category='category')
+        older = create_registry({'category': collection('category', name='Old')})
+        newer = create_registry({'category': collection('category', name='New')})
+
+        assert render_registry(older, 'category') is None
+        assert render_token(older, 'category') is None
+        assert render_registry(newer, 'category') == {'': newer.contents}
+        assert render_token(newer, 'category')['']['name'] == 'New'
+
+    def test_newer_registry_replaces_the_documents(self):
+        Token.objects.create(category='category')
+        older = create_registry({'category': collection('category', name='Old')})
+        materialize_registry(older)
+        newer = create_registry({'category': collection('category', name='New')})
+        materialize_registry(newer)
+
+        # an older registry materialized later on, e.g. on a snapshot activation
+        assert materialize_registry(older) == []
+        documents = get_documents('category')
+        assert {registry_id for registry_id, _ in documents.values()} == {newer.id}
+        assert documents[('identity-snapshot', '')][1]['name'] == 'New'
+
+    def test_newer_token_category_wins_over_the_authbase(self):
+        Token.objects.create(category='category')
+        older = create_registry({'category': collection('category', name='Old')})
+        newer = create_registry({'other': collection('category', name='New')})
+        materialize_registry(newer)
+        materialize_registry(older)
+
+        documents = get_documents('category')
+        # keyed by authbase, still read from the older registry
+        assert documents[('registry', '')][0] == older.id
+        assert documents[('token', '')][0] == older.id
+        # keyed by token category, read from the newer one
+        assert documents[('identity-snapshot', '')][0] == newer.id
+        assert documents[('token-category', '')][0] == newer.id
+
+    def test_dropped_categories_are_invalidated(self, django_capture_on_commit_callbacks):
+        Token.objects.create(category='category')
+        registry = create_registry({'category': collection('category')})
+        materialize_registry(registry)
+        key = get_cache_key('token', 'category')
+
+        contents = {'identities': {'other': collection('other')}}
+        raw = json.dumps(contents).encode()
+        registry.blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+        registry.save()
+        with django_capture_on_commit_callbacks(execute=True):
+            materialize_registry(Registry.objects.get(id=registry.id))
+
+        assert get_documents('category') == {}
+        assert get_cache_key('token', 'category') != key
+
+
+@pytest.mark.django_db
+class TestTokenDocuments:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        self.queued = []
+        monkeypatch.setattr(materialize_token_documents, 'delay', self.queued.append)
+
+    def test_only_changed_token_inputs_outdate_the_documents(self):
+        token = Token.objects.create(category='category', commitment='01', capability='none')
+        assert token_documents_outdated(token, created=True)
+
+        # same is_nft as the latest token
+        other = Token.objects.create(category='category', commitment='02', capability='none')
+        assert not token_documents_outdated(other, created=True)
+
+        token = Token.objects.get(id=token.id)
+        token.amount = 10
+        token.save()
+        assert not token_documents_outdated(token, created=False)
+        # not the latest token of the category
+        token.is_nft = True
+        token.save()
+        assert not token_documents_outdated(token, created=False)
+
+        other = Token.objects.get(id=other.id)
+        other.is_nft = True
+        other.save()
+        assert token_documents_outdated(other, created=False)
+
+    def test_is_nft_change_rerenders_only_the_token_documents(self, django_capture_on_commit_callbacks):
+        token = Token.objects.create(category='category', commitment='01', capability='none')
+        registry = create_registry({'category': collection('category')})
+        materialize_registry(registry)
+        other_ids = set(ResponseDocument.objects.exclude(kind='token').values_list('id', flat=True))
+        assert not get_documents('category')[('token', '01')][1]['is_nft']
+        etag = ResponseDocument.objects.get(kind='token', key='01').etag
+
+        with django_capture_on_commit_callbacks(execute=True):
+            token.is_nft = True
+            token.save()
+        assert self.queued == ['category']
+        materialize_token_documents('category')
+
+        assert get_documents('category')[('token', '01')][1]['is_nft']
+        # same blob, other body
+        assert ResponseDocument.objects.get(kind='token', key='01').etag != etag
+        assert set(ResponseDocument.objects.exclude(kind='token').values_list('id', flat=True)) == other_ids
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import pytest
+from redis.exceptions import ConnectionError
+from bcmr_main.metadata import generate_token_metadata, mark_metadata_dirty, pop_dirty_categories
+from bcmr_main.models import IdentityOutput, Registry, RegistryBlob, Token, TokenMetadata
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents, regenerate_dirty_metadata, resolve_metadata
+
+
+class UnavailableRedis:
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            raise ConnectionError('Redis is down')
+        return command
+
+
+class TestDirtyCategories:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, settings):
+        settings.METADATA_REGENERATION_QUIET_WINDOW = 0
+
+    def test_marks_are_popped_once(self):
+        mark_metadata_dirty('category', '01')
+        mark_metadata_dirty('other')
+
+        assert pop_dirty_categories() == {'category': ['01'], 'other': None}
+        assert pop_dirty_categories() == {}
+
+    def test_repeated_marks_collapse(self):
+        for commitment in ['02', '01', '02', '01']:
+            mark_metadata_dirty('category', commitment)
+
+        assert pop_dirty_categories() == {'category': ['01', '02']}
+
+        mark_metadata_dirty('category', '01')
+        mark_metadata_dirty('category')
+        assert pop_dirty_categories() == {'category': None}
+
+    def test_quiet_window(self, settings):
+        settings.METADATA_REGENERATION_QUIET_WINDOW = 60
+        mark_metadata_dirty('category', '01')
+
+        assert pop_dirty_categories() == {}
+        assert pop_dirty_categories(force=True) == {'category': ['01']}
+
+    def test_unavailable_redis(self, settings):
+        settings.REDISKV = UnavailableRedis()
+
+        mark_metadata_dirty('category', '01')
+        assert pop_dirty_categories() == {}
+
+
+def create_registry(category, types):
+    publisher = IdentityOutput.objects.create(txid='publisher', identities=[category])
+    contents = {
+        'identities': {
+            category: {
+                '2023-07-21T01:33:01.724Z': {
+                    'name': 'Collection',
+                    'token': {
+                        'category': category,
+                        'symbol': 'NFT',
+                        'nfts': {'parse': {'types': {key: {'name': key} for key in types}}}
+                    }
+                }
+            }
+        }
+    }
+    raw = json.dumps(contents).encode()
+    blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+    return Registry.objects.create(txid='txid', index=0, blob=blob, publisher=publisher, validity_checks={})
+
+
+@pytest.mark.django_db
+class TestRegeneration:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch, settings):
+        settings.METADATA_REGENERATION_QUIET_WINDOW = 0
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        monkeypatch.setattr(materialize_token_documents, 'delay', lambda *args: None)
+        self.queued = []
+        monkeypatch.setattr(resolve_metadata, 'delay', lambda *args, **kwargs: self.queued.append((args, kwargs)))
+
+    def create_nfts(self, commitments, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            return [
+                Token.objects.create(category='category', is_nft=True, commitment=commitment, capability='none')
+                for commitment in commitments
+            ]
+
+    def test_only_the_changed_nfts_are_regenerated(self, django_capture_on_commit_callbacks):
+        registry = create_registry('category', ['01', '02', '03'])
+        tokens = self.create_nfts(['01', '02', '03'], django_capture_on_commit_callbacks)
+        generate_token_metadata(registry)
+        assert TokenMetadata.objects.filter(metadata_type='type').count() == 3
+        pop_dirty_categories(force=True)
+
+        # changed again and again within the quiet window
+        for token in [tokens[1], tokens[0], tokens[1]]:
+            with django_capture_on_commit_callbacks(execute=True):
+                token.save()
+        regenerate_dirty_metadata()
+        regenerate_dirty_metadata()
+        assert self.queued == [((registry.id, ), {'commitments': ['01', '02']})]
+
+        TokenMetadata.objects.all().delete()
+        generate_token_metadata(registry, commitments=['01', '02'])
+        regenerated = TokenMetadata.objects.filter(metadata_type='type').values_list('token__commitment', flat=True)
+        assert sorted(regenerated) == ['01', '02']
+
+    def test_fungible_tokens_regenerate_the_category(self, django_capture_on_commit_callbacks):
+        registry = create_registry('category', ['01'])
+        self.create_nfts(['01'], django_capture_on_commit_callbacks)
+        generate_token_metadata(registry)
+        pop_dirty_categories(force=True)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Token.objects.create(category='category')
+        regenerate_dirty_metadata()
+        assert self.queued == [((registry.id, ), {})]
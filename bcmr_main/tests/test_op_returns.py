@@ -1,7 +1,11 @@
+import hashlib
+import json
 import pytest
+from django.conf import settings
+from django.db.models.signals import post_save
 from bcmr_main.op_return import process_op_return
 from bcmr_main.utils import timestamp_to_date
-from bcmr_main.models import Registry
+from bcmr_main.models import Registry, RegistryBlob
 
 
 VALID_OP_RETURNS = [
@@ -51,3 +55,86 @@ class TestOpReturnValidation:
         assert registry.txid == txid
         assert registry.op_return == op_return
         assert registry.bcmr_url == bcmr_url
+
+
+def load_sample():
+    with open(f'{settings.BASE_DIR}/bcmr_main/app/sample.json', 'rb') as sample_file:
+        return sample_file.read()
+
+
+def publish(body, url='example.com/registry.json'):
+    return f'OP_RETURN 1380795202 {hashlib.sha256(body).hexdigest()} {url.encode().hex()}'
+
+
+@pytest.mark.django_db
+class TestRepeatedDownloads:
+
+    def setup_method(self):
+        self.saves = []
+        post_save.connect(self.record_save, sender=Registry, dispatch_uid='test_record_save')
+
+    def teardown_method(self):
+        post_save.disconnect(sender=Registry, dispatch_uid='test_record_save')
+
+    def record_save(self, sender, instance=None, created=False, update_fields=None, **kwargs):
+        self.saves.append(update_fields)
+
+    def process(self, op_return, timestamp=1685966924):
+        return process_op_return('txid', 0, op_return, None, timestamp_to_date(timestamp))
+
+    def test_unchanged_document_only_updates_the_status(self, downloads, monkeypatch):
+        body = load_sample()
+        downloads['https://example.com/registry.json'] = body
+        op_return = publish(body)
+
+        self.process(op_return)
+        registry = Registry.objects.get()
+        assert registry.blob_id == hashlib.sha256(body).hexdigest()
+        assert self.saves == [None]
+
+        def store(*args, **kwargs):
+            raise AssertionError('an unchanged document is stored again')
+        monkeypatch.setattr(RegistryBlob, 'store', staticmethod(store))
+
+        # published again later on
+        validity_checks, _ = self.process(op_return, timestamp=1685970000)
+        assert validity_checks['bcmr_hash_match']
+        assert self.saves[1] == frozenset({
+            'date_created', 'op_return', 'bcmr_url', 'validity_checks', 'bcmr_request_status', 'valid'
+        })
+        registry.refresh_from_db()
+        assert registry.validity_checks['bcmr_format_valid']
+        assert registry.date_created == timestamp_to_date(1685970000)
+
+    def test_failed_download_keeps_the_document(self, downloads):
+        body = load_sample()
+        downloads['https://example.com/registry.json'] = body
+        op_return = publish(body)
+        self.process(op_return)
+
+        del downloads['https://example.com/registry.json']
+        # a 4xx response is no response at all, its status is not recorded
+        assert self.process(op_return) == (False, 'https://example.com/registry.json')
+
+        assert self.saves[1] == frozenset({'date_created', 'op_return', 'bcmr_url', 'validity_checks', 'valid'})
+        registry = Registry.objects.get()
+        assert registry.bcmr_request_status == 200
+        assert not registry.validity_checks['bcmr_file_accessible']
+        assert registry.blob_id == hashlib.sha256(body).hexdigest()
+
+    def test_changed_document_is_stored(self, downloads):
+        body = load_sample()
+        downloads['https://example.com/registry.json'] = body
+        op_return = publish(body)
+        self.process(op_return)
+        Registry.objects.update(allow_hash_mismatch=True)
+
+        contents = json.loads(body)
+        contents['latestRevision'] = '2024-01-01T00:00:00.000Z'
+        changed = json.dumps(contents).encode()
+        downloads['https://example.com/registry.json'] = changed
+        self.process(op_return)
+
+        assert self.saves[1] is None
+        assert Registry.objects.get().blob_id == hashlib.sha256(changed).hexdigest()
+        assert RegistryBlob.objects.count() == 2
@@ -0,0 +1,53 @@
+import importlib
+import pytest
+from django.urls import reverse
+from bcmr_main.models import Token
+
+
+@pytest.mark.django_db
+class TestCashTokenPages:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        for index in range(15):
+            Token.objects.create(category=f'category{index:02}', amount=1)
+
+        def estimate_count(queryset):
+            self.estimates += 1
+            return 15
+        self.estimates = 0
+        # the module, cts.views.CashToken is the view class
+        monkeypatch.setattr(importlib.import_module('cts.views.CashToken'), 'estimate_count', estimate_count)
+        self.url = reverse('get-cashtoken')
+
+    def test_numbered_pages_are_the_default(self, client):
+        page = client.get(self.url).json()
+        assert page['count'] == 15
+        assert len(page['results']) == 10
+        assert page['next'].endswith('?page=2')
+
+        page = client.get(self.url, {'page': 2}).json()
+        assert [token['category'] for token in page['results']] == [f'category{index:02}' for index in range(4, -1, -1)]
+        assert self.estimates == 0
+
+    def test_cursor_pages_are_opt_in(self, client):
+        page = client.get(self.url, {'cursor': ''}).json()
+        assert [token['category'] for token in page['results']] == [f'category{index:02}' for index in range(14, 4, -1)]
+        assert page['count'] is None
+        assert 'cursor=' in page['next']
+        assert self.estimates == 0
+
+        page = client.get(page['next']).json()
+        assert len(page['results']) == 5
+        assert page['next'] is None
+
+    def test_count_is_only_computed_on_request(self, client):
+        page = client.get(self.url, {'cursor': '', 'count': 'estimate'}).json()
+        assert page['count'] == 15
+        assert page['estimated_count']
+        assert self.estimates == 1
+
+        page = client.get(self.url, {'cursor': '', 'count': 'exact'}).json()
+        assert page['count'] == 15
+        assert not page['estimated_count']
+        assert self.estimates == 1
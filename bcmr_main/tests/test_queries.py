@@ -0,0 +1,130 @@
+import hashlib
+import json
+import pytest
+import re
+from django.urls import reverse
+from bcmr_main import queries
+from bcmr_main.models import Registry, RegistryBlob
+from bcmr_main.tasks import materialize_registry_documents
+from cts.registrycontenthelpers import get_identity_snapshot, get_identity_snapshot_nft_type, get_nft_type, get_nft_types
+
+
+def get_statements():
+    return [value for value in vars(queries).values() if isinstance(value, queries.Query)]
+
+
+class TestPreparedStatements:
+
+    def test_every_parameter_has_a_type(self):
+        for statement in get_statements():
+            assert statement.sql.count('%s') == len(statement.types), statement.name
+
+    def test_placeholders_are_numbered(self):
+        for statement in get_statements():
+            prepare_sql = statement.get_prepare_sql()
+            numbers = [int(number) for number in re.findall(r'\$(\d+)', prepare_sql)]
+
+            assert '%s' not in prepare_sql
+            assert numbers == list(range(1, len(statement.types) + 1)), statement.name
+            assert prepare_sql.startswith(f'PREPARE {statement.name} (')
+
+    def test_names_are_unique(self):
+        names = [statement.name for statement in get_statements()]
+        assert len(names) == len(set(names))
+
+    def test_latest_registry_wins_in_every_statement(self):
+        # the snapshot of the latest registry first, then its latest snapshot
+        for statement in get_statements():
+            for order_by in re.findall(r'ORDER BY ([^\n]*)', statement.sql):
+                if 'snapshot.timestamp' in order_by:
+                    assert 'snapshot.registry_id DESC, snapshot.timestamp DESC' in order_by, statement.name
+
+
+@pytest.mark.django_db
+class TestSnapshotOrdering:
+
+    def test_nft_type_and_snapshot_come_from_the_same_registry(self, memory_redis, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        registry_ids = []
+        # the older registry has the later snapshot
+        for timestamp, name in (('2023-07-22T00:00:00.000Z', 'Old'), ('2023-07-21T00:00:00.000Z', 'New')):
+            contents = {
+                'identities': {
+                    'category': {
+                        timestamp: {
+                            'name': name,
+                            'token': {'category': 'category', 'symbol': 'NFT', 'nfts': {'parse': {'types': {'01': {'name': name}}}}}
+                        }
+                    }
+                }
+            }
+            raw = json.dumps(contents).encode()
+            blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+            registry_ids.append(Registry.objects.create(txid=blob.sha256, index=0, blob=blob).id)
+
+        snapshot = get_identity_snapshot_nft_type('category', '01')
+        assert snapshot['_meta']['registry_id'] == registry_ids[-1]
+        assert snapshot['name'] == 'New'
+        assert get_identity_snapshot('category')['_meta']['registry_id'] == registry_ids[-1]
+        assert get_nft_type('category', '01')['_meta']['registry_id'] == registry_ids[-1]
+
+
+@pytest.mark.django_db
+class TestNftTypePages:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        types = {f'0{index}': {'name': f'Type {index}'} for index in range(1, 6)}
+        contents = {
+            'identities': {
+                'category': {
+                    '2023-07-21T01:33:01.724Z': {
+                        'name': 'Collection',
+                        'token': {'category': 'category', 'symbol': 'NFT', 'nfts': {'parse': {'types': types}}}
+                    }
+                }
+            }
+        }
+        raw = json.dumps(contents).encode()
+        blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+        Registry.objects.create(txid='txid', index=0, blob=blob)
+
+    def get_page(self, link=None):
+        params = dict(param.split('=') for param in (link or '?').split('?')[1].split('&') if param)
+        page = get_nft_types(
+            'category',
+            int(params.get('limit', 2)),
+            paginated=True,
+            request_url='/types/',
+            cursor=params.get('cursor'),
+            before=params.get('before')
+        )
+        return [result['_meta']['commitment'] for result in page['results']], page
+
+    def test_both_links_are_cursors(self):
+        keys, page = self.get_page()
+        assert keys == ['05', '04']
+        assert page['count'] == 5
+        assert page['previous'] is None
+        assert page['next'] == '/types/?paginated=true&limit=2&cursor=04'
+
+        pages = [keys]
+        while page['next']:
+            keys, page = self.get_page(page['next'])
+            pages.append(keys)
+        assert pages == [['05', '04'], ['03', '02'], ['01']]
+
+        backwards = []
+        while page['previous']:
+            keys, page = self.get_page(page['previous'])
+            assert 'offset=' not in (page['previous'] or '') + (page['next'] or '')
+            backwards.append(keys)
+        assert backwards == [['03', '02'], ['05', '04']]
+
+    def test_cursor_and_offset_are_rejected(self, client):
+        url = reverse('get-nfts-parse-type', kwargs={'category': 'category'})
+        assert client.get(url, {'paginated': 'true', 'cursor': '04', 'offset': '2'}).status_code == 400
+        assert client.get(url, {'paginated': 'true', 'before': '04', 'offset': '2'}).status_code == 400
+        assert client.get(url, {'paginated': 'true', 'cursor': '04', 'before': '02'}).status_code == 400
+        assert client.get(url, {'paginated': 'true', 'cursor': '04'}).status_code == 200
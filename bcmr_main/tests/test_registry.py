@@ -0,0 +1,181 @@
+import hashlib
+import importlib
+import json
+import pytest
+from types import SimpleNamespace
+from bcmr_main.cache import get_cache_key
+from bcmr_main.models import IdentitySnapshot, NftType, Registry, RegistryBlob
+from bcmr_main.tasks import materialize_registry_documents
+from bcmr_main.views.bcmr_view import get_latest_registry
+
+
+def make_blob(contents):
+    raw = json.dumps(contents).encode()
+    return hashlib.sha256(raw).hexdigest(), raw
+
+
+@pytest.mark.django_db
+class TestRegistryBlobStore:
+
+    def test_same_document_is_stored_once(self):
+        contents = {'version': {'major': 1, 'minor': 0, 'patch': 0}}
+        sha256, raw = make_blob(contents)
+
+        first = RegistryBlob.store(sha256, contents, raw=raw)
+        second = RegistryBlob.store(sha256, contents, raw=raw)
+
+        assert first.pk == second.pk == sha256
+        assert RegistryBlob.objects.count() == 1
+        assert second.size == len(raw)
+        assert second.verify()
+
+    def test_different_documents_get_blobs_of_their_own(self):
+        for contents in ({'a': 1}, {'a': 2}):
+            sha256, raw = make_blob(contents)
+            RegistryBlob.store(sha256, contents, raw=raw)
+
+        assert RegistryBlob.objects.count() == 2
+
+    def test_raw_bytes_are_backfilled(self):
+        contents = {'a': 1}
+        sha256, raw = make_blob(contents)
+        # carried over from before the raw bytes were kept
+        RegistryBlob.store(sha256, contents)
+        assert not RegistryBlob.objects.get(pk=sha256).verify()
+
+        RegistryBlob.store(sha256, contents, raw=raw)
+        blob = RegistryBlob.objects.get(pk=sha256)
+        assert bytes(blob.raw) == raw
+        assert blob.size == len(raw)
+        assert blob.verify()
+
+
+class TestBlobBackfill:
+
+    migration = importlib.import_module('bcmr_main.migrations.0029_dedupe_registry_contents')
+
+    def get_registry(self, published_hash, hash_match=True):
+        return SimpleNamespace(
+            op_return=f'OP_RETURN 1380795202 {published_hash} 6578616d706c652e636f6d',
+            validity_checks={'bcmr_hash_match': hash_match}
+        )
+
+    def test_verified_registries_are_keyed_like_downloads(self):
+        sha256, _ = make_blob({'identities': {}})
+
+        # both ways the hash of the bytes is published
+        for published_hash in [sha256, sha256.encode().hex()]:
+            assert self.migration.get_published_hash(self.get_registry(published_hash)) == sha256
+
+    def test_unverified_registries_have_no_published_hash(self):
+        sha256, _ = make_blob({'identities': {}})
+
+        assert self.migration.get_published_hash(self.get_registry(sha256, hash_match=False)) is None
+        assert self.migration.get_published_hash(self.get_registry('not-a-hash')) is None
+
+
+@pytest.mark.django_db
+class TestCacheInvalidation:
+
+    @pytest.fixture(autouse=True)
+    def no_tasks(self, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+
+    def store(self, category, name):
+        contents = {
+            'identities': {
+                category: {'2023-07-21T01:33:01.724Z': {'name': name, 'token': {'category': category}}}
+            }
+        }
+        sha256, raw = make_blob(contents)
+        return RegistryBlob.store(sha256, contents, raw=raw)
+
+    def test_new_registry_bumps_the_version(self, memory_redis, django_capture_on_commit_callbacks):
+        key = get_cache_key('registry:token', 'category')
+        other_key = get_cache_key('registry:token', 'other')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Registry.objects.create(txid='txid', index=0, blob=self.store('category', 'Token'))
+
+        assert get_cache_key('registry:token', 'category') != key
+        assert get_cache_key('registry:token', 'other') == other_key
+
+    def test_only_a_replaced_document_bumps_the_version(self, memory_redis, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            Registry.objects.create(txid='txid', index=0, blob=self.store('category', 'Token'))
+        key = get_cache_key('registry:token', 'category')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            registry = Registry.objects.get()
+            registry.bcmr_request_status = 200
+            registry.save()
+            # the same document downloaded again
+            registry.blob = self.store('category', 'Token')
+            registry.save()
+        assert get_cache_key('registry:token', 'category') == key
+
+        with django_capture_on_commit_callbacks(execute=True):
+            registry.blob = self.store('category', 'Renamed')
+            registry.save()
+        assert get_cache_key('registry:token', 'category') != key
+
+
+@pytest.mark.django_db
+class TestSnapshotIndexing:
+
+    @pytest.fixture(autouse=True)
+    def no_tasks(self, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+
+    def store(self, types):
+        contents = {
+            'identities': {
+                'authbase': {
+                    '2023-07-21T01:33:01.724Z': {
+                        'name': 'Collection',
+                        'token': {'category': 'category', 'nfts': {'parse': {'types': types}}}
+                    }
+                }
+            }
+        }
+        sha256, raw = make_blob(contents)
+        return RegistryBlob.store(sha256, contents, raw=raw)
+
+    def test_rows_are_replaced_only_with_the_document(self):
+        registry = Registry.objects.create(txid='txid', index=0, blob=self.store({'01': {'name': 'One'}}))
+        snapshot_ids = list(IdentitySnapshot.objects.values_list('id', flat=True))
+        assert len(snapshot_ids) == 1
+
+        registry = Registry.objects.get()
+        registry.bcmr_request_status = 200
+        registry.save()
+        registry.blob = self.store({'01': {'name': 'One'}})
+        registry.save()
+        assert list(IdentitySnapshot.objects.values_list('id', flat=True)) == snapshot_ids
+
+        registry.blob = self.store({'01': {'name': 'One'}, '02': {'name': 'Two'}})
+        registry.save()
+        assert list(IdentitySnapshot.objects.values_list('id', flat=True)) != snapshot_ids
+        assert sorted(NftType.objects.values_list('type_key', flat=True)) == ['01', '02']
+
+
+@pytest.mark.django_db
+class TestLatestRegistry:
+
+    @pytest.fixture(autouse=True)
+    def no_tasks(self, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+
+    def create(self, category):
+        contents = {'identities': {'authbase': {'2023-07-21T01:33:01.724Z': {'token': {'category': category}}}}}
+        sha256, raw = make_blob(contents)
+        return Registry.objects.create(txid=sha256, index=0, blob=RegistryBlob.store(sha256, contents, raw=raw))
+
+    def test_category_is_matched_in_lowercase(self):
+        self.create('ab12')
+        registry = self.create('ab12')
+
+        assert get_latest_registry('ab12') == registry
+        assert get_latest_registry('AB12') == registry
+        with pytest.raises(Registry.DoesNotExist):
+            get_latest_registry('cd34')
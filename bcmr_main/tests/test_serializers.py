@@ -0,0 +1,82 @@
+import hashlib
+import json
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from bcmr_main.models import Registry, RegistryBlob, Token
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents
+from cts.models import CashToken
+from cts.serializers import CashTokenSerializer
+
+
+def create_collection(category):
+    contents = {
+        'identities': {
+            category: {
+                '2023-07-21T01:33:01.724Z': {
+                    'name': f'Collection {category}',
+                    'token': {
+                        'category': category,
+                        'symbol': 'NFT',
+                        'decimals': 0,
+                        'nfts': {'parse': {'types': {'01': {'name': 'One'}, '02': {'name': 'Two'}}}}
+                    }
+                }
+            }
+        }
+    }
+    raw = json.dumps(contents).encode()
+    blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+    Registry.objects.create(txid=blob.sha256, index=0, blob=blob)
+    Token.objects.create(category=category, amount=100)
+    Token.objects.create(category=category, is_nft=True, commitment='01', capability='none')
+    Token.objects.create(category=category, is_nft=True, commitment='02', capability='none')
+
+
+@pytest.mark.django_db
+class TestCashTokenMetadata:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        monkeypatch.setattr(materialize_token_documents, 'delay', lambda *args: None)
+        self.redis = memory_redis
+        self.request = Request(APIRequestFactory().get('/api/cashtokens/', {'include_metadata': 'true'}))
+
+    def serialize(self, categories):
+        # from the database, not from what the previous call cached
+        self.redis.flushall()
+        tokens = CashToken.objects.filter(category__in=categories).order_by('id')
+        with CaptureQueriesContext(connection) as queries:
+            data = CashTokenSerializer(tokens, many=True, context={'request': self.request}).data
+        return json.loads(json.dumps(data)), len(queries)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        categories = [f'category{index:02}' for index in range(8)]
+        for category in categories:
+            create_collection(category)
+
+        # the statements are prepared on first use
+        self.serialize(categories[:1])
+        _, small = self.serialize(categories[:1])
+        _, large = self.serialize(categories)
+        assert small == large
+
+    def test_same_metadata_as_per_token(self):
+        categories = ['category00', 'category01']
+        for category in categories:
+            create_collection(category)
+        Token.objects.create(category='unpublished', amount=1)
+
+        prefetched, _ = self.serialize(categories + ['unpublished'])
+        self.redis.flushall()
+        per_token = [
+            json.loads(json.dumps(CashTokenSerializer(token, context={'request': self.request}).data))
+            for token in CashToken.objects.filter(category__in=categories + ['unpublished']).order_by('id')
+        ]
+        assert prefetched == per_token
+        assert prefetched[1]['metadata']['nft']['01']['name'] == 'One'
+        assert prefetched[0]['metadata']['token']['token']['symbol'] == 'NFT'
+        assert prefetched[-1]['metadata']['token'] is None
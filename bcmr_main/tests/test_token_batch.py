@@ -0,0 +1,97 @@
+import hashlib
+import json
+import pytest
+from django.urls import reverse
+from bcmr_main.cache import ResponseCache
+from bcmr_main.materialize import materialize_registry
+from bcmr_main.models import Registry, RegistryBlob, Token
+from bcmr_main.tasks import materialize_registry_documents, materialize_token_documents
+
+
+def create_registry(category):
+    snapshot = {
+        'name': 'Token',
+        'token': {
+            'category': category,
+            'symbol': 'TKN',
+            'nfts': {'parse': {'types': {'01': {'name': 'One', 'uris': {'icon': 'ipfs://icon'}}}}}
+        }
+    }
+    contents = {'identities': {category: {'2023-07-21T01:33:01.724Z': snapshot}}}
+    raw = json.dumps(contents).encode()
+    blob = RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+    return Registry.objects.create(txid=blob.sha256, index=0, blob=blob)
+
+
+@pytest.mark.django_db
+class TestTokenBatchView:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        # materialized explicitly in the tests
+        monkeypatch.setattr(materialize_registry_documents, 'delay', lambda *args: None)
+        monkeypatch.setattr(materialize_token_documents, 'delay', lambda *args: None)
+
+    def post(self, client, tokens):
+        return client.post(reverse('token-batch'), {'tokens': tokens}, content_type='application/json')
+
+    def get_metadata(self, client, tokens):
+        response = self.post(client, tokens)
+        assert response.status_code == 200
+        return [result['metadata'] for result in response.json()['results']]
+
+    def test_cached_responses_are_served(self, client):
+        cached = ResponseCache('metadata:token', 'category')
+        cached.get()
+        cached.set(b'{"name": "Cached"}', ex=60)
+
+        assert self.get_metadata(client, ['category']) == [{'name': 'Cached'}]
+
+    def test_materialized_documents_are_served_and_cached(self, client, django_assert_max_num_queries):
+        Token.objects.create(category='category', is_nft=True, commitment='01', capability='none')
+        materialize_registry(create_registry('category'))
+
+        token, nft = self.get_metadata(client, ['category', {'category': 'category', 'type_key': '01'}])
+        assert token['name'] == 'Token'
+        assert nft['type_metadata']['name'] == 'One'
+
+        cached = ResponseCache('metadata:token', 'category', '01')
+        assert json.loads(cached.get()) == nft
+        with django_assert_max_num_queries(0):
+            self.get_metadata(client, ['category', {'category': 'category', 'type_key': '01'}])
+
+    def test_unmaterialized_registries_are_served_like_token_view(self, client, memory_redis):
+        Token.objects.create(category='category', is_nft=True, commitment='01', capability='none')
+        create_registry('category')
+        expected = [
+            client.get(reverse('token-info', kwargs={'category': 'category'})).json(),
+            client.get(reverse('token-type-info', kwargs={'category': 'category', 'type_key': '01'})).json(),
+        ]
+        memory_redis.flushall()
+
+        token, nft = self.get_metadata(client, ['category', {'category': 'category', 'type_key': '01'}])
+        assert [token, nft] == expected
+        assert token['is_nft'] and 'type_metadata' not in token
+        assert nft['type_metadata']['uris']['image'] == 'ipfs://icon'
+        assert json.loads(ResponseCache('metadata:token', 'category').get()) == token
+
+    def test_categories_without_metadata(self, client):
+        Token.objects.create(category='unpublished')
+
+        assert self.get_metadata(client, ['unpublished', 'unknown']) == [
+            {'category': 'unpublished', 'error': 'no valid metadata found'},
+            {'error': 'category not found'},
+        ]
+
+    def test_invalid_categories_are_rejected(self, client):
+        assert self.post(client, ['category', {'type_key': '01'}]).status_code == 400
+        assert self.post(client, ['x' * 101]).status_code == 400
+        assert self.post(client, 'category').status_code == 400
+
+    def test_oversized_batches_are_rejected(self, client, settings):
+        settings.METADATA_BATCH_MAX_SIZE = 2
+
+        assert self.post(client, ['a', 'b']).status_code == 200
+        response = self.post(client, ['a', 'b', 'c'])
+        assert response.status_code == 400
+        assert response.json() == {'error': 'at most 2 tokens per request'}
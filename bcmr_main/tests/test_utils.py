@@ -0,0 +1,56 @@
+from bcmr_main.circuit_breaker import CircuitBreaker
+from bcmr_main.utils import ResponseTooLarge, read_response
+import hashlib
+import pytest
+import requests
+
+
+class TestReadResponse:
+
+    def test_hash_is_computed_while_reading(self, streamed_response):
+        body = b'{"identities": {}}' * 10000
+        response = streamed_response(body)
+
+        content, sha256 = read_response(response, max_size=len(body))
+        assert content == body
+        assert sha256 == hashlib.sha256(body).hexdigest()
+        assert response.closed
+
+    def test_declared_size_over_the_cap_is_not_read(self, streamed_response):
+        response = streamed_response(b'x' * 100, headers={'Content-Length': '100'})
+
+        with pytest.raises(ResponseTooLarge):
+            read_response(response, max_size=99)
+        assert response.read == 0
+        assert response.closed
+
+    def test_streaming_stops_at_the_cap(self, streamed_response):
+        # no Content-Length, or a lying one
+        response = streamed_response(b'x' * 1024 * 1024, headers={'Content-Length': '10'})
+
+        with pytest.raises(ResponseTooLarge):
+            read_response(response, max_size=100 * 1024)
+        assert response.read < 200 * 1024
+        assert response.closed
+
+    def test_interrupted_body_is_a_host_failure(self, memory_redis, streamed_response):
+
+        class InterruptedResponse(streamed_response):
+
+            def iter_content(self, chunk_size):
+                yield self.body
+                raise requests.exceptions.ConnectionError('Connection reset by peer')
+
+        breaker = CircuitBreaker('example.com', client=memory_redis)
+        response = InterruptedResponse(b'{"identities"')
+        response.circuit_breaker = breaker
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            read_response(response)
+        assert breaker.status()['failures'] == 1
+        assert response.closed
+
+        response = streamed_response(b'{"identities": {}}')
+        response.circuit_breaker = breaker
+        read_response(response)
+        assert breaker.status()['failures'] == 0
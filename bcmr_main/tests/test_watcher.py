@@ -0,0 +1,174 @@
+import hashlib
+import json
+import threading
+import pytest
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from bcmr_main import tasks
+from bcmr_main.models import Registry, RegistryBlob
+from bcmr_main.watcher import claim_due_registries, next_watch_interval
+
+
+class TestNextWatchInterval:
+
+    def test_changed_registry_is_polled_at_minimum_interval(self):
+        interval = next_watch_interval(settings.WATCH_REGISTRY_MAX_INTERVAL, changed=True)
+        assert interval == settings.WATCH_REGISTRY_MIN_INTERVAL
+
+    def test_quiet_registry_backs_off_to_ceiling(self):
+        interval = settings.WATCH_REGISTRY_MIN_INTERVAL
+        for _ in range(50):
+            next_interval = next_watch_interval(interval)
+            assert next_interval >= settings.WATCH_REGISTRY_MIN_INTERVAL
+            assert next_interval <= settings.WATCH_REGISTRY_MAX_INTERVAL
+            interval = next_interval
+
+        # jitter keeps it slightly below the ceiling
+        assert interval >= settings.WATCH_REGISTRY_MAX_INTERVAL * 0.9
+
+    def test_failing_registry_is_spread_out(self):
+        intervals = [
+            next_watch_interval(settings.WATCH_REGISTRY_MIN_INTERVAL, failed=True, failures=6)
+            for _ in range(20)
+        ]
+        assert len(set(intervals)) > 1
+        for interval in intervals:
+            assert interval <= settings.WATCH_REGISTRY_FAILURE_MAX_INTERVAL
+            assert interval >= settings.WATCH_REGISTRY_MIN_INTERVAL
+
+
+def create_watched(next_check=None, **fields):
+    fields.setdefault('watch_for_changes', True)
+    return Registry.objects.create(
+        txid=f'txid{Registry.objects.count()}',
+        index=0,
+        watch_next_check=next_check,
+        **fields
+    )
+
+
+@pytest.mark.django_db
+class TestClaimDueRegistries:
+
+    def test_due_registries_are_claimed_and_leased(self):
+        now = timezone.now()
+        overdue = create_watched(now - timedelta(hours=1))
+        never_checked = create_watched()
+        due = create_watched(now - timedelta(seconds=1))
+        create_watched(now + timedelta(hours=1))
+        create_watched(now - timedelta(hours=1), watch_for_changes=False)
+
+        assert claim_due_registries() == [never_checked.id, overdue.id, due.id]
+        lease = timezone.now() + timedelta(seconds=settings.WATCH_REGISTRY_LEASE)
+        for registry in Registry.objects.filter(id__in=[never_checked.id, overdue.id, due.id]):
+            assert registry.watch_next_check > now
+            assert registry.watch_next_check <= lease
+
+        # leased until the watch task reschedules them
+        assert claim_due_registries() == []
+
+    def test_batch_size(self, settings):
+        settings.WATCH_REGISTRY_BATCH_SIZE = 2
+        registries = [create_watched() for _ in range(3)]
+
+        assert len(claim_due_registries()) == 2
+        assert len(claim_due_registries()) == 1
+        assert Registry.objects.filter(id__in=[registry.id for registry in registries], watch_next_check__isnull=True).count() == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_locked_registries_are_skipped():
+    locked = create_watched()
+    other = create_watched()
+    is_locked = threading.Event()
+    release = threading.Event()
+
+    def lock():
+        # e.g. a cycle that is still claiming
+        try:
+            with transaction.atomic():
+                Registry.objects.select_for_update().get(id=locked.id)
+                is_locked.set()
+                release.wait(10)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=lock)
+    thread.start()
+    try:
+        assert is_locked.wait(10)
+        assert claim_due_registries() == [other.id]
+    finally:
+        release.set()
+        thread.join()
+    assert claim_due_registries() == [locked.id]
+
+
+@pytest.mark.django_db
+class TestWatchRegistry:
+
+    @pytest.fixture(autouse=True)
+    def setup(self, memory_redis, monkeypatch):
+        self.results = []
+        self.resolved = []
+        monkeypatch.setattr(tasks.resolve_metadata, 'delay', self.resolved.append)
+
+        def process_op_return(txid, index, op_return, publisher, date):
+            validity_checks, blob = self.results.pop(0)
+            if blob is not None:
+                Registry.objects.filter(txid=txid, index=index).update(blob=blob)
+            return validity_checks, 'https://example.com/registry.json'
+        monkeypatch.setattr(tasks, 'process_op_return', process_op_return)
+
+    def store_blob(self, name):
+        contents = {'identities': {}, 'name': name}
+        raw = json.dumps(contents).encode()
+        return RegistryBlob.store(hashlib.sha256(raw).hexdigest(), contents, raw=raw)
+
+    def test_changed_registry_is_polled_soon(self):
+        registry = create_watched(watch_interval=settings.WATCH_REGISTRY_MAX_INTERVAL, watch_failures=3)
+        self.results.append(({'bcmr_file_accessible': True}, self.store_blob('changed')))
+
+        before = timezone.now()
+        tasks.watch_registry(registry.id)
+        registry.refresh_from_db()
+        assert registry.watch_interval == settings.WATCH_REGISTRY_MIN_INTERVAL
+        assert registry.watch_failures == 0
+        assert registry.watch_last_changed >= before
+        assert registry.watch_next_check == registry.watch_last_checked + timedelta(seconds=registry.watch_interval)
+        assert self.resolved == [registry.id]
+
+    def test_unchanged_registry_backs_off(self):
+        registry = create_watched(watch_interval=settings.WATCH_REGISTRY_MIN_INTERVAL)
+        self.results.append(({'bcmr_file_accessible': True}, None))
+
+        tasks.watch_registry(registry.id)
+        registry.refresh_from_db()
+        assert registry.watch_interval > settings.WATCH_REGISTRY_MIN_INTERVAL
+        assert registry.watch_last_changed is None
+        assert registry.watch_next_check > timezone.now()
+        assert self.resolved == []
+
+    def test_failures_are_counted(self):
+        registry = create_watched(watch_interval=settings.WATCH_REGISTRY_MIN_INTERVAL)
+        self.results += [(False, None), ({'bcmr_file_accessible': False}, None)]
+
+        tasks.watch_registry(registry.id)
+        tasks.watch_registry(registry.id)
+        registry.refresh_from_db()
+        assert registry.watch_failures == 2
+        assert registry.watch_next_check > timezone.now()
+        assert self.resolved == []
+
+    def test_due_registries_are_dispatched(self, monkeypatch):
+        dispatched = []
+        monkeypatch.setattr(tasks.watch_registry, 'delay', dispatched.append)
+        due = create_watched()
+        create_watched(timezone.now() + timedelta(hours=1))
+
+        tasks.watch_registry_changes()
+        assert dispatched == [due.id]
+        tasks.watch_registry_changes()
+        assert dispatched == [due.id]
@@ -15,6 +15,7 @@ router = routers.DefaultRouter()
 urlpatterns = router.urls
 urlpatterns += [
     re_path(r"^status/latest-block/$", views.LatestBlockView.as_view(), name='latest-block-info'),
+    re_path(r"^tokens/batch/$", views.TokenBatchView.as_view(), name='token-batch'),
     re_path(r"^tokens/(?P<category>[\w+:]+)/icon-symbol$", views.TokenIconSymbolView.as_view(), name='token-icon-symbol-info'),
     re_path(r"^tokens/(?P<category>[\w+:]+)/$", views.TokenView.as_view(), name='token-info'),
     re_path(r"^tokens/(?P<category>[\w+:]+)/(?P<type_key>[\w+:]+)/$", views.TokenView.as_view(), name='token-type-info'),
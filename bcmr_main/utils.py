@@ -3,6 +3,7 @@ from django.utils import timezone
 from requests.adapters import HTTPAdapter, Retry
 from urllib3.exceptions import LocationParseError
 from bcmr_main.models import *
+from bcmr_main.circuit_breaker import get_circuit_breaker
 from dateutil import parser
 from datetime import datetime
 import pytz
@@ -47,19 +48,38 @@ def decode_url(encoded_url):
 
 def _request_url(url):
     response = None
+    breaker = get_circuit_breaker(url)
+    if breaker and not breaker.allow_request():
+        LOGGER.info(f'Circuit open for {breaker.host}, skipping download from: {url}')
+        return response
+
     try:
         session = requests.Session()
         retry_triggers = tuple( x for x in requests.status_codes._codes if x not in [200, 301, 302, 307, 308, 404])
         retries = Retry(total=7, backoff_factor=0.1, status_forcelist=retry_triggers)
         session.mount('https://', HTTPAdapter(max_retries=retries))
         LOGGER.info('Downloading from: ' + url)
-        response = session.get(url, timeout=30)
-    except requests.exceptions.ConnectionError:
-        pass
+        response = session.get(url, timeout=30, stream=True)
+    except (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.RetryError
+    ):
+        if breaker:
+            breaker.record_failure()
     except requests.exceptions.InvalidURL:
         pass
     except LocationParseError:
         pass
+
+    if breaker and response is not None:
+        if response.status_code >= 500:
+            breaker.record_failure()
+        elif response.status_code == 200:
+            # the body can still stall or be cut off, read_response() records the outcome
+            response.circuit_breaker = breaker
+        else:
+            breaker.record_success()
     return response
 
 
@@ -78,13 +98,57 @@ def download_url(url):
         for ipfs_gateway in ipfs_gateways:
             final_url = f'https://{ipfs_gateway}/ipfs/{ipfs_cid}'
             response = _request_url(final_url)
-            if response.status_code == 200:
-                return response
+            if response is not None:
+                if response.status_code == 200:
+                    return response
+                response.close()
     else:
         response = _request_url(url)
     return response
 
 
+class ResponseTooLarge(Exception):
+    pass
+
+
+def read_response(response, max_size=None):
+    """
+    Reads a streamed response body of at most `max_size` bytes.
+    Returns the body and its sha256 hex digest, computed while streaming.
+    Records the outcome on the circuit breaker of the host once the body is read.
+    """
+    max_size = max_size or settings.BCMR_MAX_DOWNLOAD_SIZE
+    breaker = getattr(response, 'circuit_breaker', None)
+    failed = False
+    try:
+        content_length = response.headers.get('Content-Length') or ''
+        if content_length.isdigit() and int(content_length) > max_size:
+            raise ResponseTooLarge(f'{response.url} is {content_length} bytes')
+
+        hasher = hashlib.sha256()
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            size += len(chunk)
+            if size > max_size:
+                raise ResponseTooLarge(f'{response.url} exceeds {max_size} bytes')
+            hasher.update(chunk)
+            chunks.append(chunk)
+    except requests.exceptions.RequestException:
+        # timeouts and connection resets in the middle of the body
+        failed = True
+        raise
+    finally:
+        response.close()
+        if breaker:
+            if failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+    return b''.join(chunks), hasher.hexdigest()
+
+
 def send_webhook_token_update(category, index, txid, commitment=None, capability=None):
     if settings.WATCHTOWER_WEBHOOK_URL:
         token = Token.objects.get(
@@ -1,6 +1,7 @@
 from bcmr_main.views.home_view import *
 from bcmr_main.views.registry_view import *
 from bcmr_main.views.token_view import *
+from bcmr_main.views.token_batch_view import *
 from bcmr_main.views.status_view import *
 from bcmr_main.views.token_icon_symbol_view import *
 from bcmr_main.views.authchain_view import *
@@ -1,26 +1,31 @@
 from rest_framework.views import APIView
 from rest_framework import status
 from django.http import JsonResponse
-from django.db.models import ExpressionWrapper, CharField, F, Q
 from rest_framework.decorators import api_view
 from bcmr_main.models import Registry
+from bcmr_main.etags import conditional
 from bcmr_main.app.BitcoinCashMetadataRegistry import BitcoinCashMetadataRegistry
 
+
+def get_latest_registry(category):
+    """
+    Returns the latest registry with an identity snapshot of the token category, through the
+    IdentitySnapshot (category, registry) index instead of a text scan of every document.
+
+    Token categories are hex and looked up in lowercase as well as as given. Unlike the
+    case-insensitive text scan this replaced, a document that spells a category in uppercase
+    is only found by that exact spelling. Registries ingested before the IdentitySnapshot
+    rows existed are only found once migration 0033 has backfilled theirs.
+    """
+    categories = {category, category.lower()}
+    return Registry.objects.select_related('blob').filter(identity_snapshots__category__in=categories).latest('id')
+
+
 @api_view(['GET'])
+@conditional
 def get_contents(request, category):
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             bcmr = BitcoinCashMetadataRegistry(registry.contents)
             return JsonResponse(bcmr.contents)
@@ -34,20 +39,10 @@ def get_contents(request, category):
 
 
 @api_view(['GET'])
+@conditional
 def get_token(request, category):
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             bcmr = BitcoinCashMetadataRegistry(registry.contents)
             if bcmr.get_token():
@@ -63,20 +58,10 @@ def get_token(request, category):
         return JsonResponse({'error': 'Bad request'}, status=400)
 
 @api_view(['GET'])
+@conditional
 def get_uris(request, category):
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             bcmr = BitcoinCashMetadataRegistry(registry.contents)
             if bcmr.get_uris():
@@ -92,20 +77,10 @@ def get_uris(request, category):
         return JsonResponse({'error': 'Bad request'}, status=400)
     
 @api_view(['GET'])
+@conditional
 def get_icon_uri(request, category):
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             bcmr = BitcoinCashMetadataRegistry(registry.contents)
 
@@ -122,20 +97,10 @@ def get_icon_uri(request, category):
         return JsonResponse({'error': 'Bad request'}, status=400)
     
 @api_view(['GET'])
+@conditional
 def get_token_nft(request, category, commitment):
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             bcmr = BitcoinCashMetadataRegistry(registry.contents)
             if bcmr.get_nft(commitment):
@@ -151,23 +116,13 @@ def get_token_nft(request, category, commitment):
         return JsonResponse({'error': 'Bad request'}, status=400)
 
 @api_view(['GET'])
+@conditional
 def get_published_url(request, category):
     """
     The url published on the op_return
     """
     try:
-        # registry = Registry.objects.filter(
-        #             contents__contains={'registryIdentity': category}
-        #         ).latest('id')
-        # try another method
-        cond1 = f'"category":"{category}"'
-        cond2 = f'"category": "{category}"'
-        registry = Registry.objects.annotate(
-                contents_string=ExpressionWrapper(
-                    F('contents'),
-                    output_field=CharField()
-                )
-            ).filter(Q(contents_string__icontains=cond1) | Q(contents_string__icontains=cond2)).latest('id')
+        registry = get_latest_registry(category)
         if registry.contents:
             if registry.bcmr_url:
                 return JsonResponse({'url': registry.bcmr_url})
@@ -1,31 +1,38 @@
 from rest_framework.views import APIView
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from rest_framework import status
 from rest_framework.response import Response
 from bcmr_main.models import Registry
-from decouple import config
-import redis
+from bcmr_main.cache import ResponseCache
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
+from bcmr_main.materialize import get_response_variants
+from bcmr_main.compression import compress_variants, get_cached_response, negotiate
 import json
 
 class RegistryView(APIView):
     
     allowed_methods = ['GET']
 
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         category = kwargs.get('category', '')
         if not category:
             return JsonResponse(data=None, safe=False)
         
-        client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-        cache_key = f'registry:token:{category}'
-        cached_response = client.get(cache_key)
-        if cached_response:
-            response = json.loads(cached_response)
-        else:
+        cached = ResponseCache('registry:token', category)
+        response = get_cached_response(request, cached)
+        if response is not None:
+            return response
+
+        body, variants, etag = get_response_variants('registry', category)
+        if body is None:
             try:
-                registry = Registry.objects.filter(contents__identities__has_key=category).latest('id')
-                response = registry.contents
-                client.set(cache_key, json.dumps(response), ex=(60 * 60 * 24))
+                registry = Registry.objects.select_related('blob').filter(blob__contents__identities__has_key=category).latest('id')
             except Registry.DoesNotExist:
                 return Response(status=status.HTTP_404_NOT_FOUND)
-        return JsonResponse(response, safe=False)
+            body = json.dumps(registry.contents).encode()
+            variants = compress_variants(body)
+        cached.set(body, ex=settings.CACHE_TTL, variants=variants, etag=etag)
+        return negotiate(request, body, variants, etag=etag)
@@ -0,0 +1,157 @@
+from rest_framework.views import APIView
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from bcmr_main.models import Registry, ResponseDocument, Token
+from bcmr_main.cache import get_cache_keys, get_many_bodies, set_many_bodies
+from bcmr_main.etags import get_etag
+from bcmr_main.materialize import get_latest_identity_snapshot, transform_to_paytaca_expected_format
+import json
+import copy
+
+
+def parse_batch(data):
+    """
+    Returns the deduplicated (category, type_key) pairs of a batch request, e.g.
+    {"tokens": ["<category>", {"category": "<category>", "type_key": "<commitment>"}]}
+    or raises ValueError
+    """
+    tokens = data.get('tokens') if isinstance(data, dict) else None
+    if not isinstance(tokens, list):
+        raise ValueError('tokens must be a list')
+    if len(tokens) > settings.METADATA_BATCH_MAX_SIZE:
+        raise ValueError(f'at most {settings.METADATA_BATCH_MAX_SIZE} tokens per request')
+
+    items = []
+    for token in tokens:
+        if isinstance(token, str):
+            token = {'category': token}
+        if not isinstance(token, dict):
+            raise ValueError('tokens must be categories or objects with a category')
+        category = token.get('category')
+        type_key = token.get('type_key') or ''
+        if not isinstance(category, str) or not category or len(category) > 100:
+            raise ValueError('invalid category')
+        if not isinstance(type_key, str) or len(type_key) > 255:
+            raise ValueError('invalid type_key')
+        if (category, type_key) not in items:
+            items.append((category, type_key))
+    return items
+
+
+def get_latest_identity_snapshots(categories):
+    """
+    Returns a dict of category -> latest identity snapshot in the latest registry with
+    identities under the category, as TokenView looks them up, with one query for all of them
+    """
+    snapshots = {}
+    remaining = set(categories)
+    if not remaining:
+        return snapshots
+    registries = Registry.objects.select_related('blob').filter(
+        blob__contents__identities__has_any_keys=sorted(remaining)
+    ).order_by('-id')
+    for registry in registries.iterator():
+        identities = registry.contents.get('identities') or {}
+        for category in remaining.intersection(identities):
+            if isinstance(identities[category], dict):
+                snapshots[category] = get_latest_identity_snapshot(identities[category])
+        remaining.difference_update(identities)
+        if not remaining:
+            break
+    return snapshots
+
+
+class TokenBatchView(APIView):
+    """
+    The TokenView responses of many tokens in one request: cached bodies in one MGET,
+    the response documents of the misses in one query, and the registries of the categories
+    that are not materialized in another
+    """
+
+    allowed_methods = ['POST']
+
+    def post(self, request, *args, **kwargs):
+        try:
+            items = parse_batch(request.data)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+        # same keys as TokenView
+        cache_keys = dict(zip(items, get_cache_keys(
+            'metadata:token',
+            [(category, type_key) if type_key else (category,) for category, type_key in items]
+        )))
+        bodies = dict(zip(items, get_many_bodies(cache_keys[item] for item in items)))
+
+        misses = [item for item in items if bodies[item] is None]
+        if misses:
+            documents = {
+                (category, key): (bytes(body), etag or get_etag(body))
+                for category, key, body, etag in ResponseDocument.objects.filter(
+                    kind='token',
+                    category__in={category for category, _ in misses},
+                    key__in={''} | {'empty' if type_key == 'none' else type_key for _, type_key in misses}
+                ).values_list('category', 'key', 'body', 'etag')
+            }
+
+            # cached along with their ETags, like ResponseCache does
+            found = {}
+            for category, type_key in misses:
+                document = documents.get((category, 'empty' if type_key == 'none' else type_key))
+                if document is not None:
+                    found[(category, type_key)] = document
+                elif type_key and (category, '') in documents:
+                    # unknown NFT types get the identity snapshot without type metadata, uncached
+                    bodies[(category, type_key)] = documents[(category, '')][0]
+
+            missing = [item for item in misses if item not in found and bodies[item] is None]
+            latest_tokens = {}
+            if missing:
+                # is_nft of the latest token of each category, as in TokenView
+                latest_tokens = dict(
+                    Token.objects.filter(category__in={category for category, _ in missing})
+                    .order_by('category', '-id')
+                    .distinct('category')
+                    .values_list('category', 'is_nft')
+                )
+                snapshots = get_latest_identity_snapshots(latest_tokens)
+                for category, type_key in missing:
+                    if not snapshots.get(category):
+                        continue
+                    # transform_to_paytaca_expected_format() takes the NFT types out of the snapshot
+                    data, type_key_exists = transform_to_paytaca_expected_format(
+                        copy.deepcopy(snapshots[category]),
+                        type_key,
+                        latest_tokens[category]
+                    )
+                    if type_key_exists or not type_key:
+                        body = json.dumps(data).encode()
+                        found[(category, type_key)] = (body, get_etag(body))
+
+            cached = {}
+            for item, (body, etag) in found.items():
+                bodies[item] = body
+                if cache_keys[item]:
+                    cached[cache_keys[item]] = body
+                    cached[f'{cache_keys[item]}:etag'] = etag
+            set_many_bodies(cached, ex=settings.CACHE_TTL)
+
+            for category, type_key in items:
+                if bodies[(category, type_key)] is not None:
+                    continue
+                if category in latest_tokens:
+                    error = {'category': category, 'error': 'no valid metadata found'}
+                else:
+                    error = {'error': 'category not found'}
+                bodies[(category, type_key)] = json.dumps(error).encode()
+
+        # the bodies are spliced in as they are, without decoding them
+        results = b','.join(
+            b'{"category":%s,"type_key":%s,"metadata":%s}' % (
+                json.dumps(category).encode(),
+                json.dumps(type_key or None).encode(),
+                bodies[(category, type_key)]
+            )
+            for category, type_key in items
+        )
+        return HttpResponse(b'{"results":[' + results + b']}', content_type='application/json')
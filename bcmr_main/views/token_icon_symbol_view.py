@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from django.http import JsonResponse
 from bcmr_main.app.BitcoinCashMetadataRegistry import BitcoinCashMetadataRegistry
 from bcmr_main.models import Token, TokenMetadata
+from bcmr_main.bloom import TOKEN_CATEGORIES, is_known_missing, remember_missing
 from jsonschema import ValidationError
 
 class TokenIconSymbolView(APIView):
@@ -12,11 +13,14 @@ class TokenIconSymbolView(APIView):
         category = kwargs.get('category', '')
         token = None
         response = {}
+        if is_known_missing(TOKEN_CATEGORIES, category):
+          return JsonResponse({'error': 'category not found'})
         try:
           token = Token.objects.get(
             category=category
           )
         except Token.DoesNotExist:
+          remember_missing(TOKEN_CATEGORIES, category)
           response = {
                 'error': 'category not found'
             }
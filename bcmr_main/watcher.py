@@ -0,0 +1,86 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from bcmr_main.models import Registry
+import random
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+def next_watch_interval(interval, changed=False, failed=False, failures=0):
+    """
+    Returns the number of seconds until a watched registry is polled again.
+    Registries that changed are polled at the minimum interval, quiet ones back off
+    exponentially up to a ceiling and failing hosts back off harder with full jitter
+    so that retries against the same dead host do not line up.
+    """
+    min_interval = settings.WATCH_REGISTRY_MIN_INTERVAL
+    max_interval = settings.WATCH_REGISTRY_MAX_INTERVAL
+
+    if failed:
+        ceiling = min(
+            min_interval * (2 ** failures),
+            settings.WATCH_REGISTRY_FAILURE_MAX_INTERVAL
+        )
+        return max(min_interval, int(random.uniform(ceiling / 2, ceiling)))
+
+    if changed or not interval:
+        return min_interval
+
+    interval = min(interval * settings.WATCH_REGISTRY_BACKOFF_FACTOR, max_interval)
+    # spread out registries that settled on the same interval
+    jitter = interval * 0.1
+    return max(min_interval, int(random.uniform(interval - jitter, interval)))
+
+
+def claim_due_registries(limit=None):
+    """
+    Returns the IDs of the watched registries that are due for polling, most overdue first.
+    Claimed rows are leased by moving their next check forward so that a slow cycle
+    does not get them dispatched twice.
+    """
+    now = timezone.now()
+    limit = limit or settings.WATCH_REGISTRY_BATCH_SIZE
+
+    with transaction.atomic():
+        due = Registry.objects.select_for_update(skip_locked=True).filter(
+            Q(watch_next_check__isnull=True) | Q(watch_next_check__lte=now),
+            watch_for_changes=True
+        ).order_by(
+            F('watch_next_check').asc(nulls_first=True)
+        ).values_list('id', flat=True)[:limit]
+
+        registry_ids = list(due)
+        lease = timedelta(seconds=settings.WATCH_REGISTRY_LEASE)
+        Registry.objects.filter(id__in=registry_ids).update(watch_next_check=now + lease)
+
+    return registry_ids
+
+
+def schedule_next_watch(registry, changed=False, failed=False):
+    now = timezone.now()
+    failures = registry.watch_failures + 1 if failed else 0
+    interval = next_watch_interval(
+        registry.watch_interval,
+        changed=changed,
+        failed=failed,
+        failures=failures
+    )
+
+    fields = {
+        'watch_interval': interval,
+        'watch_failures': failures,
+        'watch_last_checked': now,
+        'watch_next_check': now + timedelta(seconds=interval)
+    }
+    if changed:
+        fields['watch_last_changed'] = now
+
+    LOGGER.info(f'Next check of registry ID #{registry.id} in {interval}s (changed: {changed}, failures: {failures})')
+
+    # update() instead of save() to keep the registry post_save receivers out of this
+    Registry.objects.filter(id=registry.id).update(**fields)
+    return interval
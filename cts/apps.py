@@ -5,3 +5,6 @@ class CtsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cts'
 
+
+    def ready(self):
+        import cts.materialize
@@ -0,0 +1,29 @@
+from bcmr_main.materialize import register_renderer
+from .registrycontenthelpers import get_identity_snapshot, get_identity_snapshot_basic, get_token_category_basic
+
+
+def _documents(registry, data):
+  """
+  The documents of a helper's response, None if it was read from another registry
+  """
+  if not data:
+    return {}
+  if data['_meta']['registry_id'] != registry.id:
+    return None
+  return {'': data}
+
+
+@register_renderer('identity-snapshot')
+def render_identity_snapshot(registry, category):
+  return _documents(registry, get_identity_snapshot_basic(category))
+
+
+# IdentitySnapshot with include_token_nfts=true, mostly large enough for its compressed variants
+@register_renderer('identity-snapshot-nfts')
+def render_identity_snapshot_nfts(registry, category):
+  return _documents(registry, get_identity_snapshot(category))
+
+
+@register_renderer('token-category')
+def render_token_category(registry, category):
+  return _documents(registry, get_token_category_basic(category))
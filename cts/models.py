@@ -1,11 +1,26 @@
-import redis
-import json
 from django.db import models
 from bcmr_main.models import Token
 from bcmr_main.models import Registry
-from decouple import config
+from django.conf import settings
+from bcmr_main.cache import (
+  claim_many_refreshes,
+  claim_refresh,
+  get_cache_key,
+  get_cache_keys,
+  get_cache_ttl,
+  get_cache_ttls,
+  get_json,
+  get_many_json,
+  set_json,
+  set_many_json
+)
 from .tasks import update_nftmetadata_cache, update_tokencategorymetadata_cache
-from .registrycontenthelpers import get_token_category_basic, get_nft_type
+from .registrycontenthelpers import (
+  get_nft_type,
+  get_nft_type_many,
+  get_token_category_basic,
+  get_token_category_basic_many
+)
 
 class CashToken(Token):
   
@@ -13,42 +28,96 @@ class CashToken(Token):
   def nft_type(self):
     if not self.capability:
       return None
-    client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-    cache_key = f'nftmetadata:{self.category}:{self.commitment}'  
-    metadata = client.get(cache_key)
+    if hasattr(self, '_nft_type'):
+      return self._nft_type
+    cache_key = get_cache_key('nftmetadata', self.category, f'{self.commitment}')
+    metadata = get_json(cache_key)
     
     if metadata:
-      update_nftmetadata_cache.delay(self.category, self.commitment, cache_key)
-      return json.loads(metadata)
+      if claim_refresh(cache_key):
+        update_nftmetadata_cache.delay(self.category, self.commitment)
+      return metadata
     metadata = get_nft_type(category=self.category, commitment=self.commitment)
     if metadata:
-      try:
-        client.set(cache_key, json.dumps(metadata), ex=(60 * 30))
-      except Exception as e:
-        pass
+      set_json(cache_key, metadata, ex=get_cache_ttl(self.category), stale_after=settings.CACHE_REFRESH_INTERVAL)
     
     return metadata
   
   @property
   def token_category(self):
+    if hasattr(self, '_token_category'):
+      return self._token_category
 
-    client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-    cache_key = f'tokencategorymetadata:{self.category}'
-    metadata = client.get(cache_key)
+    cache_key = get_cache_key('tokencategorymetadata', self.category)
+    metadata = get_json(cache_key)
     
     if metadata:
-      metadata = json.loads(metadata)
-      update_tokencategorymetadata_cache.delay(self.category, cache_key)
+      if claim_refresh(cache_key):
+        update_tokencategorymetadata_cache.delay(self.category)
       return metadata
     
     try:
       metadata = get_token_category_basic(category=self.category)
       if metadata:
-        client.set(cache_key,json.dumps(metadata), ex=(60 * 30))
+        set_json(cache_key, metadata, ex=get_cache_ttl(self.category), stale_after=settings.CACHE_REFRESH_INTERVAL)
     except Exception as e:
       pass
 
     return metadata
-      
+
+  @staticmethod
+  def prefetch_metadata(tokens):
+    """
+    Resolves the nft_type and token_category of a page of tokens together: the cached
+    values in one MGET, and the misses with one query per kind instead of one per token
+    """
+    tokens = list(tokens)
+    categories = list({token.category for token in tokens})
+    pairs = list({(token.category, token.commitment) for token in tokens if token.capability})
+
+    category_keys = dict(zip(categories, get_cache_keys('tokencategorymetadata', [(category,) for category in categories])))
+    nft_keys = dict(zip(pairs, get_cache_keys('nftmetadata', [(category, f'{commitment}') for category, commitment in pairs])))
+    keys = [*category_keys.values(), *nft_keys.values()]
+    cached = dict(zip(keys, get_many_json(keys)))
+
+    token_categories = {category: cached.get(key) for category, key in category_keys.items()}
+    nft_types = {pair: cached.get(key) for pair, key in nft_keys.items()}
+
+    # cached values are served, the stale ones are refreshed in the background
+    refreshes = set(claim_many_refreshes([key for key in keys if cached.get(key)]))
+    for category, key in category_keys.items():
+      if key in refreshes:
+        update_tokencategorymetadata_cache.delay(category)
+    for (category, commitment), key in nft_keys.items():
+      if key in refreshes:
+        update_nftmetadata_cache.delay(category, commitment)
+
+    found = {}
+    missing = [category for category, metadata in token_categories.items() if not metadata]
+    if missing:
+      for category, metadata in get_token_category_basic_many(missing).items():
+        token_categories[category] = metadata
+        found[category_keys[category]] = (category, metadata)
+    missing = [pair for pair, metadata in nft_types.items() if not metadata]
+    if missing:
+      for pair, metadata in get_nft_type_many(missing).items():
+        nft_types[pair] = metadata
+        found[nft_keys[pair]] = (pair[0], metadata)
+
+    found = {key: value for key, value in found.items() if key}
+    if found:
+      ttls = get_cache_ttls({category for category, _ in found.values()})
+      set_many_json(
+        {key: metadata for key, (_, metadata) in found.items()},
+        ex={key: ttls[category] for key, (category, _) in found.items()},
+        stale_after=settings.CACHE_REFRESH_INTERVAL
+      )
+
+    for token in tokens:
+      token._token_category = token_categories.get(token.category)
+      if token.capability:
+        token._nft_type = nft_types.get((token.category, token.commitment))
+    return tokens
+
   class Meta:
     proxy = True
\ No newline at end of file
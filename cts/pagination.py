@@ -0,0 +1,44 @@
+from django.db import DatabaseError, connection
+from rest_framework.pagination import CursorPagination
+import logging
+import json
+
+LOGGER = logging.getLogger(__name__)
+
+
+def estimate_count(queryset):
+    """
+    Returns the planner's estimate of the number of rows of the queryset, without counting them:
+    the pg_class statistics of the table for an unfiltered queryset, the row estimate
+    of its query plan otherwise. Returns None if there is no estimate.
+    """
+    try:
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                # -1 until the table is first vacuumed or analyzed
+                if row and row[0] >= 0:
+                    return row[0]
+                return None
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+    except DatabaseError as exc:
+        LOGGER.warning(f'Unable to estimate the row count of {queryset.model._meta.db_table}: {exc}')
+        return None
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class CashTokenCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the token ID: every page is an index range scan from where the
+    previous one ended, so deep pages cost the same as the first one
+    """
+    page_size = 10
+    ordering = '-id'
@@ -1,6 +1,24 @@
 import json
-import datetime
+from urllib.parse import quote
+from django.utils import timezone
 from bcmr_main.models import Registry
+from bcmr_main.queries import (
+    FIND_REGISTRY,
+    FIND_REGISTRY_ID,
+    FIND_REGISTRY_WITH_IDENTITIES,
+    IDENTITY_SNAPSHOT,
+    IDENTITY_SNAPSHOT_BASIC,
+    IDENTITY_SNAPSHOT_NFT_TYPE,
+    NFT_TYPE,
+    NFT_TYPE_MANY,
+    NFT_TYPES,
+    NFT_TYPES_AFTER,
+    NFT_TYPES_BEFORE,
+    NFT_TYPES_COUNT,
+    NFTS,
+    TOKEN_CATEGORY_BASIC,
+    TOKEN_CATEGORY_BASIC_MANY
+)
 
 
 # def get_identity_history(authbase):
@@ -48,108 +66,45 @@ from bcmr_main.models import Registry
 #             }
 #         }
 
+def _token_category_basic(row):
+    return {
+        'token': {
+            'symbol': row.symbol.replace('"',''),
+            'decimals': row.decimals,
+            'category': row.category.replace('"',''),
+        },
+        '_meta': {
+            'registry_id': row.id,
+            'authbase': row.authbase.replace('"',''),
+            'identity_history': row.identity_history.replace('"',''),
+        }
+    }
+
 def get_token_category_basic(category):
     """
     Return the basic TokenCategory details
     """
-    query = """
-        SELECT 
-            id, 
-            authbase, 
-            identity_history, 
-            symbol,
-            decimals,
-            category
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS symbol,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimal') AS decimals,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history
-            ORDER BY identity_history DESC 
-        ) AS subquery
-        
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC
-        LIMIT 1;
-    """ % (category, datetime.datetime.utcnow().isoformat())
-    r = Registry.objects.raw(query)
+    r = TOKEN_CATEGORY_BASIC.raw(Registry, [category, timezone.now()])
     if r:
-        return {
-            'token': {
-                'symbol': r[0].symbol.replace('"',''),
-                'decimals': r[0].decimals,
-                'category': r[0].category.replace('"',''),
-            },
-            '_meta': {
-                'registry_id': r[0].id,
-                'authbase': r[0].authbase.replace('"',''),
-                'identity_history': r[0].identity_history.replace('"',''),
-            }
-        }
+        return _token_category_basic(r[0])
+
+def get_token_category_basic_many(categories):
+    """
+    get_token_category_basic() of many categories in one query,
+    as a dict of category -> details of the categories that have them
+    """
+    categories = list(set(categories))
+    if not categories:
+        return {}
+    r = TOKEN_CATEGORY_BASIC_MANY.raw(Registry, [categories, timezone.now()])
+    return {item.snapshot_category: _token_category_basic(item) for item in r}
 
 def get_identity_snapshot(category):
     """
     Return To
     """
 
-    query = """
-        SELECT 
-            id, 
-            authbase, 
-            identity_history, 
-            identity_snapshot,
-            category
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history) AS identity_snapshot,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history
-            ORDER BY identity_history DESC 
-        ) AS subquery
-        
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC
-        LIMIT 1;
-    """ % (category, datetime.datetime.utcnow().isoformat())
-
-    r = Registry.objects.raw(query)
+    r = IDENTITY_SNAPSHOT.raw(Registry, [category, timezone.now()])
     if r:
         identity_snapshot = r[0].identity_snapshot
         if identity_snapshot:
@@ -169,61 +124,7 @@ def get_identity_snapshot_nft_type(category, nft_type_key):
     Return To IdentitySnapshot of the particular NftType;s key. Where key is a commitment or bottomAltStackHex
     """
 
-    query = """
-        SELECT DISTINCT ON(nft_type_key) *
-        FROM (
-            SELECT 
-                id,
-                authbase,
-                identity_history,
-                nft_type_key,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'name') AS name,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'description') AS description,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'uris') AS uris,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'tags') AS tags,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'migrated') AS migrated,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'status') AS status,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'split_id') AS split_id,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'extensions') AS extensions,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS token_symbol,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS token_category,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimals') AS token_decimals,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'bytecode') AS nft_parse_bytecode,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'types', nft_type_key) AS nft_type
-
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                        THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS nft_type_key
-                WHERE nft_type_key = '%s'
-        ) AS subquery
-        
-        WHERE category = '"%s"' and identity_history <= '%s' 
-        ORDER BY nft_type_key, identity_history DESC 
-    """ % (nft_type_key, category, datetime.datetime.utcnow().isoformat())
-
-
-    r = Registry.objects.raw(query)
+    r = IDENTITY_SNAPSHOT_NFT_TYPE.raw(Registry, [category, timezone.now(), nft_type_key])
     if r and r[0]:
         identity_snapshot_fields = [
             'name',
@@ -250,7 +151,7 @@ def get_identity_snapshot_nft_type(category, nft_type_key):
                 'parse': {
                     'bytecode': getattr(r[0], 'nft_parse_bytecode', None),
                     'types': {
-                        r[0].nft_type_key: json.loads(getattr(r[0], 'nft_type', None))
+                        nft_type_key: json.loads(getattr(r[0], 'nft_type', None))
                     }
                 }
             }
@@ -264,7 +165,7 @@ def get_identity_snapshot_nft_type(category, nft_type_key):
                 'category': category,
                 'authbase': r[0].authbase.replace('"',''),
                 'identity_history': r[0].identity_history.replace('"',''),
-                'nft_type_key': r[0].nft_type_key,
+                'nft_type_key': nft_type_key,
 
             }
         }
@@ -276,64 +177,7 @@ def get_identity_snapshot_basic(category):
     The token field contains nfts.
     Omit <IdentitySnapshot, 'token'>
     """
-    query = """
-        SELECT 
-            id, 
-            authbase, 
-            identity_history, 
-            name,
-            description,
-            tags,
-            migrated,
-            status,
-            split_id,
-            uris,
-            extensions,
-            token_category,
-            token_symbol,
-            token_decimals,
-            token_nfts_parse_bytecode
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'name') AS name,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'description') AS description,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'tags') AS tags,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'migrated') AS migrated,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'status') AS status,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'splitId') AS split_id,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'uris') AS uris,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'extensions') AS extensions,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS token_category,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'symbol') AS token_symbol,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'decimals') AS token_decimals,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts', 'parse', 'bytecode') AS token_nfts_parse_bytecode
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history
-            ORDER BY identity_history DESC
-        ) AS subquery
-        
-        WHERE token_category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC
-        LIMIT 1;
-    """ % (category, datetime.datetime.utcnow().isoformat())
-    r = Registry.objects.raw(query)
+    r = IDENTITY_SNAPSHOT_BASIC.raw(Registry, [category, timezone.now()])
     if r:
         identity_snapshot = {
             'name': json.loads(r[0].name or '""')
@@ -381,44 +225,7 @@ def get_nfts(category):
     Returns the NftCategory
     """
     
-    query = """
-        SELECT 
-            id, 
-            category,
-            authbase, 
-            identity_history, 
-            nft_category
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history
-            ORDER BY identity_history DESC
-        ) AS subquery
-        
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC
-        LIMIT 1;
-    """ % (category, datetime.datetime.utcnow().isoformat())
-    r = Registry.objects.raw(query)
+    r = NFTS.raw(Registry, [category, timezone.now()])
     if r:
         nft_category = r[0].nft_category
         if nft_category and type(nft_category) == str:
@@ -432,200 +239,51 @@ def get_nfts(category):
                 'identity_history': r[0].identity_history.replace('"',''),
             }
         }
-    
-def _paginator(count, limit, offset, url):
-    if count == 0:
-        return {
-        'count': 0,
-        'limit': limit,
-        'offset': offset,
-        'previous': None,
-        'next': None
-        }
-    
-    previous_offset = None
-    next_offset = None
-    if offset > 0: 
-        previous_offset = offset - limit
-        previous_offset = 0 if offset < 0 or previous_offset < limit else previous_offset
-    if count > limit:
-        next_offset = offset + limit
-        next_offset = None if next_offset > count - 1 else next_offset
-    previous = None
-    if offset == 0 or offset > count:
-        previous = None
+
+def _get_nft_types_paginated(category, limit=10, offset=0, request_url='', cursor=None, before=None):
+    # one more type than asked for tells whether there is a page beyond this one
+    nft_types = _get_nft_types(category, limit + 1, offset, cursor=cursor, before=before)
+    if before is not None:
+        has_previous = len(nft_types) > limit
+        nft_types = nft_types[len(nft_types) - limit:] if has_previous else nft_types
+        has_next = True
     else:
-        previous  = f'{url}?paginated=true&limit={limit}' if previous_offset == 0 or previous_offset == None else f'{url}?paginated=true&limit={limit}&offset={previous_offset}'
-    _next = f'{url}?paginated=true&limit={limit}&offset={next_offset}' if next_offset else None
-    return {
-        'count': count,
-        'limit': limit,
-        'offset': offset,
-        'previous': previous,
-        'next': _next
-    }
+        has_previous = cursor is not None or offset > 0
+        has_next = len(nft_types) > limit
+        nft_types = nft_types[:limit]
 
+    count = NFT_TYPES_COUNT.scalar([category, timezone.now()])
 
-def _get_nft_types_paginated(category, limit=10, offset=0, request_url=''):
-    query = """
-        SELECT
-            id, 
-            category,
-            authbase, 
-            identity_history, 
-            nft_category,
-            commitment,
-            nft,
-            results_count
-        FROM (
-            SELECT 
-            id, 
-            category,
-            authbase, 
-            identity_history, 
-            nft_category,
-            commitment,
-            nft,
-            COUNT(*) OVER() as results_count
-            FROM (
-                SELECT DISTINCT ON(commitment)
-                    id, 
-                    category,
-                    authbase, 
-                    identity_history, 
-                    nft_category,
-                    commitment,
-                    nft
-                FROM (
-                    SELECT
-                        id,
-                        authbase,
-                        identity_history,
-                        commitment,
-                        jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                        jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                        jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-                    FROM
-                        bcmr_main_registry,
-                        jsonb_object_keys(
-                            CASE 
-                                WHEN jsonb_typeof(contents->'identities') = 'object' 
-                                THEN contents->'identities' 
-                                ELSE '{}'::jsonb 
-                            END
-                        ) AS authbase,
-                        LATERAL jsonb_object_keys(
-                            CASE 
-                                WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                                THEN contents->'identities'->authbase 
-                                ELSE '{}'::jsonb 
-                            END
-                        ) AS identity_history,                    
-                        LATERAL jsonb_object_keys(
-                            CASE 
-                                WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                                THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                                ELSE '{}'::jsonb 
-                            END
-                        ) AS commitment                
-                    WHERE identity_history <= '%s'
-                    ORDER BY identity_history DESC
-                ) AS subquery
-                
-                WHERE category = '"%s"'
-                ORDER BY commitment DESC   
-            )AS unique_commitments
-            LIMIT %s OFFSET %s
-        ) AS result;
-
-        """ % (datetime.datetime.utcnow().isoformat(), category, limit, offset)
-    r = Registry.objects.raw(query)
     paginated = {
+        'count': count,
         'limit': limit,
         'offset': offset,
         'previous': None,
         'next': None,
-        'results': []
+        'results': nft_types
     }
-    
-    if r and r[0]:
-        paginated['count'] = r[0].results_count
-        paginated = { **paginated, **_paginator(paginated['count'], limit, offset, request_url)}
-        
-    
-    for item in r:
-        nft_type = item.nft
-        commitment = item.commitment.replace('"','')
-        if nft_type and type(nft_type) == str:
-            nft_type = json.loads(nft_type)
-        paginated['results'].append({
-            commitment: nft_type,
-            '_meta': {
-                'registry_id': item.id,
-                'commitment': commitment,
-                'category': item.category.replace('"',''),
-                'authbase': item.authbase.replace('"',''),
-                'identity_history': item.identity_history.replace('"','')
-            }
-        })
+    if nft_types:
+        # the pages on either side start from the type keys at the ends of this one,
+        # the same cost as the first page
+        url = f'{request_url}?paginated=true&limit={limit}'
+        if has_previous:
+            paginated['previous'] = f"{url}&before={quote(nft_types[0]['_meta']['commitment'], safe='')}"
+        if has_next:
+            paginated['next'] = f"{url}&cursor={quote(nft_types[-1]['_meta']['commitment'], safe='')}"
     return paginated
 
-def _get_nft_types(category, limit=10, offset=0):
+def _get_nft_types(category, limit=10, offset=0, cursor=None, before=None):
     """
-    Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection
+    Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection,
+    by descending type key, starting after the cursor type key or ending before
+    the `before` type key if either is given
     """
-    # TODO: handle if registry does not contain NftCategory or NftType(s)
-    query = """
-        SELECT DISTINCT ON(commitment)
-            id, 
-            category,
-            authbase, 
-            identity_history, 
-            nft_category,
-            commitment,
-            nft
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                commitment,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts') AS nft_category,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history,                    
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                        THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS commitment                
-            WHERE identity_history <= '%s'
-            ORDER BY identity_history DESC
-        ) AS subquery
-        
-        WHERE category = '"%s"'
-        ORDER BY commitment DESC 
-        LIMIT %s OFFSET %s;
-    """ % (datetime.datetime.utcnow().isoformat(), category, limit, offset)
-
-    r = Registry.objects.raw(query)
+    if cursor is not None:
+        r = NFT_TYPES_AFTER.raw(Registry, [category, timezone.now(), cursor, limit])
+    elif before is not None:
+        r = NFT_TYPES_BEFORE.raw(Registry, [category, timezone.now(), before, limit])
+    else:
+        r = NFT_TYPES.raw(Registry, [category, timezone.now(), limit, offset])
     nft_types = []
     for item in r:
         nft_type = item.nft
@@ -644,119 +302,50 @@ def _get_nft_types(category, limit=10, offset=0):
         })
     return nft_types
 
-def get_nft_types(category, limit=10, offset=0, paginated=False, request_url=''):
+def get_nft_types(category, limit=10, offset=0, paginated=False, request_url='', cursor=None, before=None):
     if paginated:
-        return _get_nft_types_paginated(category, limit, offset, request_url)
-    return _get_nft_types(category, limit, offset)
+        return _get_nft_types_paginated(category, limit, offset, request_url, cursor=cursor, before=before)
+    return _get_nft_types(category, limit, offset, cursor=cursor, before=before)
 
     
 
+def _nft_type(item, commitment):
+    nft_type = item.nft
+    if nft_type and type(nft_type) == str:
+        nft_type = json.loads(nft_type)
+    return {
+        commitment: nft_type,
+        '_meta': {
+            'registry_id': item.id,
+            'commitment': commitment,
+            'category': item.category.replace('"',''),
+            'authbase': item.authbase.replace('"',''),
+            'identity_history': item.identity_history.replace('"','')
+        }
+    }
+
 def get_nft_type(category, commitment):
     """
     Returns the NftType(s) of the SequentialNftCollection or ParsableNftCollection
     """
-    # TODO: handle if registry does not contain NftCategory or NftType(s)
-    query = """
-        SELECT
-            id, 
-            category,
-            authbase, 
-            identity_history, 
-            commitment,
-            nft
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                commitment,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'nfts','parse','types', commitment) AS nft,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history,                    
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types') = 'object' 
-                        THEN contents->'identities'->authbase->identity_history->'token'->'nfts'->'parse'->'types'
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS commitment                
-            WHERE commitment = '%s'
-            ORDER BY identity_history DESC     
-        ) AS subquery
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC
-        LIMIT 1;
-    """ % (commitment, category, datetime.datetime.utcnow().isoformat())
-
-    r = Registry.objects.raw(query)
+    r = NFT_TYPE.raw(Registry, [category, timezone.now(), commitment])
     if r:
-        item = r[0]
-        nft_type = item.nft
-        commitment = item.commitment.replace('"','')
-        if nft_type and type(nft_type) == str:
-            nft_type = json.loads(nft_type)
-        return {
-            commitment: nft_type,
-            '_meta': {
-                'registry_id': item.id,
-                'commitment': commitment,
-                'category': item.category.replace('"',''),
-                'authbase': item.authbase.replace('"',''),
-                'identity_history': item.identity_history.replace('"','')
-            }
-        }
+        return _nft_type(r[0], commitment)
+
+def get_nft_type_many(pairs):
+    """
+    get_nft_type() of many (category, commitment) pairs in one query,
+    as a dict of (category, commitment) -> NftType of the pairs that have one
+    """
+    pairs = list({(category, commitment) for category, commitment in pairs if commitment is not None})
+    if not pairs:
+        return {}
+    categories, commitments = zip(*pairs)
+    r = NFT_TYPE_MANY.raw(Registry, [list(categories), list(commitments), timezone.now()])
+    return {(item.category, item.commitment): _nft_type(item, item.commitment) for item in r}
 
 def find_registry_id(category):
-    query = """
-        SELECT 
-            id, 
-            authbase, 
-            identity_history, 
-            category
-        FROM (
-            SELECT
-                id,
-                authbase,
-                identity_history,
-                jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-            FROM
-                bcmr_main_registry,
-                jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities') = 'object' 
-                        THEN contents->'identities' 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS authbase,
-                LATERAL jsonb_object_keys(
-                    CASE 
-                        WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                        THEN contents->'identities'->authbase 
-                        ELSE '{}'::jsonb 
-                    END
-                ) AS identity_history              
-        ) AS subquery
-        WHERE category = '"%s"' and identity_history <= '%s'
-        ORDER BY id DESC 
-        LIMIT 1;
-    """ % (category, datetime.datetime.utcnow().isoformat())
-
-    r = Registry.objects.raw(query)
+    r = FIND_REGISTRY_ID.raw(Registry, [category, timezone.now()])
     if r:
         return {
             'registry_id': r[0].id,
@@ -770,70 +359,8 @@ def find_registry_id(category):
 
 def find_registry(category, include_identities=False):
 
-    select_identities = "identities," if include_identities else ''
-
-    extract_identities = """
-    jsonb_extract_path(contents, 'identities') AS identities, 
-    """ if include_identities else ''
-
-    query = """
-    SELECT 
-        id, 
-        identity_history,
-        authbase,
-        schema,
-        version,
-        latest_revision,
-        registry_identity,
-        tags,
-        default_chain,
-        chains,
-        license,
-        locales,
-        extensions,
-        %s
-        category
-    FROM (
-        SELECT
-            id,
-            jsonb_extract_path(contents, '$schema') AS schema,
-            jsonb_extract_path(contents, 'version') AS version,
-            jsonb_extract_path(contents, 'latestRevision') AS latest_revision,
-            jsonb_extract_path(contents, 'registryIdentity') AS registry_identity,
-            jsonb_extract_path(contents, 'tags') AS tags,
-            jsonb_extract_path(contents, 'defaultChain') AS default_chain,
-            jsonb_extract_path(contents, 'chains') AS chains,
-            jsonb_extract_path(contents, 'license') AS license,
-            jsonb_extract_path(contents, 'locales') AS locales,
-            jsonb_extract_path(contents, 'extensions') AS extensions,
-            %s
-            authbase,
-            identity_history,
-            jsonb_extract_path(contents, 'identities', authbase, identity_history, 'token', 'category') AS category
-        FROM
-            bcmr_main_registry,
-            jsonb_object_keys(
-                CASE 
-                    WHEN jsonb_typeof(contents->'identities') = 'object' 
-                    THEN contents->'identities' 
-                    ELSE '{}'::jsonb 
-                END
-            ) AS authbase,
-            LATERAL jsonb_object_keys(
-                CASE 
-                    WHEN jsonb_typeof(contents->'identities'->authbase) = 'object' 
-                    THEN contents->'identities'->authbase 
-                    ELSE '{}'::jsonb 
-                END
-            ) AS identity_history              
-    ) AS subquery
-
-    WHERE category = '"%s"' and identity_history <= '%s'
-    ORDER BY id DESC 
-    LIMIT 1;
-    """ % (select_identities, extract_identities, category, datetime.datetime.utcnow().isoformat())
-
-    registry = Registry.objects.raw(query)
+    statement = FIND_REGISTRY_WITH_IDENTITIES if include_identities else FIND_REGISTRY
+    registry = statement.raw(Registry, [category, timezone.now()])
     if registry:
         bcmr = {key: value for key,value in registry[0].__dict__.items() if key in ['schema', 'version', 'latest_revision', 'registry_identity','tags','default_chain', 'chains', 'license', 'locales', 'extensions', 'identities']}
         bcmr = {key: json.loads(value) for key, value in bcmr.items() if value}
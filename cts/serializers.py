@@ -1,13 +1,26 @@
 from rest_framework import serializers
 from cts.models import *
 
+
+def include_metadata(request):
+    return bool(request and request.query_params and (request.query_params.get('include_metadata') or '').lower() == 'true')
+
+
+class CashTokenListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if include_metadata(self.context.get('request')):
+            # the metadata of the whole page at once instead of per token
+            data = CashToken.prefetch_metadata(data)
+        return super().to_representation(data)
+
+
 class CashTokenSerializer(serializers.ModelSerializer):
         
     metadata = serializers.SerializerMethodField()
 
     def get_metadata(self, instance):
-        request = self.context.get('request')
-        if request and request.query_params and (request.query_params.get('include_metadata') or '').lower() == 'true':
+        if include_metadata(self.context.get('request')):
             metadata = {}
             if instance.capability:
               metadata['nft'] = instance.nft_type    
@@ -18,6 +31,7 @@ class CashTokenSerializer(serializers.ModelSerializer):
         
     class Meta:
         model = CashToken
+        list_serializer_class = CashTokenListSerializer
         fields = (
             'category',
             'commitment',
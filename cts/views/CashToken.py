@@ -6,10 +6,15 @@ from django.http import JsonResponse
 from bcmr_main.models import Token
 from cts.models import CashToken as CashTokenModel
 from cts.serializers import CashTokenSerializer
+from cts.pagination import CashTokenCursorPagination, estimate_count
 
 class CashToken(APIView):
     """
-    Returns the unique minted tokens
+    Returns the unique minted tokens, newest first, in numbered pages with an exact count.
+
+    Given a cursor parameter (empty for the first page) the pages are walked with the cursor
+    in the next and previous links instead, which costs the same on every page. These have
+    no count unless count=estimate (the planner's estimate) or count=exact is given.
     """
     serializer_class = CashTokenSerializer
 
@@ -41,6 +46,29 @@ class CashToken(APIView):
                 tokens = tokens.filter(commitment=commitment)
             if capability:
                 tokens = tokens.filter(capability=capability)
+        if 'cursor' not in request.query_params:
+            return self.get_numbered_page(request, tokens, capability)
+
+        paginator = CashTokenCursorPagination()
+        page = paginator.paginate_queryset(tokens, request)
+        serializer = CashTokenSerializer(page, many=True, context={'request': request})
+
+        count = None
+        estimated = request.query_params.get('count') == 'estimate'
+        if estimated:
+            count = estimate_count(tokens)
+        elif request.query_params.get('count') == 'exact':
+            count = tokens.count()
+        return JsonResponse({
+            'count': count,
+            'estimated_count': estimated,
+            'next': paginator.get_next_link(),
+            'previous': paginator.get_previous_link(),
+            'results': serializer.data,
+            'capability': capability
+        })
+
+    def get_numbered_page(self, request, tokens, capability):
         tokens = tokens.order_by('-id', 'commitment', 'capability').distinct('id', 'commitment', 'capability')
         paginator = PageNumberPagination()
         paginator.page_size = 10    
@@ -56,5 +84,3 @@ class CashToken(APIView):
             'results': serializer.data,
             'capability': capability
         })
-    
-
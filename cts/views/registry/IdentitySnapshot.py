@@ -1,31 +1,64 @@
-import redis
-import json
-from decouple import config
 from rest_framework.views import APIView
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from bcmr_main.cache import ResponseCache, claim_refresh, get_body, get_cache_key, get_cache_ttl, set_body, set_json
+from bcmr_main.compression import compress_variants, get_cached_response, negotiate
+from bcmr_main.materialize import get_response_document, get_response_variants
+from bcmr_main.bloom import REGISTRY_CATEGORIES, is_known_missing, remember_missing
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 from cts.tasks import update_identity_snapshot_cache
 from ...registrycontenthelpers import get_identity_snapshot, get_identity_snapshot_basic
+import json
 
 class IdentitySnapshot(APIView):
     allowed_methods = ['GET']
 
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
 
         category = kwargs.get('category', '')
         include_token_nfts = True if request.query_params.get('include_token_nfts', '').lower() == 'true' else False
-        client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-        cache_key = f'identitysnapshot:{category}'
-        identity_snapshot = client.get(cache_key)
+        if is_known_missing(REGISTRY_CATEGORIES, category):
+            return JsonResponse(None, safe=False)
+        cache_key = get_cache_key('identitysnapshot', category)
+        body = None if include_token_nfts else get_body(cache_key)
 
-        if identity_snapshot and not include_token_nfts:
-            identity_snapshot = json.loads(identity_snapshot)
-            # Update cache every time it's touched
+        if body:
+            # Refresh stale cache in the background, once per CACHE_REFRESH_INTERVAL
             # Only cache basic IdentitySnapshot (without nfts)
-            update_identity_snapshot_cache.delay(category)
-            return JsonResponse(identity_snapshot, safe=False)
+            if claim_refresh(cache_key):
+                update_identity_snapshot_cache.delay(category)
+            return HttpResponse(body, content_type='application/json')
         if include_token_nfts:
-            identity_snapshot = get_identity_snapshot(category)
+            return self.get_with_token_nfts(request, category)
         else:
+            # hashed like the cached body, which is refreshed without its document
+            body, _ = get_response_document('identity-snapshot', category)
+            if body is not None:
+                set_body(cache_key, body, ex=get_cache_ttl(category), stale_after=settings.CACHE_REFRESH_INTERVAL)
+                return HttpResponse(body, content_type='application/json')
             identity_snapshot = get_identity_snapshot_basic(category)
-            client.set(f'{category}_identity-snapshot',json.dumps(identity_snapshot), ex=(60 * 30))
+            if identity_snapshot:
+                set_json(cache_key, identity_snapshot, ex=get_cache_ttl(category), stale_after=settings.CACHE_REFRESH_INTERVAL)
+        if identity_snapshot is None:
+            remember_missing(REGISTRY_CATEGORIES, category)
         return JsonResponse(identity_snapshot, safe=False)
+
+    def get_with_token_nfts(self, request, category):
+        # served in the compressed variant the client accepts, see bcmr_main.compression
+        cached = ResponseCache('identitysnapshot:nfts', category)
+        response = get_cached_response(request, cached)
+        if response is not None:
+            return response
+
+        body, variants, etag = get_response_variants('identity-snapshot-nfts', category)
+        if body is None:
+            identity_snapshot = get_identity_snapshot(category)
+            if identity_snapshot is None:
+                remember_missing(REGISTRY_CATEGORIES, category)
+                return JsonResponse(None, safe=False)
+            body = json.dumps(identity_snapshot).encode()
+            variants = compress_variants(body)
+        cached.set(body, ex=get_cache_ttl(category), variants=variants, etag=etag)
+        return negotiate(request, body, variants, etag=etag)
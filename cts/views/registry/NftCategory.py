@@ -1,5 +1,8 @@
 from rest_framework.views import APIView
 from django.http import JsonResponse
+from bcmr_main.bloom import REGISTRY_CATEGORIES, is_known_missing
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 from ...registrycontenthelpers import get_nfts
 
 class NftCategory(APIView):
@@ -7,6 +10,9 @@ class NftCategory(APIView):
     """
     Returns the nfts (NftCategory) without the parse.types data.
     """
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         category = kwargs.get('category', '')
+        if is_known_missing(REGISTRY_CATEGORIES, category):
+            return JsonResponse(None, safe=False)
         return JsonResponse(get_nfts(category), safe=False)
@@ -1,5 +1,8 @@
 from rest_framework.views import APIView
 from django.http import JsonResponse
+from bcmr_main.bloom import REGISTRY_CATEGORIES, is_known_missing
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 from ...registrycontenthelpers import get_nft_type, get_nft_types
 
 class NftType(APIView):
@@ -7,17 +10,27 @@ class NftType(APIView):
     """
     Returns the NftType(s) of a particular NftCategory
     """
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         category = kwargs.get('category', '')
         commitment = kwargs.get('commitment', '')
         limit = request.query_params.get('limit')
         offset = request.query_params.get('offset')
+        # type keys to continue after or to end before, see the links of a paginated response
+        cursor = request.query_params.get('cursor')
+        before = request.query_params.get('before')
+        if (cursor is not None or before is not None) and offset is not None:
+            return JsonResponse({'error': 'offset cannot be combined with cursor or before'}, status=400)
+        if cursor is not None and before is not None:
+            return JsonResponse({'error': 'cursor cannot be combined with before'}, status=400)
         paginated = request.query_params.get('paginated')
         if (paginated or '').lower() == 'true':
             paginated = True
         else:
             paginated = False
         if commitment:
+            if is_known_missing(REGISTRY_CATEGORIES, category):
+                return JsonResponse(None, safe=False)
             return JsonResponse(get_nft_type(category, commitment), safe=False)
         else:
-            return JsonResponse(get_nft_types(category, int(limit or 10), int(offset or 0), paginated, request.get_raw_uri().split('?')[0]), safe=False)
+            return JsonResponse(get_nft_types(category, int(limit or 10), int(offset or 0), paginated, request.get_raw_uri().split('?')[0], cursor=cursor, before=before), safe=False)
@@ -3,10 +3,13 @@ from rest_framework import status
 from rest_framework.response import Response
 from django.http import JsonResponse
 from bcmr_main.models import Registry
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 
 class ParseBytecode(APIView):
     allowed_methods = ['GET']
 
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         category = kwargs.get('category', '')
         registry = Registry.find_registry_id(category)
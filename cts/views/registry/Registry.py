@@ -1,11 +1,14 @@
 from rest_framework.views import APIView
 from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 from ...registrycontenthelpers import find_registry
 
 class Registry(APIView):
     
     allowed_methods = ['GET']
 
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         
         category = kwargs.get('category', '')
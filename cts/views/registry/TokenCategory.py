@@ -1,21 +1,36 @@
-import redis
-import json
 from rest_framework.views import APIView
-from decouple import config
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from bcmr_main.models import Registry
+from django.conf import settings
+from bcmr_main.cache import claim_refresh, get_body, get_cache_key, get_cache_ttl, set_body, set_json
+from bcmr_main.materialize import get_response_document
+from bcmr_main.bloom import REGISTRY_CATEGORIES, is_known_missing, remember_missing
+from django.utils.decorators import method_decorator
+from bcmr_main.etags import conditional
 from ...registrycontenthelpers import get_token_category_basic
 from ...tasks import update_tokencategorymetadata_cache
 
 class TokenCategory(APIView):
     allowed_methods = ['GET']
+    @method_decorator(conditional)
     def get(self, request, *args, **kwargs):
         category = kwargs.get('category', '')
-        client = redis.Redis(host=config('REDIS_HOST', 'redis'), port=config('REDIS_PORT', 6379))
-        cache_key = f'tokencategorymetadata:{category}'
-        token_metadata = client.get(cache_key)
+        if is_known_missing(REGISTRY_CATEGORIES, category):
+            return JsonResponse({})
+        cache_key = get_cache_key('tokencategorymetadata', category)
+        body = get_body(cache_key)
+        if body:
+            if claim_refresh(cache_key):
+                update_tokencategorymetadata_cache.delay(category)
+            return HttpResponse(body, content_type='application/json')
+        # hashed like the cached body, which is refreshed without its document
+        body, _ = get_response_document('token-category', category)
+        if body is not None:
+            set_body(cache_key, body, ex=get_cache_ttl(category), stale_after=settings.CACHE_REFRESH_INTERVAL)
+            return HttpResponse(body, content_type='application/json')
+        token_metadata = get_token_category_basic(category)
         if token_metadata:
-            token_metadata = json.loads(token_metadata)
-            update_tokencategorymetadata_cache.delay(category)
-            return JsonResponse(token_metadata, safe=False)
-        return JsonResponse(get_token_category_basic(category) | {})
+            set_json(cache_key, token_metadata, ex=get_cache_ttl(category), stale_after=settings.CACHE_REFRESH_INTERVAL)
+        else:
+            remember_missing(REGISTRY_CATEGORIES, category)
+        return JsonResponse(token_metadata or {})